@@ -16,6 +16,7 @@ import os
 from flask_marshmallow import Marshmallow
 
 from app.elastic_index import ElasticIndex
+from app.index_sync_service import IndexSyncService
 from app.email_service import EmailService
 from app.email_prompt_service import EmailPromptService
 from app.rest_exception import RestException
@@ -94,6 +95,9 @@ password_requirements = {
 # Search System
 elastic_index = ElasticIndex(app)
 
+# Keeps the search index up to date as records change
+index_sync = IndexSyncService(app, db, elastic_index)
+
 #
 # Constructing for a problem when building urls when the id is null.
 # there is a fix in the works for this, see
@@ -167,6 +171,16 @@ def initindex():
     data_loader.build_index()
 
 
+@app.cli.command()
+def reindex():
+    """Rebuild the elastic search index in the background, and swap it in when it is complete."""
+    click.echo('Rebuilding the Elastic Search index')
+    from app import data_loader
+    data_loader = data_loader.DataLoader()
+    if not data_loader.rebuild_index():
+        click.echo('The new index was incomplete, the existing index is still in use.')
+
+
 @app.cli.command()
 def clearindex():
     """Delete all information from the elasticsearch index"""
@@ -247,16 +261,24 @@ def run_full_export():
 
 from app import views
 from app.model.email_log import EmailLog
+from app.model.index_outbox import IndexOutbox
 from app.model.study import Study
 from app.model.user import User
+from app.export_service import ExportService
+from app.model.flows import Flows
+
+# Now that every model is loaded, look up their schemas, and the questionnaires in each flow, once rather than
+# on each request.
+ExportService.registry()
+Flows.compile()
 
 
 def schedule_tasks():
-    from app.export_service import ExportService
     from app.import_service import ImportService
 
     scheduler = BackgroundScheduler(daemon=True)
     scheduler.start()
+    index_sync.start()
     if app.config["MIRRORING"]:
         import_service = ImportService(app, db)
         scheduler.add_job(import_service.run_backup, 'interval',
@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+
+from sqlalchemy import event
+
+
+class TimedCache:
+    """A small, thread safe, in-process cache.  Entries expire ttl_seconds after they are stored, and once
+    the cache holds max_size entries the least recently used are dropped to make room.  Each process keeps
+    its own copy, so anything cached here should be safe to serve for up to ttl_seconds after it changes
+    elsewhere."""
+
+    def __init__(self, max_size=128, ttl_seconds=60):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def invalidate_on_commit(session, models, callback, changes=None):
+    """Calls callback once a transaction that changed any of the given models commits, and not at all if it
+    is rolled back, so that a request reloading a cache in the meantime can't keep the old records.
+
+    By default any instance of the models added, changed or deleted in a flush is a change.  changes, if
+    given, is called with the session after each flush instead, and returns True if everything may have
+    changed, or the keys of the entries that did.  callback is passed the keys changed during the
+    transaction, or None where that isn't known, as with a bulk update or delete of one of the models."""
+    key = object()
+
+    def note_changes(session, flush_context):
+        if changes is None:
+            changed = any(isinstance(obj, models) for obj in chain(session.new, session.dirty, session.deleted))
+        else:
+            changed = changes(session)
+        if not changed:
+            return
+        if changed is True:
+            session.info[key] = None
+        elif key not in session.info:
+            session.info[key] = set(changed)
+        elif session.info[key] is not None:
+            session.info[key].update(changed)
+
+    def note_bulk_changes(context):
+        if issubclass(context.mapper.class_, models):
+            context.session.info[key] = None
+
+    def notify(session):
+        if key in session.info:
+            callback(session.info.pop(key))
+
+    def discard_changes(session, previous_transaction):
+        session.info.pop(key, None)
+
+    event.listen(session, 'after_flush', note_changes)
+    event.listen(session, 'after_bulk_delete', note_bulk_changes)
+    event.listen(session, 'after_bulk_update', note_bulk_changes)
+    event.listen(session, 'after_commit', notify)
+    event.listen(session, 'after_soft_rollback', discard_changes)
@@ -0,0 +1,63 @@
+from collections import namedtuple
+
+from sqlalchemy import func
+
+from app import app, db
+from app.cache import TimedCache, invalidate_on_commit
+from app.model.resource import Resource
+from app.model.resource_category import ResourceCategory
+from app.model.study import Study
+from app.model.study_category import StudyCategory
+
+CategoryCount = namedtuple('CategoryCount', ['event', 'location', 'resource', 'all_resource', 'study'])
+NO_COUNTS = CategoryCount(0, 0, 0, 0, 0)
+
+
+class CategoryCounts:
+    """The number of resources, events, locations and studies attached to every category, calculated with
+    two grouped queries rather than a handful of counts for each category in the taxonomy.  Cached until a
+    transaction that changes those records commits, or for ttl_seconds where the change was made by
+    another process."""
+
+    COUNTED_MODELS = (Resource, ResourceCategory, Study, StudyCategory)
+
+    def __init__(self, ttl_seconds):
+        self.cache = TimedCache(max_size=1, ttl_seconds=ttl_seconds)
+
+    def invalidate(self):
+        self.cache.clear()
+
+    def get(self, category_id):
+        return self.all().get(category_id, NO_COUNTS)
+
+    def all(self):
+        counts = self.cache.get('counts')
+        if counts is None:
+            counts = self._count()
+            self.cache.set('counts', counts)
+        return counts
+
+    @staticmethod
+    def _count():
+        totals = {}
+        rows = db.session.query(ResourceCategory.category_id, ResourceCategory.type,
+                                func.count(ResourceCategory.id), func.count(Resource.id))\
+            .outerjoin(ResourceCategory.resource)\
+            .group_by(ResourceCategory.category_id, ResourceCategory.type)
+        for category_id, type, count, resource_count in rows:
+            counts = totals.setdefault(category_id, dict(NO_COUNTS._asdict()))
+            if type in ('event', 'location', 'resource'):
+                counts[type] += count
+            counts['all_resource'] += resource_count
+
+        rows = db.session.query(StudyCategory.category_id, func.count(StudyCategory.id))\
+            .join(StudyCategory.study)\
+            .group_by(StudyCategory.category_id)
+        for category_id, count in rows:
+            totals.setdefault(category_id, dict(NO_COUNTS._asdict()))['study'] = count
+
+        return {category_id: CategoryCount(**counts) for category_id, counts in totals.items()}
+
+
+category_counts = CategoryCounts(ttl_seconds=app.config['CATEGORY_COUNTS_TTL_SECONDS'])
+invalidate_on_commit(db.session, CategoryCounts.COUNTED_MODELS, lambda changed: category_counts.invalidate())
@@ -0,0 +1,58 @@
+import threading
+import time
+from collections import namedtuple
+
+from app import app, db
+from app.cache import invalidate_on_commit
+from app.model.category import Category
+
+CategoryNode = namedtuple('CategoryNode', ['id', 'name', 'parent_id', 'display_order', 'path'])
+
+
+class CategoryTree:
+    """A process wide, read only copy of the taxonomy, so that searches can build their category facets
+    without going to the database.  Any change to a category committed by this process bumps the version
+    and the tree is reloaded on next use.  Changes made by other processes are picked up once the tree is
+    ttl_seconds old."""
+
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+        self._loaded_version = None
+        self._loaded_at = 0
+        self._roots = ()
+        self._by_id = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+
+    def roots(self):
+        """Top level categories, ordered as they appear in the search facets."""
+        self._refresh_if_stale()
+        return self._roots
+
+    def get(self, category_id):
+        self._refresh_if_stale()
+        return self._by_id.get(category_id)
+
+    def _refresh_if_stale(self):
+        with self._lock:
+            version = self.version
+            if version == self._loaded_version and time.monotonic() - self._loaded_at < self.ttl_seconds:
+                return
+        rows = db.session.query(Category.id, Category.name, Category.parent_id,
+                                Category.display_order, Category.path).all()
+        nodes = [CategoryNode(*row) for row in rows]
+        roots = sorted((n for n in nodes if n.parent_id is None), key=lambda n: n.name or '', reverse=True)
+        roots.sort(key=lambda n: (n.display_order is None, n.display_order or 0))
+        with self._lock:
+            self._by_id = {n.id: n for n in nodes}
+            self._roots = tuple(roots)
+            self._loaded_version = version
+            self._loaded_at = time.monotonic()
+
+
+category_tree = CategoryTree(ttl_seconds=app.config['CATEGORY_TREE_TTL_SECONDS'])
+invalidate_on_commit(db.session, (Category,), lambda changed: category_tree.invalidate())
@@ -2,6 +2,7 @@ import os
 import csv
 import googlemaps
 from sqlalchemy import Sequence
+from sqlalchemy.orm import selectinload, lazyload
 
 from app import app, db, elastic_index
 from app.model.admin_note import AdminNote
@@ -332,13 +333,43 @@ class DataLoader:
         return {'lat': lat, 'lng': lng}
 
     def build_index(self):
-        elastic_index.load_documents(
-            resources=db.session.query(Resource).filter(Resource.type == 'resource').all(),
-            events=db.session.query(Resource).filter(Resource.type == 'event').all(),
-            locations=db.session.query(Resource).filter(Resource.type == 'location').all(),
-            studies=db.session.query(Study).all()
+        return elastic_index.load_documents(category_paths=self._category_search_paths(),
+                                            **self._indexable_records())
+
+    def rebuild_index(self):
+        """Builds a fresh index alongside the current one, and swaps it in once it is complete."""
+        records = self._indexable_records()
+        expected_count = sum(query.count() for query in records.values())
+        return elastic_index.reindex(expected_count=expected_count, category_paths=self._category_search_paths(),
+                                     **records)
+
+    def _indexable_records(self):
+        """Queries for everything that belongs in the search index.  Each type is queried through
+        its own class so subclass columns arrive in the same row, categories (and their names) are
+        fetched in one extra query per batch rather than one per record, and rows are streamed in
+        batches rather than loaded all at once."""
+        batch_size = app.config['ELASTIC_SEARCH_BULK_CHUNK_SIZE']
+        return dict(
+            resources=self._index_query(Resource, ResourceCategory, batch_size).filter(Resource.type == 'resource'),
+            events=self._index_query(Event, ResourceCategory, batch_size),
+            locations=self._index_query(Location, ResourceCategory, batch_size).filter(Resource.type == 'location'),
+            studies=self._index_query(Study, StudyCategory, batch_size)
         )
 
+    @staticmethod
+    def _index_query(model, category_model, batch_size):
+        return db.session.query(model)\
+            .options(selectinload(model.categories)
+                     .joinedload(category_model.category)
+                     .lazyload(Category.children))\
+            .order_by(model.id)\
+            .yield_per(batch_size)
+
+    @staticmethod
+    def _category_search_paths():
+        return Category.all_search_paths_by_id(
+            db.session.query(Category).options(lazyload(Category.children)).all())
+
     def clear_index(self):
         print("Clearing the index")
         elastic_index.clear()
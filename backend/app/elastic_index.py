@@ -1,13 +1,17 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from itertools import chain
 from dateutil import tz
 
+from app.cache import TimedCache
 from app.model.role import Permission
 from elasticsearch import RequestError
+from elasticsearch.helpers import bulk
 from elasticsearch_dsl import Date, Keyword, Text, Index, analyzer, Integer, tokenizer, Document, Double, GeoPoint, \
     Search, A, Q, Boolean, analysis
 from elasticsearch_dsl.connections import connections
 from elasticsearch_dsl.query import MultiMatch, MatchAll, MoreLikeThis
-from flask import g
 import logging
 
 autocomplete = analyzer('autocomplete',
@@ -52,6 +56,11 @@ class StarDocument(Document):
     is_draft = Boolean()
 
 
+def _geohash_precision(zoom):
+    """A geohash precision whose cells are a small fraction of the map visible at the given zoom level."""
+    return min(12, max(1, zoom // 2 + 1))
+
+
 def _start_of_day(date=datetime.utcnow().date()):
     return datetime(date.year, date.month, date.day, tzinfo=tz.tzutc())
 
@@ -60,16 +69,31 @@ class ElasticIndex:
 
     logger = logging.getLogger("ElasticIndex")
 
+    # The only fields needed to place a result on a map.
+    MAP_FIELDS = ['id', 'type', 'latitude', 'longitude', 'no_address']
+    MAP_CLUSTER_LIMIT = 1000
+
     def __init__(self, app):
         self.logger.debug("Initializing Elastic Index")
         self.establish_connection(app.config['ELASTIC_SEARCH'])
         self.index_prefix = app.config['ELASTIC_SEARCH']["index_prefix"]
-
+        self.bulk_chunk_size = app.config['ELASTIC_SEARCH_BULK_CHUNK_SIZE']
+        self.bulk_thread_count = app.config['ELASTIC_SEARCH_BULK_THREAD_COUNT']
+        # Cleared whenever this process changes the index.
+        self.search_cache = TimedCache(max_size=app.config['SEARCH_CACHE_MAX_SIZE'],
+                                       ttl_seconds=app.config['SEARCH_CACHE_TTL_SECONDS'])
+        # Related results for each document.  Any change can alter the results for other documents, so like
+        # searches these are cleared whenever this process changes the index.
+        self.related_cache = TimedCache(max_size=app.config['RELATED_RESULTS_CACHE_MAX_SIZE'],
+                                        ttl_seconds=app.config['RELATED_RESULTS_CACHE_TTL_SECONDS'])
+
+        # All reads and writes go through an alias, so that the index behind it can be rebuilt
+        # and swapped in without interrupting searches.  See reindex()
         self.index_name = '%s_resources' % self.index_prefix
         self.index = Index(self.index_name)
-        self.index.doc_type(StarDocument)
         try:
-            self.index.create()
+            if not self.connection.indices.exists(index=self.index_name):
+                self._create_versioned_index(with_alias=True, suffix='initial')
         except RequestError as requestError:
             if requestError.error == 'resource_already_exists_exception':
                 self.logger.info("The index already exists.")
@@ -101,16 +125,81 @@ class ElasticIndex:
                 use_ssl=settings["use_ssl"])
 
     def clear(self):
+        self.search_cache.clear()
+        self.related_cache.clear()
         try:
             self.logger.info("Clearing the index.")
-            self.index.delete(ignore=404)
-            self.index.create()
+            for name in self._concrete_indices():
+                self.connection.indices.delete(index=name, ignore=404)
+            self._create_versioned_index(with_alias=True, suffix='initial')
         except:
             self.logger.error("Failed to delete the indices. They might not exist.")
 
+    def _create_versioned_index(self, with_alias=False, suffix=None):
+        """Creates a new, empty index for StarDocuments, optionally pointing the read/write alias
+        at it.  The index is timestamped unless a fixed suffix is given, which lets concurrent
+        workers race to create the first index safely.  Returns the name of the new index."""
+        suffix = suffix or datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
+        name = '%s_%s' % (self.index_name, suffix)
+        index = Index(name)
+        index.doc_type(StarDocument)
+        if with_alias:
+            index.aliases(**{self.index_name: {}})
+        index.create()
+        return name
+
+    def _concrete_indices(self):
+        """Names of every index owned by this alias: the timestamped indices, and any old style
+        index created under the alias name itself, before aliases were used."""
+        names = set(self.connection.indices.get(index=self.index_name + '_*').keys())
+        if self.connection.indices.exists(index=self.index_name) and \
+                not self.connection.indices.exists_alias(name=self.index_name):
+            names.add(self.index_name)
+        return names
+
+    def reindex(self, resources, events, locations, studies, expected_count, category_paths=None):
+        """Rebuilds the search index without interrupting searches.  Documents are loaded into a new
+        timestamped index while the alias continues to serve the old one.  Once the new index holds
+        the expected number of documents, the alias is atomically swapped over to it and the old
+        indices are deleted.  If the counts don't match the new index is thrown away, the alias is
+        left untouched, and False is returned.
+
+        Edits made through the api while the rebuild is running are written to the old index, so
+        they will only appear in the new index if they were committed before its records were read."""
+        new_index = self._create_versioned_index()
+        self.logger.info("Building index %s for alias %s" % (new_index, self.index_name))
+        self.load_documents(resources, events, locations, studies, index_name=new_index,
+                            category_paths=category_paths)
+
+        actual_count = self.connection.count(index=new_index)['count']
+        if actual_count != expected_count:
+            self.logger.error("Index %s has %i documents, but %i were expected. Keeping the current index." %
+                              (new_index, actual_count, expected_count))
+            self.connection.indices.delete(index=new_index, ignore=404)
+            return False
+
+        old_indices = self._concrete_indices() - {new_index}
+        actions = [{"add": {"index": new_index, "alias": self.index_name}}]
+        for name in old_indices:
+            if name == self.index_name:
+                # An old style index holds the name we need for the alias, it must go in the same step.
+                actions.append({"remove_index": {"index": name}})
+            else:
+                actions.append({"remove": {"index": name, "alias": self.index_name}})
+        self.connection.indices.update_aliases(body={"actions": actions})
+        self.search_cache.clear()
+        self.related_cache.clear()
+        self.logger.info("Alias %s now points to %s" % (self.index_name, new_index))
+
+        for name in old_indices - {self.index_name}:
+            self.connection.indices.delete(index=name, ignore=404)
+        return True
+
     def remove_document(self, document, flush=True):
         obj = self.get_document(document)
         obj.delete()
+        self.search_cache.clear()
+        self.related_cache.clear()
         if flush:
             self.index.flush()
 
@@ -127,6 +216,18 @@ class ElasticIndex:
         self.add_document(document, flush, latitude, longitude)
 
     def add_document(self, document, flush=True, latitude=None, longitude=None, post_event_description=None):
+        doc = self._build_document(document, latitude, longitude, post_event_description)
+        StarDocument.save(doc, index=self.index_name)
+        self.search_cache.clear()
+        self.related_cache.clear()
+        if flush:
+            self.index.flush()
+
+    def _build_document(self, document, latitude=None, longitude=None, post_event_description=None,
+                        category_paths=None):
+        """Converts an Event, Location, Resource or Study into a StarDocument, without saving it.
+        category_paths, if provided, is a dictionary of precalculated search paths by category id
+        (see Category.all_search_paths_by_id) used in place of walking each category's parents."""
         doc = StarDocument(id=document.id,
                            type=document.__tablename__,
                            label=document.__label__,
@@ -163,7 +264,10 @@ class ElasticIndex:
         doc.meta.id = self._get_id(document)
 
         for cat in document.categories:
-            doc.category.extend(cat.category.all_search_paths())
+            if category_paths is not None:
+                doc.category.extend(category_paths[cat.category_id])
+            else:
+                doc.category.extend(cat.category.all_search_paths())
 
         if document.__tablename__ == 'study':
             doc.title = document.short_title
@@ -175,44 +279,216 @@ class ElasticIndex:
             doc.geo_point = dict(lat=latitude, lon=longitude)
             doc.no_address = not document.street_address1
 
-        StarDocument.save(doc, index=self.index_name)
-        if flush:
-            self.index.flush()
+        return doc
+
+    def _bulk_actions(self, index_name, resources, events, locations, studies, category_paths=None):
+        """Lazily produces the bulk index actions for each record, so the full set of
+        documents is never held in memory at once."""
+        for document in chain(resources, events, locations, studies):
+            yield self._bulk_action(index_name, document, category_paths)
+
+    def _bulk_action(self, index_name, document, category_paths=None):
+        doc = self._build_document(document,
+                                   latitude=getattr(document, 'latitude', None),
+                                   longitude=getattr(document, 'longitude', None),
+                                   post_event_description=getattr(document, 'post_event_description', None),
+                                   category_paths=category_paths)
+        doc.meta.index = index_name
+        return doc.to_dict(include_meta=True)
+
+    def sync_documents(self, documents, removed_ids, refresh=False):
+        """Brings the index in line with the database in a single bulk request, adding or replacing each of
+        the given documents and deleting the documents with the given ids (see _get_id).  Rather than
+        flushing, this relies on the index's refresh interval unless refresh is True.  Returns the list of
+        errors for any documents that failed."""
+        actions = [self._bulk_action(self.index_name, d) for d in documents]
+        actions.extend({'_op_type': 'delete', '_index': self.index_name, '_type': StarDocument._doc_type.name,
+                        '_id': uid} for uid in removed_ids)
+        if not actions:
+            return []
+        success_count, errors = bulk(self.connection, actions, refresh=refresh,
+                                     raise_on_error=False, raise_on_exception=False)
+        self.search_cache.clear()
+        self.related_cache.clear()
+        # Deleting a document that was never indexed isn't a problem.
+        errors = [e for e in errors if e.get('delete', {}).get('status') != 404]
+        for error in errors:
+            self.logger.error("Failed to synchronize search document: %s" % str(error))
+        return errors
+
+    def load_documents(self, resources, events, locations, studies, chunk_size=None, thread_count=None,
+                       index_name=None, category_paths=None):
+        """Indexes the given records with the bulk api, sending documents in chunks across a
+        pool of threads and refreshing the index once at the end.  Returns a tuple of the
+        number of documents indexed and a list of errors for those that failed.  Documents
+        go to the current alias unless another index_name is given.
+
+        The records are read, and their documents built, on the calling thread, as they are
+        usually backed by the caller's database session.  Only the requests are sent from the
+        pool, with no more than thread_count chunks waiting at a time."""
+        index_name = index_name or self.index_name
+        chunk_size = chunk_size or self.bulk_chunk_size
+        thread_count = thread_count or self.bulk_thread_count
+        self.logger.info("Loading search records of events, locations, resources, and studies into "
+                         "Elasticsearch index: %s" % self.index_prefix)
+
+        success_count = 0
+        errors = []
+        actions = self._bulk_actions(index_name, resources, events, locations, studies, category_paths)
+        with ThreadPoolExecutor(max_workers=thread_count, thread_name_prefix="ElasticIndex") as executor:
+            pending = deque()
+            for chunk_number, chunk in enumerate(self._chunks(actions, chunk_size), 1):
+                pending.append((chunk_number, executor.submit(self._send_chunk, chunk)))
+                if len(pending) >= thread_count:
+                    success_count += self._collect_chunk(*pending.popleft(), errors)
+            while pending:
+                success_count += self._collect_chunk(*pending.popleft(), errors)
+
+        self.connection.indices.refresh(index=index_name)
+        self.search_cache.clear()
+        self.related_cache.clear()
+        self.logger.info("Indexed %i documents, %i failed." % (success_count, len(errors)))
+        return success_count, errors
 
-    def load_documents(self, resources, events, locations, studies):
-        print("Loading search records of events, locations, resources, and studies into Elasticsearch index: %s" % self.index_prefix)
-        for r in resources:
-            self.add_document(r, flush=False)
-        for e in events:
-            post_event_description = e.post_event_description if hasattr(e, 'post_event_description') else None
-            self.add_document(e, flush=False, latitude=e.latitude, longitude=e.longitude, post_event_description=post_event_description)
-        for l in locations:
-            self.add_document(l, flush=False, latitude=l.latitude, longitude=l.longitude)
-        for s in studies:
-            self.add_document(s, flush=False)
-        self.index.flush()
+    @staticmethod
+    def _chunks(actions, chunk_size):
+        chunk = []
+        for action in actions:
+            chunk.append(action)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _send_chunk(self, chunk):
+        success_count, errors = bulk(self.connection, chunk, chunk_size=len(chunk),
+                                     raise_on_error=False, raise_on_exception=False)
+        return len(chunk), success_count, errors
+
+    def _collect_chunk(self, chunk_number, future, errors):
+        """Waits for a chunk to be sent, adding any errors to the given list and returning the
+        number of documents indexed."""
+        chunk_size, success_count, chunk_errors = future.result()
+        errors.extend(chunk_errors)
+        if chunk_errors:
+            self.logger.error("Bulk index chunk %i: %i of %i documents failed." %
+                              (chunk_number, len(chunk_errors), chunk_size))
+        else:
+            self.logger.debug("Bulk index chunk %i: %i documents indexed." % (chunk_number, chunk_size))
+        return success_count
 
     def search(self, search):
-        sort = None if search.sort is None else search.sort.translate()
+        self._include_past_events(search)
 
-        if not search.words:
-            query = MatchAll()
-        else:
-            query = MultiMatch(query=search.words, fields=['content'])
+        # Results are cached by the search itself, and by whether the caller is allowed to see drafts.
+        can_see_drafts = self._can_see_drafts()
+        cache_key = (search.cache_key(), can_see_drafts)
+        results = self.search_cache.get(cache_key)
+        if results is not None:
+            return results
+
+        sort = None if search.sort is None else search.sort.translate()
 
         elastic_search = Search(index=self.index_name)\
             .doc_type(StarDocument)\
-            .query(query)\
+            .query(self._query(search))\
             .highlight('content', type='unified', fragment_size=150)
 
         elastic_search = elastic_search[search.start:search.start + search.size]
+        elastic_search = self._filter(elastic_search, search, can_see_drafts)
 
-        # Filter results for type, ages, and languages
-        if search.types:
-            if set(search.types) == {'resource'}:
-                # Include past events in resource search results
-                search.types.append('event')
+        if sort is not None:
+            elastic_search = elastic_search.sort(sort)
 
+        if search.category and search.category.id:
+            if search.category.calculate_level() == 0:
+                exclude = ".*\\,.*\\,.*"
+                include = str(search.category.id) + "\\,.*"
+                aggregation = A("terms", field='category', exclude=exclude, include=include, size=25)
+            elif search.category.calculate_level() == 1:
+                include = ".*\\,.*\\,.*"
+                aggregation = A("terms", field='category', include=include, size=25)
+            else:
+                aggregation = A("terms", field='category', size=25)
+        else:
+            aggregation = A("terms", field='category', exclude=".*\\,.*", size=25)
+
+        elastic_search.aggs.bucket('terms', aggregation)
+        elastic_search.aggs.bucket('type', A("terms", field='type'))
+        elastic_search.aggs.bucket('ages', A("terms", field='ages'))
+        elastic_search.aggs.bucket('languages', A("terms", field='languages'))
+
+        # KEEPING FOR NOW - THESE WERE THE ORIGINAL FACETS WE HAD SET UP.  WILL NEED TO CONVERT TO AGGREGATIONS
+        # IF WE WANT TO KEEP ANY OF THESE.
+        # 'Location': elasticsearch_dsl.TermsFacet(field='location'),
+        # 'Type': elasticsearch_dsl.TermsFacet(field='label'),
+        # 'Age Range': elasticsearch_dsl.TermsFacet(field='age_range'),
+        # 'Category': elasticsearch_dsl.TermsFacet(field='category'),
+        # 'Organization': elasticsearch_dsl.TermsFacet(field='organization'),
+        # 'Status': elasticsearch_dsl.TermsFacet(field='status'),
+        # 'Topic': elasticsearch_dsl.TermsFacet(field='topic'),
+
+        results = elastic_search.execute()
+        self.search_cache.set(cache_key, results)
+        return results
+
+    def map_search(self, search):
+        """A cheaper version of search for plotting results on a map.  Only documents with a location are
+        returned, with just the fields needed to place them, and without highlighting or facets.  When the
+        search has a zoom level, results are grouped into geohash cells sized to that zoom rather than
+        paged, so that panning the map costs a single aggregation.  The "matched" aggregation counts every
+        document the search matches, located or not, as the total of a full search would."""
+        self._include_past_events(search)
+
+        can_see_drafts = self._can_see_drafts()
+        cache_key = (search.cache_key(), can_see_drafts)
+        results = self.search_cache.get(cache_key)
+        if results is not None:
+            return results
+
+        elastic_search = Search(index=self.index_name)\
+            .doc_type(StarDocument)\
+            .query(self._query(search))\
+            .source(self.MAP_FIELDS)
+        elastic_search = self._filter(elastic_search, search, can_see_drafts)
+        # Aggregations ignore the post filter below, so this counts documents without a location too.
+        elastic_search.aggs.bucket('matched', 'filter', match_all={})
+
+        if search.zoom is None:
+            elastic_search = elastic_search.post_filter('exists', field='geo_point')
+            elastic_search = elastic_search[search.start:search.start + search.size]
+            if search.sort is not None:
+                elastic_search = elastic_search.sort(search.sort.translate())
+        else:
+            elastic_search = elastic_search[0:0]
+            clusters = A('geohash_grid', field='geo_point', precision=_geohash_precision(search.zoom),
+                         size=self.MAP_CLUSTER_LIMIT)
+            clusters.metric('centroid', 'geo_centroid', field='geo_point')
+            # Cells holding a single document are shown as that document, rather than as a cluster.
+            clusters.metric('first', 'top_hits', size=1, _source=self.MAP_FIELDS)
+            elastic_search.aggs.bucket('clusters', clusters)
+
+        results = elastic_search.execute()
+        self.search_cache.set(cache_key, results)
+        return results
+
+    @staticmethod
+    def _include_past_events(search):
+        if set(search.types) == {'resource'}:
+            # Include past events in resource search results
+            search.types.append('event')
+
+    @staticmethod
+    def _query(search):
+        if not search.words:
+            return MatchAll()
+        return MultiMatch(query=search.words, fields=['content'])
+
+    def _filter(self, elastic_search, search, can_see_drafts):
+        """Applies the filters shared by all kinds of searches; types, ages, languages, dates, the map's
+        bounding box, categories and drafts."""
+        if search.types:
             elastic_search = elastic_search.filter('terms', **{"type": search.types})
         if search.ages:
             elastic_search = elastic_search.filter('terms', **{"ages": search.ages})
@@ -245,55 +521,32 @@ class ElasticIndex:
                         }
                     }})
 
-        if sort is not None:
-            elastic_search = elastic_search.sort(sort)
-
-        if 'user' in g and g.user:
-            if Permission.edit_resource not in g.user.role.permissions():
-                elastic_search = elastic_search.filter(Q('bool', must_not=[Q('match', is_draft=True)]))
-        else:
+        if not can_see_drafts:
             elastic_search = elastic_search.filter(Q('bool', must_not=[Q('match', is_draft=True)]))
 
         if search.category and search.category.id:
             elastic_search = elastic_search.filter('terms', category=[str(search.category.search_path())])
-            if search.category.calculate_level() == 0:
-                exclude = ".*\\,.*\\,.*"
-                include = str(search.category.id) + "\\,.*"
-                aggregation = A("terms", field='category', exclude=exclude, include=include, size=25)
-            elif search.category.calculate_level() == 1:
-                include = ".*\\,.*\\,.*"
-                aggregation = A("terms", field='category', include=include, size=25)
-            else:
-                aggregation = A("terms", field='category', size=25)
-        else:
-            aggregation = A("terms", field='category', exclude=".*\\,.*", size=25)
-
-        elastic_search.aggs.bucket('terms', aggregation)
-        elastic_search.aggs.bucket('type', A("terms", field='type'))
-        elastic_search.aggs.bucket('ages', A("terms", field='ages'))
-        elastic_search.aggs.bucket('languages', A("terms", field='languages'))
 
-        # KEEPING FOR NOW - THESE WERE THE ORIGINAL FACETS WE HAD SET UP.  WILL NEED TO CONVERT TO AGGREGATIONS
-        # IF WE WANT TO KEEP ANY OF THESE.
-        # 'Location': elasticsearch_dsl.TermsFacet(field='location'),
-        # 'Type': elasticsearch_dsl.TermsFacet(field='label'),
-        # 'Age Range': elasticsearch_dsl.TermsFacet(field='age_range'),
-        # 'Category': elasticsearch_dsl.TermsFacet(field='category'),
-        # 'Organization': elasticsearch_dsl.TermsFacet(field='organization'),
-        # 'Status': elasticsearch_dsl.TermsFacet(field='status'),
-        # 'Topic': elasticsearch_dsl.TermsFacet(field='topic'),
+        return elastic_search
 
-        return elastic_search.execute()
+    @staticmethod
+    def _can_see_drafts():
+        from app.principal_cache import current_principal  # Imported here, as the app isn't ready when this loads.
+        principal = current_principal()
+        return bool(principal and Permission.edit_resource in principal.permissions())
 
     # Finds all resources related to the given item.
     def more_like_this(self, item, max_hits=3):
+        """Finds the documents most like the given item's own document in the index, so its content doesn't
+        need to be sent along with the query.  Results only include the type and id of each document, and
+        are cached for the item until the index is changed."""
+        uid = self._get_id(item)
+        cached = self.related_cache.get(uid)
+        if cached is not None and cached[0] == max_hits:
+            return cached[1]
 
         query = MoreLikeThis(
-            like=[
-                # {'_id': ElasticIndex._get_id(item), '_index': self.index_name},
-                item.indexable_content(),
-                item.category_names()
-            ],
+            like=[{'_index': self.index_name, '_type': StarDocument._doc_type.name, '_id': uid}],
             min_term_freq=1,
             min_doc_freq=2,
             max_query_terms=12,
@@ -301,14 +554,17 @@ class ElasticIndex:
 
         elastic_search = Search(index=self.index_name)\
             .doc_type(StarDocument)\
-            .query(query)
+            .query(query)\
+            .source(['id', 'type'])
 
         elastic_search = elastic_search[0:max_hits]
 
         # Filter out past events
         elastic_search = elastic_search.filter('bool', **{"should": self._default_filter()})
 
-        return elastic_search.execute()
+        results = elastic_search.execute()
+        self.related_cache.set(uid, (max_hits, results))
+        return results
 
     # Past events with a non-empty post-event description
     def _past_events_filter(self):
@@ -2,6 +2,8 @@ import datetime
 
 from dateutil.tz import UTC
 
+from sqlalchemy.orm import selectinload
+
 from app.email_service import EmailService
 
 
@@ -18,13 +20,13 @@ class EmailPromptService:
         self.__send_prompts(recipients, EmailService(self.app).async_confirm_email, 'confirm_email')
 
     def send_complete_registration_prompting_emails(self):
-        confirmed_users = self.db.session.query(self.user_model).filter(self.user_model.password is not None).all()
+        confirmed_users = self.confirmed_users_with_progress()
         recipients = [u for u in confirmed_users if u.self_registration_complete() is False]
         self.__send_prompts(recipients, EmailService(self.app).complete_registration_prompt_email,
                             'complete_registration_prompt')
 
     def send_dependent_profile_prompting_emails(self):
-        confirmed_users = self.db.session.query(self.user_model).filter(self.user_model.password is not None).all()
+        confirmed_users = self.confirmed_users_with_progress()
         recipients = []
         for u in confirmed_users:
             if (u.self_participant() is not None) \
@@ -37,6 +39,16 @@ class EmailPromptService:
         self.__send_prompts(recipients, EmailService(self.app).complete_dependent_profile_prompt_email,
                             'dependent_profile_prompt')
 
+    def confirmed_users_with_progress(self):
+        # Loads the participants of every user, and works out how far along they all are, up front rather
+        # than a user at a time.
+        from app.participant_progress import participant_progress  # Imported here, as the app loads this first.
+        confirmed_users = self.db.session.query(self.user_model)\
+            .filter(self.user_model.password is not None)\
+            .options(selectinload(self.user_model.participants)).all()
+        participant_progress.percent_complete_for([p for u in confirmed_users for p in u.participants])
+        return confirmed_users
+
     def __send_prompts(self, recipients, send_method, log_type):
         for rec in recipients:
             email_logs = self.db.session.query(self.email_log_model)\
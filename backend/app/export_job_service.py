@@ -0,0 +1,131 @@
+import datetime
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from sqlalchemy import and_, desc, or_
+
+from app import app, db
+from app.export_service import ExportService
+from app.export_xls_service import ExportXlsService
+from app.model.export_job import ExportJob
+
+
+class ExportJobService:
+    """Writes questionnaire spreadsheets on a small pool of background threads, so that large exports don't
+    hold up a request.  Jobs are recorded in the export_job table, and their files written to a directory
+    shared by every process serving the api, so any of them can report on a job and send its file.
+
+    A spreadsheet is handed out again for the same export while the data version of the exported tables is
+    unchanged, and for no longer than ttl_seconds, which also bounds how long a job abandoned by a process
+    that stopped is waited on.  Jobs older than that, and the oldest finished jobs beyond max_jobs, are
+    removed along with their files."""
+
+    def __init__(self, app, directory, max_jobs, ttl_seconds, thread_count):
+        self.app = app
+        self.directory = directory
+        self.max_jobs = max_jobs
+        self.ttl = datetime.timedelta(seconds=ttl_seconds)
+        self.executor = ThreadPoolExecutor(max_workers=thread_count, thread_name_prefix="ExportJob")
+        self.futures = {}  # The jobs running in this process, by id.
+        self.logger = logging.getLogger("ExportJobService")
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, name, user_id=None, base_url=None):
+        """Returns the job for the given export, starting a new one unless an earlier job is still current.
+        Links written out while the job runs, outside of the request, are made from base_url, which defaults
+        to the API_URL setting."""
+        models = [ExportService.get_class(n) for n in ExportXlsService.get_export_names(name, self.app)]
+        data_version = ExportService.get_data_version(models)
+        job = db.session.query(ExportJob)\
+            .filter(ExportJob.name == name, ExportJob.user_id == user_id, ExportJob.data_version == data_version,
+                    ExportJob.status != ExportJob.STATUS_FAILED, ExportJob.date_created > self._cutoff())\
+            .order_by(desc(ExportJob.date_created)).first()
+        if job is not None:
+            return job
+        job = ExportJob(name=name, user_id=user_id, data_version=data_version)
+        db.session.add(job)
+        db.session.commit()
+        job_id = job.id
+        self._remove_old_jobs()
+        future = self.executor.submit(self._run, job_id, base_url)
+        self.futures[job_id] = future
+        future.add_done_callback(lambda f: self.futures.pop(job_id, None))
+        return job
+
+    def get(self, job_id):
+        return db.session.query(ExportJob).filter(ExportJob.id == job_id).first()
+
+    def wait(self, job_id, timeout=None):
+        """Waits for a job started by this process to finish."""
+        future = self.futures.get(job_id)
+        if future is not None:
+            future.result(timeout=timeout)
+
+    def _run(self, job_id, base_url):
+        path = os.path.join(self.directory, job_id + '.xlsx')
+        context = self.app.app_context()
+        context.url_adapter = self._url_adapter(base_url or self.app.config['API_URL'])
+        with context:
+            job = self.get(job_id)
+            if job is None or not self._update(job_id, status=ExportJob.STATUS_RUNNING):
+                return
+            try:
+                with open(path, 'wb') as output:
+                    ExportXlsService.write_xls(output, job.name, self.app, job.user_id)
+                values = dict(status=ExportJob.STATUS_COMPLETE, path=path)
+            except Exception as e:
+                self.logger.exception("Failed to export %s", job.name)
+                db.session.rollback()
+                self._remove_file(path)
+                values = dict(status=ExportJob.STATUS_FAILED, error=str(e))
+            if not self._update(job_id, date_completed=datetime.datetime.utcnow(), **values):
+                # Removed while it was running.
+                self._remove_file(path)
+
+    def _url_adapter(self, base_url):
+        """Builds urls for the schemas' links as if within a request to base_url."""
+        url = urlsplit(base_url)
+        return self.app.url_map.bind(url.netloc, script_name=url.path or '/', url_scheme=url.scheme)
+
+    @staticmethod
+    def _update(job_id, **values):
+        """Updates the job's record, returning False if it no longer exists."""
+        values['last_updated'] = datetime.datetime.utcnow()
+        updated = db.session.query(ExportJob).filter(ExportJob.id == job_id)\
+            .update(values, synchronize_session=False)
+        db.session.commit()
+        return updated > 0
+
+    def _remove_old_jobs(self):
+        # Jobs still running are left to finish unless they are so old that the process running them must
+        # have stopped.  If removed while running, a job removes its own file once it finds out.
+        finished = ExportJob.status.in_((ExportJob.STATUS_COMPLETE, ExportJob.STATUS_FAILED))
+        newest = db.session.query(ExportJob.id).order_by(desc(ExportJob.date_created)).limit(self.max_jobs)
+        old_jobs = db.session.query(ExportJob)\
+            .filter(or_(ExportJob.date_created <= self._cutoff(),
+                        and_(finished, ExportJob.id.notin_(newest.statement)))).all()
+        for job in old_jobs:
+            if job.is_finished():
+                self._remove_file(job.path)
+            db.session.delete(job)
+        db.session.commit()
+
+    def _cutoff(self):
+        return datetime.datetime.now(datetime.timezone.utc) - self.ttl
+
+    @staticmethod
+    def _remove_file(path):
+        if path is None:
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+export_jobs = ExportJobService(app, directory=app.config['EXPORT_JOB_DIRECTORY'],
+                               max_jobs=app.config['EXPORT_JOB_MAX_COUNT'],
+                               ttl_seconds=app.config['EXPORT_JOB_TTL_SECONDS'],
+                               thread_count=app.config['EXPORT_JOB_THREAD_COUNT'])
@@ -1,13 +1,20 @@
+import copy
 import datetime
+import hashlib
 import importlib
+import json
 import re
 import logging
+import threading
+from types import MappingProxyType
 
 from dateutil.tz import UTC
 from flask import url_for
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, literal, union_all, false, inspect
+from sqlalchemy.orm import load_only
 
 from app import db, EmailService, app
+from app.cache import TimedCache
 from app.model.data_transfer_log import DataTransferLog
 from app.model.export_info import ExportInfo
 
@@ -27,29 +34,52 @@ class ExportService:
     TYPE_SUB_TABLE = 'sub-table'
 
     DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+    # A more compact format for transferring tables to the mirror.  One json record per line, without the links
+    # that are only useful for browsing the api, and compressed when the client accepts it.
+    TRANSFER_CONTENT_TYPE = "application/x-ndjson"
 
     @staticmethod
     def get_class_for_table(table):
-        for c in db.Model._decl_class_registry.values():
-            if hasattr(c, '__tablename__') and c.__tablename__ == table.name:
-                return c
+        return ExportService.registry().models_by_table.get(table.name)
 
     @staticmethod
     def get_class(class_name):
-        # class_name = ExportService.camel_case_it(name)
-        for c in db.Model._decl_class_registry.values():
-            if hasattr(c, '__name__') and c.__name__ == class_name:
-                return c
+        # Accepts the CamelCase name of the class, or the snake_case version of it.
+        return ExportService.registry().models_by_name.get(class_name)
 
     @staticmethod
-    def get_schema(name, many=False, session=None, is_import=False):
+    def get_schema(name, many=False, session=None, is_import=False, exclude=()):
         model = ExportService.get_class(name)
-        class_name = None if model is None else model.__name__
-        schema_name = ''
-        schema_class = None
+        if model is None:
+            return None
+        schema_class = ExportService.registry().schema_class(model, is_import)
+        exclude = [field for field in exclude if field in schema_class._declared_fields]
+        return schema_class(many=many, session=session, exclude=exclude)
 
-        if class_name is None:
+    @staticmethod
+    def get_dump_schema(name, many=False, exclude=()):
+        """Like get_schema, but returns a shared instance.  Only use these to dump records, loading stores
+        the instance and session being loaded on the schema itself."""
+        model = ExportService.get_class(name)
+        if model is None:
             return None
+        return ExportService.registry().dump_schema(model, many, tuple(exclude))
+
+    _registry = None
+    _registry_lock = threading.Lock()
+
+    @staticmethod
+    def registry():
+        if ExportService._registry is None:
+            with ExportService._registry_lock:
+                if ExportService._registry is None:
+                    ExportService._registry = ExportRegistry(ExportService.find_schema_class)
+        return ExportService._registry
+
+    @staticmethod
+    def find_schema_class(model, is_import=False):
+        class_name = model.__name__
+        schema_class = None
 
         if not is_import:
             # Check for an 'ExportSchema'
@@ -72,10 +102,7 @@ class ExportService:
             schema_name = class_name + "Schema"
             schema_class = ExportService.str_to_class(model.__module__, schema_name)
 
-        if schema_class is None:
-            raise Exception("Unable to locate schema for class " + class_name)
-
-        return schema_class(many=many, session=session)
+        return schema_class
 
     @staticmethod
     def camel_case_it(name):
@@ -88,49 +115,135 @@ class ExportService:
         return re.sub('([a-z0-9])([A-Z])', r'\1_\2', s1).lower()
 
     @staticmethod
-    def get_data(name, user_id=None, last_updated=None):
+    def get_data(name, user_id=None, participant_id=None, last_updated=None, after_id=None, limit=None):
+        """Records are returned in order of id.  Large tables can be read a page at a time by passing a limit,
+        and the id of the last record of the previous page as after_id."""
+        query = ExportService.get_query(name, user_id=user_id, participant_id=participant_id,
+                                        last_updated=last_updated, after_id=after_id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
+
+    @staticmethod
+    def iter_data(name, user_id=None, participant_id=None, last_updated=None, fields=None):
+        """Iterates over the records in order of id, reading them from the database in batches rather than all
+        at once.  If fields are given and are all columns, only those columns (and the keys needed to load
+        relationships) are read."""
+        query = ExportService.get_query(name, user_id=user_id, participant_id=participant_id,
+                                        last_updated=last_updated, fields=fields)
+        return query.yield_per(app.config['EXPORT_BATCH_SIZE'])
+
+    @staticmethod
+    def get_query(name, user_id=None, participant_id=None, last_updated=None, after_id=None, fields=None):
+        """A query for the records of the named class in order of id.  Asking for the records of a user or
+        participant from a table that isn't related to them returns an empty query."""
         model = ExportService.get_class(name)
         query = db.session.query(model)
         if last_updated:
             query = query.filter(model.last_updated > last_updated)
+        if after_id is not None:
+            query = query.filter(model.id > after_id)
         if hasattr(model, '__mapper_args__') \
                 and 'polymorphic_identity' in model.__mapper_args__:
             query = query.filter(model.type == model.__mapper_args__['polymorphic_identity'])
-        query = query.order_by(model.id)
-        if user_id:
-            if hasattr(model, 'user_id'):
-                return query.filter(model.user_id == user_id)
-            else:
-                return []
-        else:
-            return query.all()
+        if user_id is not None:
+            query = query.filter(model.user_id == user_id if hasattr(model, 'user_id') else false())
+        if participant_id is not None:
+            query = query.filter(model.participant_id == participant_id
+                                 if hasattr(model, 'participant_id') else false())
+        columns = ExportService.get_columns(model, fields) if fields is not None else None
+        if columns is not None:
+            query = query.options(load_only(*columns))
+        return query.order_by(model.id)
+
+    @staticmethod
+    def get_columns(model, fields):
+        # The named columns, along with the keys and type needed to load the record and its relationships.
+        # None if any field is read from elsewhere, such as a relationship or method, as whatever it reads
+        # would then be loaded a record at a time.  Links are built from the keys.
+        mapper = inspect(model)
+        if any(name != '_links' and name not in mapper.column_attrs for name in fields):
+            return None
+        columns = []
+        for attr in mapper.column_attrs:
+            column = attr.columns[0]
+            if attr.key in fields or column.primary_key or column.foreign_keys \
+                    or column is mapper.polymorphic_on:
+                columns.append(attr.key)
+        return columns
 
     # Returns a list of classes/tables with information about how they should be exported.
     @staticmethod
     def get_table_info(last_updated=None):
-        export_infos = []
-        sorted_tables = db.metadata.sorted_tables  # Tables in an order that should correctly manage dependencies
+        models = ExportService.get_table_models()
+        sizes = ExportService.get_table_sizes(models, last_updated)
+        return [ExportService.get_single_table_info(db_model, last_updated, sizes) for db_model in models]
+
+    # Models for every table, in an order that should correctly manage dependencies.  These can't change while
+    # the app is running, so are worked out once.
+    _table_models = None
 
-        # This moves the resource_categories table to the end of the list.
-        rc = next((t for t in sorted_tables if t.fullname == "resource_category"), None)
-        sorted_tables.append(sorted_tables.pop(sorted_tables.index(rc)))
+    @staticmethod
+    def get_table_models():
+        if ExportService._table_models is None:
+            sorted_tables = db.metadata.sorted_tables
+            # This moves the resource_categories table to the end of the list.
+            rc = next((t for t in sorted_tables if t.fullname == "resource_category"), None)
+            sorted_tables.append(sorted_tables.pop(sorted_tables.index(rc)))
+            ExportService._table_models = [ExportService.get_class_for_table(table) for table in sorted_tables]
+        return ExportService._table_models
 
-        for table in sorted_tables:
-            db_model = ExportService.get_class_for_table(table)
-            export_infos.append(ExportService.get_single_table_info(db_model, last_updated))
-        return export_infos
+    _sub_table_models = {}
 
     @staticmethod
-    def get_single_table_info(db_model, last_updated):
-        export_info = ExportInfo(table_name=db_model.__tablename__, class_name=db_model.__name__)
-        query = (db.session.query(func.count(db_model.id)))
-        if last_updated:
-            query = query.filter(db_model.last_updated > last_updated)
-        if hasattr(db_model, '__mapper_args__') \
-                and 'polymorphic_identity' in db_model.__mapper_args__:
-            query = query.filter(db_model.type == db_model.__mapper_args__['polymorphic_identity'])
+    def get_sub_table_models(db_model):
+        """The classes of any repeating groups in a questionnaire, which are exported as their own tables."""
+        if db_model not in ExportService._sub_table_models:
+            sub_models = []
+            if hasattr(db_model, "get_field_groups"):
+                for name, settings in db_model().get_field_groups().items():
+                    if "repeat_class" in settings:
+                        sub_models.append(settings["repeat_class"])
+            ExportService._sub_table_models[db_model] = sub_models
+        return ExportService._sub_table_models[db_model]
 
-        export_info.size = query.all()[0][0]
+    @staticmethod
+    def get_table_sizes(models, last_updated=None):
+        """Returns the number of records in each of the given models (only those changed since last_updated,
+        if provided) keyed on the class name, counting every table in a single UNION ALL query rather than
+        a query per table."""
+        counts = []
+        for db_model in models:
+            query = db.session.query(db_model)
+            if last_updated:
+                query = query.filter(db_model.last_updated > last_updated)
+            if hasattr(db_model, '__mapper_args__') \
+                    and 'polymorphic_identity' in db_model.__mapper_args__:
+                query = query.filter(db_model.type == db_model.__mapper_args__['polymorphic_identity'])
+            counts.append(query.statement.with_only_columns(
+                [literal(db_model.__name__).label('class_name'), func.count().label('size')]).order_by(None))
+        if not counts:
+            return {}
+        return {class_name: size for class_name, size in db.session.execute(union_all(*counts))}
+
+    @staticmethod
+    def get_data_version(models):
+        """A fingerprint of the records in the given models, made from the number of records in each and when
+        they last changed, and read in a single UNION ALL query.  It changes whenever records are added,
+        removed or updated, whichever process made the change."""
+        if not models:
+            return ''
+        stats = [db.session.query(literal(db_model.__name__), func.count(), func.max(db_model.last_updated))
+                 .statement.order_by(None) for db_model in models]
+        rows = sorted(tuple(row) for row in db.session.execute(union_all(*stats)))
+        return hashlib.sha1(repr(rows).encode()).hexdigest()
+
+    @staticmethod
+    def get_single_table_info(db_model, last_updated, sizes=None):
+        export_info = ExportInfo(table_name=db_model.__tablename__, class_name=db_model.__name__)
+        if sizes is None or db_model.__name__ not in sizes:
+            sizes = ExportService.get_table_sizes([db_model], last_updated)
+        export_info.size = sizes[db_model.__name__]
         export_info.url = url_for("api.exportendpoint", name=ExportService.snake_case_it(db_model.__name__))
         if hasattr(db_model, '__question_type__'):
             export_info.question_type = db_model.__question_type__
@@ -139,13 +252,9 @@ class ExportService:
         if hasattr(db_model, '__no_export__') and db_model.__no_export__:
             export_info.exportable = False
 
-        if hasattr(db_model, "get_field_groups"):
-            groups = db_model().get_field_groups()
-            for name, settings in groups.items():
-                if "repeat_class" in settings:
-                    # RECURSE!
-                    c = settings["repeat_class"]
-                    export_info.sub_tables.append(ExportService.get_single_table_info(c, last_updated))
+        for sub_model in ExportService.get_sub_table_models(db_model):
+            # RECURSE!
+            export_info.sub_tables.append(ExportService.get_single_table_info(sub_model, last_updated, sizes))
 
         return export_info
 
@@ -165,6 +274,52 @@ class ExportService:
     def str_to_class(module_name, class_name):
         return ExportService.class_exists(module_name, class_name)
 
+    # The meta for each questionnaire class and relationship, which can't change while the app is running.
+    _meta_cache = TimedCache(max_size=app.config['QUESTIONNAIRE_META_CACHE_MAX_SIZE'],
+                             ttl_seconds=app.config['QUESTIONNAIRE_META_CACHE_TTL_SECONDS'])
+
+    @staticmethod
+    def get_cached_meta(model, relationship=None):
+        """Returns the meta for a questionnaire class and relationship, along with an ETag for it, working both
+        out the first time they are asked for.  Without a relationship, returns the export meta instead.  The
+        meta is copied before it is cached, so it shares nothing with the models' column info, and the
+        returned meta must not be modified."""
+        key = (model, relationship)
+        cached = ExportService._meta_cache.get(key)
+        if cached is None:
+            if relationship is None:
+                meta = ExportService.get_export_meta(model)
+            else:
+                meta = ExportService.get_meta(model(), relationship)
+            meta = copy.deepcopy(meta)
+            etag = hashlib.sha1(json.dumps(meta, sort_keys=True, default=str).encode()).hexdigest()
+            cached = (meta, etag)
+            ExportService._meta_cache.set(key, cached)
+        return cached
+
+    @staticmethod
+    def get_export_meta(model):
+        """Describes every column of a questionnaire, for data exports that don't depend on a flow."""
+        meta = {"table": {}}
+        try:
+            meta["table"]['question_type'] = model.__question_type__
+            meta["table"]["label"] = model.__label__
+        except:
+            pass  # If these fields don't exist, just keep going.
+        meta["fields"] = []
+
+        for c in model.__table__.columns:
+            if c.info:
+                meta['fields'].append(dict(c.info, name=c.name, key=c.name))
+            elif c.type.python_type == datetime.datetime:
+                meta['fields'].append({'name': c.name, 'key': c.name, 'display_order': 0, 'type': 'DATETIME'})
+            else:
+                meta['fields'].append({'name': c.name, 'key': c.name, 'display_order': 0})
+
+        # Sort the fields
+        meta['fields'] = sorted(meta['fields'], key=lambda field: field['display_order'])
+        return meta
+
     @staticmethod
     def get_meta(questionnaire, relationship):
         meta = {"table": {}}
@@ -306,3 +461,42 @@ class ExportService:
                 db.session.commit()
 
 
+
+
+class ExportRegistry:
+    """Every model, looked up by its class name (CamelCase or snake_case) or by its table name, along with the
+    schemas used to import and export it.  Built once, when all the models have been loaded, so that finding
+    a class or schema is a dictionary lookup rather than a scan of the declarative registry and a handful of
+    module imports."""
+
+    def __init__(self, find_schema_class):
+        models_by_name = {}
+        models_by_table = {}
+        schema_classes = {}
+        for c in list(db.Model._decl_class_registry.values()):
+            if not hasattr(c, '__tablename__'):
+                continue
+            models_by_name.setdefault(c.__name__, c)
+            models_by_name.setdefault(ExportService.snake_case_it(c.__name__), c)
+            models_by_table.setdefault(c.__tablename__, c)
+            for is_import in (False, True):
+                schema_classes[(c, is_import)] = find_schema_class(c, is_import)
+        self.models_by_name = MappingProxyType(models_by_name)
+        self.models_by_table = MappingProxyType(models_by_table)
+        self.schema_classes = MappingProxyType(schema_classes)
+        self._dump_schemas = {}
+
+    def schema_class(self, model, is_import=False):
+        schema_class = self.schema_classes.get((model, is_import))
+        if schema_class is None:
+            raise Exception("Unable to locate schema for class " + model.__name__)
+        return schema_class
+
+    def dump_schema(self, model, many=False, exclude=()):
+        key = (model, many, exclude)
+        schema = self._dump_schemas.get(key)
+        if schema is None:
+            schema_class = self.schema_class(model)
+            schema = schema_class(many=many, exclude=[f for f in exclude if f in schema_class._declared_fields])
+            self._dump_schemas[key] = schema
+        return schema
@@ -1,12 +1,13 @@
 # Thanks to https://gist.github.com/piersstorey/b32583f0cc5cba0a38a11c2b123af687
 import os
-import io
 import re
+import tempfile
 
 import xlsxwriter
-from flask import Response
+from flask import Response, request
 from datetime import datetime
 from werkzeug.datastructures import Headers
+from werkzeug.wsgi import wrap_file
 from app.export_service import ExportService
 
 
@@ -34,25 +35,30 @@ class ExportXlsService:
 
     @staticmethod
     def export_xls(name, app, user_id=None):
-        # Flask response
-        response = Response()
-        response.status_code = 200
-
-        # Create an in-memory output file for the new workbook.
-        output = io.BytesIO()
+        output = tempfile.TemporaryFile()
+        ExportXlsService.write_xls(output, name, app, user_id)
+        return ExportXlsService.xls_response(output, 'export_{}_{}.xlsx'.format(name, datetime.utcnow()))
 
+    @staticmethod
+    def get_export_names(name, app):
+        """The class names of the tables written to the spreadsheet for the given export, one per worksheet."""
         if name.lower() == 'all':
-            # Get Questionnaire Names
-            questionnaire_names = ExportXlsService.get_questionnaire_names(app)
-        else:
-            cl = ExportService.get_class(name)
-            info = ExportService.get_single_table_info(cl, None)
-            questionnaire_names = [name]
-            for sub_table in info.sub_tables:
-                questionnaire_names.append(sub_table.class_name)
+            return ExportXlsService.get_questionnaire_names(app)
+        cl = ExportService.get_class(name)
+        questionnaire_names = [name]
+        for sub_table in ExportService.get_sub_table_models(cl):
+            questionnaire_names.append(sub_table.__name__)
+        return questionnaire_names
+
+    @staticmethod
+    def write_xls(output, name, app, user_id=None):
+        # The workbook is written with xlsxwriter's constant_memory option, which flushes each row to the
+        # output file once the next is started.  Records are read from the database in batches and dumped
+        # one at a time, so exporting every questionnaire doesn't hold them all in memory at once.
+        questionnaire_names = ExportXlsService.get_export_names(name, app)
 
         # Create workbook
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+        workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
 
         # Add a bold format to use to highlight cells.
         bold = workbook.add_format({'bold': True})
@@ -61,12 +67,8 @@ class ExportXlsService:
             worksheet = workbook.add_worksheet(ExportXlsService.pretty_title_from_snakecase(qname))
             # Some data we want to write to the worksheet.
             # Get header fields from the schema in case the first record is missing fields
-            schema = ExportService.get_schema(qname, many=True)
+            schema = ExportService.get_dump_schema(qname)
             header_fields = schema.fields
-            if user_id:
-                questionnaires = schema.dump(ExportService().get_data(name=qname, user_id=user_id), many=True)
-            else:
-                questionnaires = schema.dump(ExportService().get_data(name=qname), many=True)
 
             # Start from the first cell. Rows and columns are zero indexed.
             row = 0
@@ -80,37 +82,21 @@ class ExportXlsService:
             row += 1
 
             # Iterate over the data and write it out row by row.
-            for questionnaire in questionnaires:
-                # Start from the first cell. Rows and columns are zero indexed.
-                col = 0
-                for (key, value) in questionnaire.items():
-                    if key == "_links":
-                        continue  # Don't export _links
-                    if isinstance(value, dict):
-                        continue
-                    if isinstance(value, list) and len(value) > 0 and isinstance(value[0], dict):
-                        continue  # Don't try to represent sub-table data.
-                    if isinstance(value, list):
-                        list_string = ''
-                        for list_value in value:
-                            list_string = list_string + str(list_value) + ', '
-                        worksheet.write(row, col, list_string)
-                    else:
-                        worksheet.write(row, col, value)
-                    col += 1
+            for record in ExportService.iter_data(qname, user_id=user_id, fields=header_fields):
+                ExportXlsService.write_row(worksheet, row, schema.dump(record))
                 row += 1
 
-        # Close the workbook before streaming the data.
         workbook.close()
 
-        # Rewind the buffer.
+    @staticmethod
+    def xls_response(output, file_name):
+        output.seek(0, os.SEEK_END)
+        size = output.tell()
         output.seek(0)
 
-        # Add output to response
-        response.data = output.read()
-
-        # Set filename
-        file_name = 'export_{}_{}.xlsx'.format(name, datetime.utcnow())
+        # Flask response, which sends the file a block at a time, and closes it when done.
+        response = Response(wrap_file(request.environ, output), direct_passthrough=True)
+        response.status_code = 200
 
         # HTTP headers for forcing file download
         response_headers = Headers({
@@ -122,7 +108,7 @@ class ExportXlsService:
             'Content-Transfer-Encoding': 'binary',
             'Access-Control-Expose-Headers': 'x-filename',
             'x-filename': file_name,
-            'Content-Length': len(response.data)
+            'Content-Length': size
         })
 
         # Add headers
@@ -134,4 +120,22 @@ class ExportXlsService:
         # Return the response
         return response
 
-
+    @staticmethod
+    def write_row(worksheet, row, questionnaire):
+        # Start from the first cell. Rows and columns are zero indexed.
+        col = 0
+        for (key, value) in questionnaire.items():
+            if key == "_links":
+                continue  # Don't export _links
+            if isinstance(value, dict):
+                continue
+            if isinstance(value, list) and len(value) > 0 and isinstance(value[0], dict):
+                continue  # Don't try to represent sub-table data.
+            if isinstance(value, list):
+                list_string = ''
+                for list_value in value:
+                    list_string = list_string + str(list_value) + ', '
+                worksheet.write(row, col, list_string)
+            else:
+                worksheet.write(row, col, value)
+            col += 1
@@ -1,5 +1,15 @@
 import datetime
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import json
+
+import jwt
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Fire of the scheduler
 # The Data Importer should run on the MIRROR, and will make calls to the primary server to download
@@ -21,6 +31,7 @@ class ImportService:
     EXPORT_ENDPOINT = "/api/export"
     EXPORT_ADMIN_ENDPOINT = "/api/export/admin"
     USER_ENDPOINT = "/api/session"
+    TOKEN_REFRESH_SECONDS = 300  # Log in again when the token is this close to expiring.
     token = "invalid"
 
     def __init__(self, app, db):
@@ -30,16 +41,35 @@ class ImportService:
         self.email = app.config["MASTER_EMAIL"]
         self.password = app.config["MASTER_PASS"]
         self.import_interval_minutes = app.config['IMPORT_INTERVAL_MINUTES']
+        self.import_chunk_size = app.config['IMPORT_CHUNK_SIZE']
+        self.fetch_thread_count = app.config['IMPORT_FETCH_THREAD_COUNT']
+        self.token_lock = threading.Lock()
+
+        # A single session, so connections to the primary server are kept open and reused between requests,
+        # and requests that fail along the way are retried.
+        retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.fetch_thread_count, max_retries=retries)
+        self.http = requests.Session()
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
 
     def run_backup(self, load_admin=True, full_backup=False):
         date_started = datetime.datetime.utcnow()
         exportables = self.get_export_list(full_backup)
-        # Note:  We request data THEN create the next log.  We depend on this order to get data since
-        # the last log was recorded, but besure and set the start date from the moment this was called.
-        data = self.request_data(exportables, full_backup=full_backup)
+        # Note:  The date we request data from depends on the last log detail for each class, so be sure to
+        # work out where each class starts before any are logged, and set the start date from the moment this
+        # was called.
+        to_fetch = [(e, self.master_url + self.export_url(e, full_backup)) for e in exportables if e.size > 0]
         log = self.log_for_export(exportables, date_started)
         self.db.session.add(log)
-        self.load_all_data(data, log)
+        with ThreadPoolExecutor(max_workers=self.fetch_thread_count) as pool:
+            # The first page of the next few tables downloads while the current one is loaded.  Tables are
+            # still loaded in order, and each page is loaded before the next page of its table is requested.
+            first_pages = self.fetch_ahead(pool, [url for export, url in to_fetch])
+            for (export, url), response in zip(to_fetch, first_pages):
+                for page in self.request_pages(export, response=response):
+                    export.json_data = page
+                    self.load_data(export, log)
         if load_admin:
             self.load_admin()
         self.db.session.commit()
@@ -61,7 +91,7 @@ class ImportService:
 
     def login(self):
         creds = {'email': self.email, 'password': self.password}
-        response = requests.post(self.master_url + self.LOGIN_ENDPOINT, json=creds)
+        response = self.http.post(self.master_url + self.LOGIN_ENDPOINT, json=creds)
         if response.status_code != 200:
             self.logger.error("Authentication to Primary Server Failed." + str(response))
         else:
@@ -69,15 +99,27 @@ class ImportService:
             self.token = data['token']
 
     def get_headers(self):
-        # Verifies we still have a valid token, and returns the headers
-        # or attempts to re-authenticate.
-        headers = {'Authorization': 'Bearer {}'.format(self.token),
-                   'Accept': "application/json"}
-        response = requests.get(self.master_url + self.USER_ENDPOINT, headers=headers)
-        if response.status_code != 200:
-            self.login()
-            headers = {'Authorization': 'Bearer {}'.format(self.token)}
-        return headers
+        # Returns the headers, re-authenticating if the token is about to expire.  Tokens that don't say
+        # when they expire are verified with the server first.
+        with self.token_lock:
+            expires = self.token_expiration()
+            if expires is None:
+                headers = {'Authorization': 'Bearer {}'.format(self.token),
+                           'Accept': "application/json"}
+                response = self.http.get(self.master_url + self.USER_ENDPOINT, headers=headers)
+                if response.status_code != 200:
+                    self.login()
+            elif expires - time.time() < self.TOKEN_REFRESH_SECONDS:
+                self.login()
+            return {'Authorization': 'Bearer {}'.format(self.token),
+                    'Accept': "application/json"}
+
+    def token_expiration(self):
+        # The token is only read here to find out when it expires, the primary server verifies it.
+        try:
+            return jwt.decode(self.token, options={"verify_signature": False}).get('exp')
+        except jwt.InvalidTokenError:
+            return None
 
     def get_export_list(self, full_backup=False):
 
@@ -87,98 +129,150 @@ class ImportService:
         if last_log and last_log.successful() and not full_backup:
             date_string = last_log.date_started.strftime(ExportService.DATE_FORMAT)
             url += "?after=" + date_string
-        response = requests.get(url, headers=self.get_headers())
+        response = self.http.get(url, headers=self.get_headers())
         exportables = ExportInfoSchema(many=True).load(response.json())
         return exportables
 
-    def request_data(self, export_list, full_backup=False):
-        for export in export_list:
-            if export.size == 0:
-                continue
-            last_detail_log = self.db.session.query(DataTransferLogDetail)\
-                .filter(DataTransferLogDetail.class_name == export.class_name) \
-                .order_by(desc(DataTransferLogDetail.date_started)).limit(1).first()
-            if last_detail_log and not full_backup:
-                date_string = last_detail_log.date_started.strftime(ExportService.DATE_FORMAT)
-                url = export.url + "?after=" + date_string
-            else:
-                url = export.url
-            url = self.master_url + url
-            print("Calling: " + url)
-            response = requests.get(url, headers=self.get_headers())
-            export.json_data = response.json()
-        return export_list
-
-    def load_all_data(self, export_list, log):
-        for export_info in export_list:
-            self.load_data(export_info, log)
+    def request_pages(self, export, full_backup=False, response=None):
+        """Yields the records for an export one page at a time, following the Link header of each
+        response to the next page.  The response for the first page may already have been fetched."""
+        if export.size == 0:
+            return
+        if response is None:
+            response = self.fetch(self.master_url + self.export_url(export, full_backup))
+        while response is not None:
+            yield self.records(response)
+            next_page = response.links.get('next')
+            response = self.fetch(self.master_url + next_page['url']) if next_page else None
+
+    def fetch(self, url):
+        # Asks for the compact transfer format, which requests will decompress as it arrives.
+        print("Calling: " + url)
+        headers = self.get_headers()
+        headers['Accept'] = ExportService.TRANSFER_CONTENT_TYPE
+        return self.http.get(url, headers=headers)
+
+    def records(self, response):
+        if response.headers.get('Content-Type', '').startswith(ExportService.TRANSFER_CONTENT_TYPE):
+            return [json.loads(line) for line in response.iter_lines() if line]
+        return response.json()
+
+    def fetch_ahead(self, pool, urls):
+        """Yields the response for each url in order, while fetching as many of the following urls as
+        there are threads in the pool."""
+        pending = deque()
+        for url in urls:
+            pending.append(pool.submit(self.fetch, url))
+            if len(pending) > self.fetch_thread_count:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def export_url(self, export, full_backup=False):
+        last_detail_log = self.db.session.query(DataTransferLogDetail)\
+            .filter(DataTransferLogDetail.class_name == export.class_name) \
+            .order_by(desc(DataTransferLogDetail.date_started)).limit(1).first()
+        if last_detail_log and not full_backup:
+            date_string = last_detail_log.date_started.strftime(ExportService.DATE_FORMAT)
+            return export.url + "?after=" + date_string
+        return export.url
 
     def load_data(self, export_info, log):
         if len(export_info.json_data) < 1:
             return  # Nothing to do here.
         schema = ExportService.get_schema(export_info.class_name, many=False, is_import=True)
         model_class = ExportService.get_class(export_info.class_name)
-        log_detail = DataTransferLogDetail(class_name=export_info.class_name, date_started=log.date_started, successful=True, success_count=0, failure_count=0)
-        log.details.append(log_detail)
-        for item in export_info.json_data:
+        # Tables that arrive in several pages share a single log detail.
+        log_detail = next((d for d in log.details if d.class_name == export_info.class_name), None)
+        if log_detail is None:
+            log_detail = DataTransferLogDetail(class_name=export_info.class_name, date_started=log.date_started, successful=True, success_count=0, failure_count=0)
+            log.details.append(log_detail)
+        # Save the log first, so that rolling back a chunk that fails doesn't discard it.
+        self.db.session.add(log)
+        self.db.session.commit()
+
+        items = export_info.json_data
+        for i in range(0, len(items), self.import_chunk_size):
+            chunk = items[i:i + self.import_chunk_size]
+            if not self.load_chunk(schema, model_class, chunk, log_detail):
+                # Something in the chunk could not be saved, so save it a record at a time to find out what.
+                for item in chunk:
+                    self.load_chunk(schema, model_class, [item], log_detail)
+
+        if not log_detail.successful:
+            raise Exception("Failed to import %i records of %s. %s" %
+                            (log_detail.failure_count, export_info.class_name, log_detail.errors))
+
+    def load_chunk(self, schema, model_class, items, log_detail):
+        """Loads the given records in a single transaction, having looked up those that already exist with one
+        query.  Records that can't be parsed are logged as failures and skipped.  Returns False if the
+        transaction as a whole failed, in which case nothing was saved."""
+        session = self.db.session
+        ids = [item['id'] for item in items]
+        existing = {m.id: m for m in session.query(model_class).filter(model_class.id.in_(ids))}
+        loaded = []
+        for item in items:
             item_copy = dict(item)
-            if "_links" in item_copy:
-                links = item_copy.pop("_links")
-            existing_model = self.db.session.query(model_class).filter_by(id=item['id']).first()
+            item_copy.pop("_links", None)
+            instance = existing.get(item['id'])
+            is_new = instance is None
+            if is_new:
+                # Passing an instance saves the schema from looking it up again.
+                instance = model_class()
             try:
-                if existing_model:
-                    model = schema.load(data=item_copy, session=self.db.session, instance=existing_model)
-                else:
-                    model = schema.load(data=item_copy, session=self.db.session)
-
-                try:
-                    self.db.session.add(model)
-                    self.db.session.commit()
-                    log_detail.handle_success()
-                    self.db.session.add(log_detail)
-                    if hasattr(model, '__question_type__') and model.__question_type__ == ExportService.TYPE_SENSITIVE:
-                        print("Sensitive Data.  Calling Delete.")
-                        self.delete_record(item)
-                except Exception as e:
-                    self.db.session.rollback()
-                    self.logger.error("Error processing " + export_info.class_name + " with id of " + str(
-                        item["id"]) + ".  Error: " + str(e))
-                    log_detail.handle_failure(e)
-                    self.db.session.add(log)
-                    self.db.session.add(log_detail)
-                    raise e
-
+                loaded.append((item, schema.load(data=item_copy, session=session, instance=instance)))
             except Exception as e:
-                e = Exception("Failed to parse model " + export_info.class_name + ". " + str(e))
-                log_detail.handle_failure(e)
-                self.db.session.add(log)
-                self.db.session.add(log_detail)
-                raise e
+                # Don't let a partially loaded record be saved with the rest of the chunk.
+                if is_new and instance in session:
+                    session.expunge(instance)
+                elif not is_new:
+                    session.expire(instance)
+                log_detail.handle_failure(Exception("Failed to parse model " + model_class.__name__ +
+                                                    " with id of " + str(item['id']) + ". " + str(e)))
 
-        self.db.session.commit()
+        try:
+            session.add_all(model for item, model in loaded)
+            for _ in loaded:
+                log_detail.handle_success()
+            session.add(log_detail)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            if len(items) > 1:
+                return False
+            self.logger.error("Error processing " + model_class.__name__ + " with id of " + str(
+                items[0]["id"]) + ".  Error: " + str(e))
+            log_detail.handle_failure(e)
+            session.add(log_detail)
+            session.commit()
+            return True
+
+        if loaded and getattr(model_class, '__question_type__', None) == ExportService.TYPE_SENSITIVE:
+            print("Sensitive Data.  Calling Delete.")
+            self.delete_records(model_class, [item['id'] for item, model in loaded])
+        return True
 
-    def delete_record(self, item):
-        if not '_links' in item or not 'self' in item['_links']:
-            raise Exception('No link available to delete ' + item.__class__.__name__)
+    def delete_records(self, model_class, ids):
+        """Removes records from the primary server once they are safely stored here, with a single request."""
         if not self.app.config['DELETE_RECORDS']:
             self.logger.info("DELETE is off in the configuration.  So not deleting.")
             return
-        url = self.master_url + item['_links']['self']
-        response = requests.delete(url, headers=self.get_headers())
+        url = self.master_url + self.EXPORT_ENDPOINT + "/" + ExportService.snake_case_it(model_class.__name__)
+        response = self.http.delete(url, json={'ids': ids}, headers=self.get_headers())
         assert (response.status_code == 200)
 
     # Takes the partial path of an endpoint, and returns json.  Logging any errors.
     def __get_json(self, path):
         try:
             url = self.master_url + path
-            response = requests.get(url)
+            response = self.http.get(url)
             return response.json()
         except requests.exceptions.ConnectionError as err:
             self.logger.error("Uable to contact the master instance at " + url)
 
     def load_admin(self):
         url = self.master_url + self.EXPORT_ADMIN_ENDPOINT
-        response = requests.get(url, headers=self.get_headers())
+        response = self.http.get(url, headers=self.get_headers())
         schema = AdminExportSchema()
         json_response = response.json()
         for json_admin in json_response:
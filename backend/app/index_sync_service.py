@@ -0,0 +1,215 @@
+import datetime
+import logging
+import threading
+
+from sqlalchemy import event, func, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import selectinload
+
+
+# Keeps the search index in step with the database without making api requests wait on Elasticsearch.
+# Changes to resources, locations, events and studies (and the categories attached to them) are written to
+# the index_outbox table as they are flushed, so they are saved, or rolled back, along with the change itself.
+# A background worker in each process reads the outbox, so a record edited several times is only indexed
+# once, and sends the documents to Elasticsearch in bulk, relying on the index's refresh interval rather than
+# flushing.  Each document leaves the outbox once it has been synchronized.  Those that fail stay, and are
+# retried after a delay that doubles with each attempt, so the index catches up after a restart or an outage.
+class IndexSyncService:
+    logger = logging.getLogger("IndexSyncService")
+
+    QUEUED_KEY = 'index_sync_queued'
+
+    def __init__(self, app, db, elastic_index):
+        self.app = app
+        self.db = db
+        self.elastic_index = elastic_index
+        self.interval_seconds = app.config['INDEX_SYNC_INTERVAL_SECONDS']
+        self.max_retry_seconds = app.config['INDEX_SYNC_MAX_RETRY_SECONDS']
+        self.batch_size = app.config['INDEX_SYNC_BATCH_SIZE']
+        # When immediate, changes are indexed (and refreshed) as soon as they are committed.  Used in testing.
+        self.immediate = app.config['INDEX_SYNC_IMMEDIATE']
+        self.running = False
+        self.queued = 0
+        self.condition = threading.Condition()
+
+        event.listen(db.session, 'after_flush', self._collect_changes)
+        event.listen(db.session, 'after_commit', self._notify_changes)
+        event.listen(db.session, 'after_soft_rollback', self._discard_changes)
+
+    def start(self):
+        """Starts the background worker.  Until this is called (ie, when running command line tools that
+        rebuild the whole index anyway) the outbox is not read, unless running in immediate mode."""
+        if self.running or self.immediate:
+            return
+        self.running = True
+        worker = threading.Thread(target=self._run, name="IndexSyncService", daemon=True)
+        worker.start()
+
+    def mark_changed(self, document):
+        """Notes a change the session can't see for itself, such as a bulk delete of the record or its
+        categories.  Takes effect when the current transaction commits."""
+        self._queue(self.db.session, {(document.__tablename__, document.id)})
+
+    def _queue(self, session, changes):
+        """Adds the given (table name, id) pairs to the outbox, in the session's current transaction."""
+        from app.model.index_outbox import IndexOutbox
+
+        statement = insert(IndexOutbox.__table__).values(
+            [{'table_name': table, 'document_id': id, 'version': 1, 'attempts': 0, 'last_updated': func.now()}
+             for table, id in changes])
+        statement = statement.on_conflict_do_update(
+            index_elements=['table_name', 'document_id'],
+            set_={'version': IndexOutbox.version + 1, 'attempts': 0, 'retry_after': None,
+                  'last_updated': func.now()})
+        session.connection().execute(statement)
+        session.info[self.QUEUED_KEY] = session.info.get(self.QUEUED_KEY, 0) + len(changes)
+
+    def _collect_changes(self, session, flush_context):
+        from app.model.resource import Resource
+        from app.model.resource_category import ResourceCategory
+        from app.model.study import Study
+        from app.model.study_category import StudyCategory
+
+        changes = set()
+        untyped_ids = set()
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, (Resource, Study)):
+                changes.add((obj.__tablename__, obj.id))
+            elif isinstance(obj, ResourceCategory) and obj.resource_id is not None:
+                resource = obj.__dict__.get('resource')  # Without loading it.
+                if obj.type is not None:
+                    changes.add((obj.type, obj.resource_id))
+                elif resource is not None:
+                    changes.add((resource.__tablename__, obj.resource_id))
+                else:
+                    untyped_ids.add(obj.resource_id)
+            elif isinstance(obj, StudyCategory) and obj.study_id is not None:
+                changes.add((Study.__tablename__, obj.study_id))
+        if untyped_ids:
+            # An event or location is indexed under its own type, so look up what kind of resource it is.
+            types = dict(session.connection().execute(
+                select([Resource.id, Resource.type]).where(Resource.id.in_(untyped_ids))).fetchall())
+            changes.update((types.get(id) or Resource.__tablename__, id) for id in untyped_ids)
+        if changes:
+            self._queue(session, changes)
+
+    def _notify_changes(self, session):
+        queued = session.info.pop(self.QUEUED_KEY, 0)
+        if not queued:
+            return
+        if self.immediate:
+            self.process_outbox(refresh=True)
+        elif self.running:
+            with self.condition:
+                self.queued += queued
+                if self.queued >= self.batch_size:
+                    self.condition.notify()
+
+    def _discard_changes(self, session, previous_transaction):
+        session.info.pop(self.QUEUED_KEY, None)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait(timeout=self.interval_seconds)
+                self.queued = 0
+            try:
+                with self.app.app_context():
+                    self.process_outbox()
+            except Exception as e:
+                self.logger.error("Failed to read the search index outbox: %s" % str(e))
+
+    def process_outbox(self, refresh=False):
+        """Synchronizes the documents waiting in the outbox a batch at a time, removing each once it is up
+        to date.  Documents that fail are kept and retried later.  Returns the errors for those that failed."""
+        from app.model.index_outbox import IndexOutbox
+
+        session = self.db.create_scoped_session()
+        errors = []
+        try:
+            while True:
+                # Rows are locked until the batch is committed, and those another process is working on are
+                # skipped, so each change is only sent once however many processes are reading the outbox.
+                rows = session.query(IndexOutbox)\
+                    .filter(or_(IndexOutbox.retry_after.is_(None), IndexOutbox.retry_after <= func.now()))\
+                    .order_by(IndexOutbox.last_updated).limit(self.batch_size)\
+                    .with_for_update(skip_locked=True).all()
+                if not rows:
+                    return errors
+                try:
+                    batch_errors = self.synchronize({(r.table_name, r.document_id) for r in rows}, refresh=refresh)
+                    failed_ids = {item.get('_id') for error in batch_errors for item in error.values()}
+                except Exception as e:
+                    self.logger.error("Failed to synchronize %i search documents: %s" % (len(rows), str(e)))
+                    batch_errors = [{'error': str(e)}]
+                    failed_ids = {self._document_id(r) for r in rows}
+                errors.extend(batch_errors)
+
+                # A document changed again while it was being synchronized has a new version, and stays.
+                done = [(r.table_name, r.document_id, r.version) for r in rows
+                        if self._document_id(r) not in failed_ids]
+                if done:
+                    session.query(IndexOutbox)\
+                        .filter(tuple_(IndexOutbox.table_name, IndexOutbox.document_id, IndexOutbox.version).in_(done))\
+                        .delete(synchronize_session=False)
+                for row in rows:
+                    if self._document_id(row) in failed_ids:
+                        retry_after = func.now() + datetime.timedelta(seconds=self._retry_delay(row.attempts))
+                        session.query(IndexOutbox)\
+                            .filter_by(table_name=row.table_name, document_id=row.document_id, version=row.version)\
+                            .update({'attempts': row.attempts + 1, 'retry_after': retry_after},
+                                    synchronize_session=False)
+                session.commit()
+                if len(rows) < self.batch_size:
+                    return errors
+        finally:
+            session.remove()
+
+    def _retry_delay(self, attempts):
+        return min(self.interval_seconds * 2 ** attempts, self.max_retry_seconds)
+
+    @staticmethod
+    def _document_id(row):
+        # The id of the row's document in the search index, see ElasticIndex._get_id.
+        return '%s_%s' % (row.table_name.lower(), row.document_id)
+
+    def synchronize(self, changes, refresh=False):
+        """Given a set of (table name, id) pairs, indexes the records that still exist and removes those that
+        don't, loading them in a separate session so this is safe to call outside of a request."""
+        from app.model.category import Category
+        from app.model.resource import Resource
+        from app.model.resource_category import ResourceCategory
+        from app.model.study import Study
+        from app.model.study_category import StudyCategory
+
+        changes = list(changes)
+        session = self.db.create_scoped_session()
+        errors = []
+        try:
+            for i in range(0, len(changes), self.batch_size):
+                batch = changes[i:i + self.batch_size]
+                resource_ids = [c[1] for c in batch if c[0] != Study.__tablename__]
+                study_ids = [c[1] for c in batch if c[0] == Study.__tablename__]
+                documents = []
+                if resource_ids:
+                    documents.extend(session.query(Resource)
+                                     .with_polymorphic('*')
+                                     .options(selectinload(Resource.categories)
+                                              .joinedload(ResourceCategory.category)
+                                              .lazyload(Category.children))
+                                     .filter(Resource.id.in_(resource_ids))
+                                     .all())
+                if study_ids:
+                    documents.extend(session.query(Study)
+                                     .options(selectinload(Study.categories)
+                                              .joinedload(StudyCategory.category)
+                                              .lazyload(Category.children))
+                                     .filter(Study.id.in_(study_ids))
+                                     .all())
+
+                found = {(d.__tablename__, d.id) for d in documents}
+                removed_ids = ['%s_%s' % (table, id) for table, id in batch if (table, id) not in found]
+                errors.extend(self.elastic_index.sync_documents(documents, removed_ids, refresh=refresh))
+            return errors
+        finally:
+            session.remove()
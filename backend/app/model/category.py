@@ -1,4 +1,6 @@
-from sqlalchemy import func
+from sqlalchemy import func, event, select, inspect
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app import db
 
@@ -10,6 +12,10 @@ class Category(db.Model):
     parent_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=True)
     last_updated = db.Column(db.DateTime(timezone=True), default=func.now())
     display_order = db.Column(db.Integer, nullable=True)
+    # The ids of this category and all its ancestors, from the top down, ie "1,5,9", along with its depth.
+    # Both are maintained by the listeners below whenever a category is added or moved.
+    path = db.Column(db.String, nullable=True)
+    level = db.Column(db.Integer, nullable=True)
     children = db.relationship("Category",
                                backref=db.backref('parent', remote_side=[id]),
                                lazy="joined",
@@ -17,8 +23,17 @@ class Category(db.Model):
                                order_by="Category.display_order,Category.name")
     hit_count = 0  # when returning categories in the context of a search.
 
+    __table_args__ = (
+        db.Index('ix_category_path', 'path', postgresql_ops={'path': 'varchar_pattern_ops'}),
+    )
+
     def calculate_level(self):
-        """Provide the depth of the category """
+        """Provide the depth of the category within the taxonomy, where top level categories are 0."""
+        if self.level is not None:
+            return self.level
+        if self.path is not None:
+            return self.path.count(',')
+        # Categories that have not been saved yet.
         level = 0
         cat = self
         while cat.parent and isinstance(cat, Category):
@@ -26,22 +41,105 @@ class Category(db.Model):
             cat = cat.parent
         return level
 
+    def search_level(self):
+        """The level of the category in search results.  Searches place the whole taxonomy beneath an unsaved
+        "Topics" category at level 0, so every category in it is one level deeper than calculate_level."""
+        if self.id is None:
+            return 0
+        return self.calculate_level() + 1
+
     # Returns an array of paths that should be used to search for
     # this category. , for instance "animals,cats,smelly-cats" would return
     # an array of three paths: ["animal", "animal,cats" and "animal,cats,smelly-cats"
     # but using the id of the category, not the name.
     def all_search_paths(self):
-        cat = self
-        paths = [cat.search_path()]
-        while cat.parent:
-            cat = cat.parent
-            paths.append(cat.search_path())
-        return paths
+        ids = self.search_path().split(',')
+        return [','.join(ids[:i]) for i in range(len(ids), 0, -1)]
 
     def search_path(self):
+        if self.path is not None:
+            return self.path
         cat = self
         path = str(cat.id)
         while cat.parent and cat.parent.id:
             cat = cat.parent
             path = str(cat.id) + "," + path
         return path
+
+    def subtree_filter(self):
+        """A filter matching this category and every category beneath it, in a single query."""
+        return db.or_(Category.id == self.id, Category.path.like(self.search_path() + ',%'))
+
+    @staticmethod
+    def all_search_paths_by_id(categories):
+        """Given a list of categories, returns a dictionary of category id to all_search_paths(),
+        so it can be calculated once for a large batch of documents."""
+        return {c.id: c.all_search_paths() for c in categories}
+
+
+def _materialize_path(connection, category):
+    """Calculates the path and level of the category from those of its parent, and stores them.  A category
+    whose parent can't be found is placed at the top of the taxonomy."""
+    table = Category.__table__
+    path, level = str(category.id), 0
+    if category.parent_id is not None:
+        parent = connection.execute(select([table.c.path, table.c.level])
+                                    .where(table.c.id == category.parent_id)).first()
+        if parent is not None and parent.path is not None:
+            path, level = parent.path + ',' + path, parent.level + 1
+    connection.execute(table.update().where(table.c.id == category.id).values(path=path, level=level))
+    set_committed_value(category, 'path', path)
+    set_committed_value(category, 'level', level)
+    return path, level
+
+
+@event.listens_for(Category, 'after_insert')
+def _category_inserted(mapper, connection, target):
+    _materialize_path(connection, target)
+
+
+@event.listens_for(Category, 'after_update')
+def _category_updated(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if not (attrs.parent_id.history.has_changes() or attrs.parent.history.has_changes()):
+        return
+    old_path, old_level = target.path, target.level
+    new_path, new_level = _materialize_path(connection, target)
+    if old_path is None:
+        return
+    # Move everything beneath the category along with it.
+    table = Category.__table__
+    connection.execute(table.update()
+                       .where(table.c.path.like(old_path + ',%'))
+                       .values(path=func.concat(new_path, func.substr(table.c.path, len(old_path) + 1)),
+                               level=table.c.level + (new_level - old_level)))
+    _move_loaded_descendants(target, old_path + ',', new_path + ',', new_level - old_level)
+
+
+@event.listens_for(Category, 'after_delete')
+def _category_deleted(mapper, connection, target):
+    # The session clears the parent_id of any children it knows of, leaving them at the top of the taxonomy.
+    # Those the update listener above hasn't already moved are moved up here, along with everything beneath.
+    if target.path is None:
+        return
+    table = Category.__table__
+    connection.execute(table.update()
+                       .where(table.c.path.like(target.path + ',%'))
+                       .values(path=func.substr(table.c.path, len(target.path) + 2),
+                               level=table.c.level - (target.level + 1)))
+    _move_loaded_descendants(target, target.path + ',', '', -(target.level + 1))
+
+
+def _move_loaded_descendants(target, old_prefix, new_prefix, level_change):
+    """The listeners above move a category's descendants with a single update the session doesn't see, so
+    the path and level of those it has already loaded are changed to match, as if just read back."""
+    session = object_session(target)
+    if session is None:
+        return
+    for category in list(session.identity_map.values()):
+        path = category.__dict__.get('path') if isinstance(category, Category) else None
+        if path is None or not path.startswith(old_prefix):
+            continue
+        set_committed_value(category, 'path', new_prefix + path[len(old_prefix):])
+        if category.__dict__.get('level') is not None:
+            set_committed_value(category, 'level', category.level + level_change)
@@ -0,0 +1,51 @@
+import uuid
+
+from flask_marshmallow import Schema
+from marshmallow import fields
+from sqlalchemy import func
+
+from app import db, ma
+
+
+class ExportJob(db.Model):
+    """A spreadsheet of questionnaire data, written in the background.  Jobs are kept in the database so that
+    any process serving the api can report on them.  Once complete, the file is at path."""
+    __tablename__ = 'export_job'
+    __no_export__ = True  # The files only exist on the server that wrote them.
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_COMPLETE = "complete"
+    STATUS_FAILED = "failed"
+
+    id = db.Column(db.String, primary_key=True, default=lambda: uuid.uuid4().hex)
+    name = db.Column(db.String, nullable=False)
+    user_id = db.Column(db.Integer)
+    # The ExportService.get_data_version of the exported tables when the job was started.
+    data_version = db.Column(db.String)
+    status = db.Column(db.String, nullable=False, default=STATUS_PENDING)
+    error = db.Column(db.TEXT)
+    path = db.Column(db.String)
+    date_created = db.Column(db.DateTime(timezone=True), default=func.now())
+    date_completed = db.Column(db.DateTime(timezone=True))
+    last_updated = db.Column(db.DateTime(timezone=True), default=func.now())
+
+    @property
+    def file_name(self):
+        return 'export_{}_{}.xlsx'.format(self.name, self.date_completed or self.date_created)
+
+    def is_finished(self):
+        return self.status in (ExportJob.STATUS_COMPLETE, ExportJob.STATUS_FAILED)
+
+
+class ExportJobSchema(Schema):
+    class Meta:
+        ordered = True
+        fields = ["id", "name", "user_id", "status", "error", "date_created", "date_completed", "_links"]
+
+    date_created = fields.DateTime(dump_only=True)
+    date_completed = fields.DateTime(dump_only=True)
+    _links = ma.Hyperlinks({
+        'self': ma.URLFor('api.exportjobendpoint', job_id='<id>'),
+        'download': ma.URLFor('api.exportjobdownloadendpoint', job_id='<id>'),
+    })
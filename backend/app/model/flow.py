@@ -2,43 +2,55 @@ from app.export_service import ExportService
 
 
 class Step:
+    """A questionnaire in a flow.  The steps of a flow are shared, so rather than being changed, a step is
+    copied to record that a participant completed it."""
     STATUS_COMPLETE = "COMPLETE"
     STATUS_INCOMPLETE = "INCOMPLETE"
 
-    def __init__(self, name, question_type, label):
+    __slots__ = ('name', 'type', 'label', 'status', 'date_completed', 'questionnaire_id')
+
+    def __init__(self, name, question_type, label, status=STATUS_INCOMPLETE, date_completed=None,
+                 questionnaire_id=None):
         self.name = name
         self.type = question_type
         self.label = label
-        self.status = self.STATUS_INCOMPLETE
-        self.date_completed = None
-        self.questionnaire_id = None
+        self.status = status
+        self.date_completed = date_completed
+        self.questionnaire_id = questionnaire_id
 
+    @classmethod
+    def for_questionnaire(cls, questionnaire_name):
+        questionnaire = ExportService.get_class(ExportService.camel_case_it(questionnaire_name))
+        return cls(questionnaire_name, questionnaire.__question_type__, questionnaire.__label__)
 
-class Flow:
+    def completed_by(self, step_log):
+        return Step(self.name, self.type, self.label, self.STATUS_COMPLETE, step_log.date_completed,
+                    step_log.questionnaire_id)
 
 
-    def __init__(self, name):
+class Flow:
+    """The questionnaires a participant completes, in order.  Flows are compiled once (see Flows) and shared
+    between requests, so a participant's progress is recorded on a copy made with progress()."""
+
+    def __init__(self, name, relationship="", steps=()):
         self.name = name
-        self.steps = []
-        self.relationship = ""
+        self.relationship = relationship
+        self.steps = tuple(steps)
+        self._step_index = {step.name: i for i, step in enumerate(self.steps)}
+
+    @classmethod
+    def compile(cls, name, relationship, questionnaire_names):
+        # Repeated questionnaires are only included once.
+        return cls(name, relationship, [Step.for_questionnaire(q) for q in dict.fromkeys(questionnaire_names)])
 
     def has_step(self, questionnaire_name):
-        for q in self.steps:
-            if q.name == questionnaire_name:
-                return True
-        return False
-
-    def update_step_progress(self, step_log):
-        for step in self.steps:
-            if step.name == step_log.questionnaire_name:
-                step.status = step.STATUS_COMPLETE
-                step.date_completed = step_log.date_completed
-                step.questionnaire_id = step_log.questionnaire_id
-
-    def add_step(self, questionnaireName):
-        if not self.has_step(questionnaireName):
-            class_name = ExportService.camel_case_it(questionnaireName)
-            cls = ExportService.get_class(class_name)
-            q = cls()
-            step = Step(questionnaireName, q.__question_type__, q.__label__)
-            self.steps.append(step)
+        return questionnaire_name in self._step_index
+
+    def progress(self, step_logs):
+        """A copy of this flow, with the steps in the given logs marked as complete."""
+        steps = list(self.steps)
+        for step_log in step_logs:
+            i = self._step_index.get(step_log.questionnaire_name)
+            if i is not None:
+                steps[i] = steps[i].completed_by(step_log)
+        return Flow(self.name, self.relationship, steps)
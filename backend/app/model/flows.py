@@ -4,130 +4,123 @@ from app.model.participant_relationship import Relationship
 
 class Flows:
 
-# WIP Method
+    # The name, relationship and questionnaires of every flow.  These are compiled into Flow objects the first
+    # time they are needed, and shared from then on.
+    DEFINITIONS = (
+        ("self_intake", Relationship.self_participant, (
+            'identification_questionnaire',
+            'contact_questionnaire',
+            'demographics_questionnaire',
+            'home_self_questionnaire',
+            'evaluation_history_self_questionnaire',
+            'clinical_diagnoses_questionnaire',
+            'current_behaviors_self_questionnaire',
+            'education_self_questionnaire',
+            'employment_questionnaire',
+            'supports_questionnaire',
+        )),
+        ("dependent_intake", Relationship.dependent, (
+            'identification_questionnaire',
+            'demographics_questionnaire',
+            'home_dependent_questionnaire',
+            'evaluation_history_dependent_questionnaire',
+            'clinical_diagnoses_questionnaire',
+            'developmental_questionnaire',
+            'current_behaviors_dependent_questionnaire',
+            'education_dependent_questionnaire',
+            'supports_questionnaire',
+        )),
+        ("guardian_intake", Relationship.self_guardian, (
+            'identification_questionnaire',
+            'contact_questionnaire',
+            'demographics_questionnaire',
+        )),
+        ("professional_intake", Relationship.self_professional, (
+            'identification_questionnaire',
+            'contact_questionnaire',
+            'demographics_questionnaire',
+            'professional_profile_questionnaire',
+        )),
+        ("interested_intake", Relationship.self_interested, (
+            'identification_questionnaire',
+            'contact_questionnaire',
+        )),
+        ("registration", "", (
+            'registration_questionnaire',
+        )),
+        # SkillStar Flows
+        ("skillstar", Relationship.self_professional, (
+            'chain_questionnaire',
+        )),
+    )
+
+    _flows = None
+    _by_name = {}
+    _by_relationship = {}
+
+    # WIP Method
     @staticmethod
     def parse_form():
         return ""
 
+    @staticmethod
+    def compile():
+        flows = tuple(Flow.compile(name, relationship, steps) for name, relationship, steps in Flows.DEFINITIONS)
+        by_relationship = {}
+        for flow in flows:
+            # Each relationship's intake flow is the first defined for it.
+            if flow.relationship:
+                by_relationship.setdefault(flow.relationship, flow)
+        Flows._by_name = {flow.name: flow for flow in flows}
+        Flows._by_relationship = by_relationship
+        Flows._flows = flows
+
+    @staticmethod
+    def get_all_flows():
+        if Flows._flows is None:
+            Flows.compile()
+        return list(Flows._flows)
+
+    @staticmethod
+    def get_flow_by_name(name):
+        if Flows._flows is None:
+            Flows.compile()
+        return Flows._by_name.get(name)
+
+    @staticmethod
+    def get_flow_by_relationship(name):
+        if Flows._flows is None:
+            Flows.compile()
+        return Flows._by_relationship.get(name)
+
     @staticmethod
     def get_self_intake_flow():
-        flow = Flow(name="self_intake")
-        flow.relationship = Relationship.self_participant
-        flow.add_step('identification_questionnaire')
-        flow.add_step('contact_questionnaire')
-        flow.add_step('demographics_questionnaire')
-        flow.add_step('home_self_questionnaire')
-        flow.add_step('evaluation_history_self_questionnaire')
-        flow.add_step('clinical_diagnoses_questionnaire')
-        flow.add_step('current_behaviors_self_questionnaire')
-        flow.add_step('education_self_questionnaire')
-        flow.add_step('employment_questionnaire')
-        flow.add_step('supports_questionnaire')
-        return flow
+        return Flows.get_flow_by_name("self_intake")
 
     @staticmethod
     def get_dependent_intake_flow():
-        flow = Flow(name="dependent_intake")
-        flow.relationship = Relationship.dependent
-        flow.add_step('identification_questionnaire')
-        flow.add_step('demographics_questionnaire')
-        flow.add_step('home_dependent_questionnaire')
-        flow.add_step('evaluation_history_dependent_questionnaire')
-        flow.add_step('clinical_diagnoses_questionnaire')
-        flow.add_step('developmental_questionnaire')
-        flow.add_step('current_behaviors_dependent_questionnaire')
-        flow.add_step('education_dependent_questionnaire')
-        flow.add_step('supports_questionnaire')
-        return flow
+        return Flows.get_flow_by_name("dependent_intake")
 
     @staticmethod
     def get_guardian_intake_flow():
-        flow = Flow(name="guardian_intake")
-        flow.relationship = Relationship.self_guardian
-        flow.add_step('identification_questionnaire')
-        flow.add_step('contact_questionnaire')
-        flow.add_step('demographics_questionnaire')
-        return flow
+        return Flows.get_flow_by_name("guardian_intake")
 
     @staticmethod
     def get_professional_intake_flow():
-        flow = Flow(name="professional_intake")
-        flow.relationship = Relationship.self_professional
-        flow.add_step('identification_questionnaire')
-        flow.add_step('contact_questionnaire')
-        flow.add_step('demographics_questionnaire')
-        flow.add_step('professional_profile_questionnaire')
-        return flow
+        return Flows.get_flow_by_name("professional_intake")
 
     @staticmethod
     def get_interested_intake_flow():
-        flow = Flow(name="interested_intake")
-        flow.relationship = Relationship.self_interested
-        flow.add_step('identification_questionnaire')
-        flow.add_step('contact_questionnaire')
-        return flow
+        return Flows.get_flow_by_name("interested_intake")
 
     @staticmethod
     def get_registration_flow():
-        flow = Flow(name="registration")
-        flow.add_step('registration_questionnaire')
-        return flow
+        return Flows.get_flow_by_name("registration")
 
-    # SkillStar Flows
     @staticmethod
     def get_skillstar_flow():
-        flow = Flow(name="skillstar")
-        flow.relationship = Relationship.self_professional
-        flow.add_step('chain_questionnaire')
-        return flow
+        return Flows.get_flow_by_name("skillstar")
 
     @staticmethod
     def get_skillstar_flows():
-        flows = [
-            Flows.get_skillstar_flow(),
-        ]
-        return flows
-
-    @staticmethod
-    def get_all_flows():
-        flows = [
-            Flows.get_self_intake_flow(),
-            Flows.get_dependent_intake_flow(),
-            Flows.get_guardian_intake_flow(),
-            Flows.get_professional_intake_flow(),
-            Flows.get_interested_intake_flow(),
-            Flows.get_registration_flow(),
-            Flows.get_skillstar_flow(),
-        ]
-        return flows
-
-    @staticmethod
-    def get_flow_by_name(name):
-        if name == 'self_intake':
-            return Flows.get_self_intake_flow()
-        if name == 'dependent_intake':
-            return Flows.get_dependent_intake_flow()
-        if name == 'guardian_intake':
-            return Flows.get_guardian_intake_flow()
-        if name == 'professional_intake':
-            return Flows.get_professional_intake_flow()
-        if name == 'interested_intake':
-            return Flows.get_interested_intake_flow()
-        if name == 'registration':
-            return Flows.get_registration_flow()
-        if name == 'skillstar':
-            return Flows.get_skillstar_flow()
-
-    @staticmethod
-    def get_flow_by_relationship(name):
-        if name == Relationship.self_participant:
-            return Flows.get_self_intake_flow()
-        if name == Relationship.dependent:
-            return Flows.get_dependent_intake_flow()
-        if name == Relationship.self_guardian:
-            return Flows.get_guardian_intake_flow()
-        if name == Relationship.self_professional:
-            return Flows.get_professional_intake_flow()
-        if name == Relationship.self_interested:
-            return Flows.get_interested_intake_flow()
-
+        return [Flows.get_skillstar_flow()]
@@ -0,0 +1,18 @@
+from sqlalchemy import func
+
+from app import db
+
+
+class IndexOutbox(db.Model):
+    """A search document waiting to be brought up to date in Elasticsearch, see IndexSyncService.  Rows are
+    written in the same transaction as the change to the document, and only removed once it has been
+    synchronized, so changes aren't lost if the process stops or Elasticsearch can't be reached."""
+    __tablename__ = 'index_outbox'
+    __no_export__ = True  # Only meaningful to this server's search index.
+    table_name = db.Column(db.String, primary_key=True)
+    document_id = db.Column(db.Integer, primary_key=True)
+    # Counts the changes made to the document while it waits, so a change made during synchronization is kept.
+    version = db.Column(db.Integer, nullable=False, default=1)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    retry_after = db.Column(db.DateTime(timezone=True))
+    last_updated = db.Column(db.DateTime(timezone=True), default=func.now())
@@ -2,8 +2,6 @@ from sqlalchemy import func
 from sqlalchemy.ext.hybrid import hybrid_property
 
 from app import db
-from app.model.step_log import StepLog
-from app.model.flows import Flows
 from app.model.participant_relationship import Relationship
 
 
@@ -37,16 +35,5 @@ class Participant(db.Model):
             return ""
 
     def get_percent_complete(self):
-        flow = Flows.get_flow_by_relationship(self.relationship)
-        step_logs = db.session.query(StepLog)\
-            .filter(StepLog.participant_id == self.id)\
-            .filter(StepLog.flow == flow.name).all()
-        complete_steps = 0
-        for log in step_logs:
-            flow.update_step_progress(log)
-
-        for step in flow.steps:
-            if step.status == step.STATUS_COMPLETE:
-                complete_steps += 1
-
-        return complete_steps / len(flow.steps)
+        from app.participant_progress import participant_progress  # Imported here, as it depends on this class.
+        return participant_progress.percent_complete(self)
@@ -24,7 +24,7 @@ class Search:
                         ['english', 'spanish', 'chinese', 'korean', 'vietnamese', 'arabic', 'tagalog']))
 
     def __init__(self, words="", types=None, ages=None, languages=None, start=0, size=10, sort=None, category=None, date=None,
-                 map_data_only=False, geo_point = None, geo_box = None):
+                 map_data_only=False, geo_point = None, geo_box = None, zoom=None):
         self.words = words
         self.total = 0
         self.hits = []
@@ -41,6 +41,8 @@ class Search:
         self.date = date
         self.map_data_only = map_data_only  # When we should return a limited set of details just for mapping.
         self.geo_box = geo_box
+        self.zoom = zoom  # The zoom level of the map, when map results should be clustered.
+        self.clusters = []
 
     # Method called when updating a search with fresh results.
     # This should zero-out any existing data that should be overwritten.
@@ -49,8 +51,26 @@ class Search:
         self.age_counts = Search.known_age_counts()
         self.language_counts = Search.known_language_counts()
         self.hits = []
+        self.clusters = []
         self.total = 0
 
+    # A canonical, hashable representation of everything that affects the results of this search, so
+    # equivalent searches can share cached results regardless of the order their filters were given in.
+    def cache_key(self):
+        sort = None if self.sort is None else \
+            (self.sort.field, self.sort.latitude, self.sort.longitude, self.sort.order, self.sort.unit)
+        geo_box = None if self.geo_box is None else \
+            (self.geo_box.top_left.lat, self.geo_box.top_left.lon,
+             self.geo_box.bottom_right.lat, self.geo_box.bottom_right.lon)
+        return (self.words or '',
+                tuple(sorted(set(self.types))),
+                tuple(sorted(set(self.ages))),
+                tuple(sorted(set(self.languages))),
+                self.start, self.size, sort,
+                self.category.id if self.category else None,
+                self.date.isoformat() if self.date else None,
+                geo_box, bool(self.map_data_only), self.zoom)
+
     def add_aggregation(self, field, value, count, is_selected):
         if field == 'ages':
             try:
@@ -142,3 +162,13 @@ class MapHit:
         self.longitude = longitude
         self.type = doc_type
         self.no_address = no_address
+
+
+class MapCluster:
+
+    def __init__(self, geohash, latitude, longitude, count, hit=None):
+        self.geohash = geohash
+        self.latitude = latitude
+        self.longitude = longitude
+        self.count = count
+        self.hit = hit  # The MapHit itself, when it is alone in the cluster.
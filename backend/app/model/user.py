@@ -2,7 +2,7 @@ import datetime
 import re
 
 import jwt
-from sqlalchemy import func, select, case, text
+from sqlalchemy import func, select, case, text, event, DDL
 from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
 from sqlalchemy.orm import column_property
 
@@ -37,6 +37,13 @@ class User(db.Model):
     token = ''
     token_url = ''
 
+    # A trigram index, so that the admin user search can match any part of an email address without reading
+    # every user.
+    __table_args__ = (
+        db.Index('ix_stardrive_user_email_trgm', 'email', postgresql_using='gin',
+                 postgresql_ops={'email': 'gin_trgm_ops'}),
+    )
+
     def related_to_participant(self, participant_id):
         for p in self.participants:
             if participant_id == p.id:
@@ -126,3 +133,8 @@ class User(db.Model):
     def percent_self_registration_complete(self):
         self_participant = self.self_participant()
         return 0 if self_participant is None else self_participant.get_percent_complete()
+
+
+# The trigram index needs the pg_trgm extension in place before the table is created.
+event.listen(User.__table__, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
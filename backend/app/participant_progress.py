@@ -0,0 +1,78 @@
+from itertools import chain
+
+from sqlalchemy import inspect
+
+from app import app, db
+from app.cache import TimedCache, invalidate_on_commit
+from app.model.flows import Flows
+from app.model.participant import Participant
+from app.model.step_log import StepLog
+
+
+class ParticipantProgress:
+    """How much of their intake flow each participant has completed, as a fraction of the steps in the flow.
+    Progress for any number of participants is worked out with one query over the step log, and cached for
+    each participant until a transaction that logs a step for them, or changes their relationship, commits.
+    Entries last for ttl_seconds, to pick up steps logged by other processes."""
+
+    def __init__(self, max_size, ttl_seconds):
+        self.cache = TimedCache(max_size=max_size, ttl_seconds=ttl_seconds)
+
+    def percent_complete(self, participant):
+        return self.percent_complete_for([participant])[participant.id]
+
+    def percent_complete_for(self, participants):
+        """Returns a dictionary of participant id to the fraction of their flow that is complete."""
+        progress = {}
+        missing = {}
+        for participant in participants:
+            percent = self.cache.get(participant.id)
+            if percent is None:
+                missing[participant.id] = participant.relationship
+            else:
+                progress[participant.id] = percent
+        if missing:
+            completed = {participant_id: set() for participant_id in missing}
+            rows = db.session.query(StepLog.participant_id, StepLog.flow, StepLog.questionnaire_name)\
+                .filter(StepLog.participant_id.in_(list(missing)))\
+                .distinct()
+            for participant_id, flow, questionnaire_name in rows:
+                completed[participant_id].add((flow, questionnaire_name))
+            for participant_id, relationship in missing.items():
+                flow = Flows.get_flow_by_relationship(relationship)
+                steps = flow.steps if flow else ()
+                done = sum(1 for step in steps if (flow.name, step.name) in completed[participant_id])
+                percent = done / len(steps) if steps else 0
+                self.cache.set(participant_id, percent)
+                progress[participant_id] = percent
+        return progress
+
+    def invalidate(self, participant_ids=None):
+        """Forgets the progress of the given participants, or of everyone."""
+        if participant_ids is None:
+            self.cache.clear()
+            return
+        for participant_id in participant_ids:
+            self.cache.delete(participant_id)
+
+
+participant_progress = ParticipantProgress(max_size=app.config['PARTICIPANT_PROGRESS_CACHE_MAX_SIZE'],
+                                           ttl_seconds=app.config['PARTICIPANT_PROGRESS_CACHE_TTL_SECONDS'])
+
+
+def _participants_changed(session):
+    """The ids of the participants whose progress may have changed in the flush."""
+    changed = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, StepLog):
+            changed.add(obj.participant_id)
+            history = inspect(obj).attrs.participant_id.history
+            changed.update(history.deleted or ())
+        elif isinstance(obj, Participant) and (obj in session.deleted or
+                                               inspect(obj).attrs.relationship.history.has_changes()):
+            changed.add(obj.id)
+    return changed
+
+
+invalidate_on_commit(db.session, (StepLog, Participant), participant_progress.invalidate,
+                     changes=_participants_changed)
@@ -0,0 +1,101 @@
+import time
+
+import jwt
+from flask import g
+from sqlalchemy import inspect
+
+from app import app, db
+from app.cache import TimedCache, invalidate_on_commit
+from app.model.participant import Participant
+from app.model.user import User
+
+
+class Principal:
+    """Who is making a request, and what they are allowed to do, without the rest of the user's record."""
+
+    def __init__(self, id, role, participant_ids=(), expires=None):
+        self.id = id
+        self.role = role
+        self.participant_ids = frozenset(participant_ids)
+        self.expires = expires
+
+    @classmethod
+    def for_user(cls, user):
+        return cls(user.id, user.role, [p.id for p in user.participants])
+
+    def permissions(self):
+        return self.role.permissions() if self.role else []
+
+    def related_to_participant(self, participant_id):
+        return participant_id in self.participant_ids
+
+
+class PrincipalCache:
+    """The principal for each recently used token, so that checking who a request is from and what they may do
+    doesn't go to the database.  Cleared when a transaction that changes a user's role, or the participants
+    they are related to, commits.  Entries last for ttl_seconds, to pick up changes made by other processes,
+    and never longer than the token itself."""
+
+    def __init__(self, max_size, ttl_seconds):
+        self.cache = TimedCache(max_size=max_size, ttl_seconds=ttl_seconds)
+
+    def get(self, token):
+        """Returns the principal for a token, raising a RestException if the token is invalid or expired."""
+        principal = self.cache.get(token)
+        if principal is not None and principal.expires > time.time():
+            return principal
+        user_id = User.decode_auth_token(token)
+        user = db.session.query(User).filter_by(id=user_id).first()
+        if user is None:
+            return None
+        principal = Principal.for_user(user)
+        principal.expires = jwt.decode(token, options={"verify_signature": False})['exp']
+        self.cache.set(token, principal)
+        return principal
+
+    def forget(self, token):
+        # Only forgotten by this process.  Others accept a token that has been logged out of until their
+        # cached principal for it expires, at most ttl_seconds later.
+        self.cache.delete(token)
+
+    def invalidate(self):
+        self.cache.clear()
+
+
+principal_cache = PrincipalCache(max_size=app.config['PRINCIPAL_CACHE_MAX_SIZE'],
+                                 ttl_seconds=app.config['PRINCIPAL_CACHE_TTL_SECONDS'])
+
+
+def current_principal():
+    """The principal for the logged in user, or None."""
+    principal = g.get('principal')
+    if principal is None and g.get('user') is not None:
+        # Logged in during this request, rather than with a token.
+        principal = Principal.for_user(g.user)
+    return principal
+
+
+def current_user():
+    """The User record of whoever is logged in, or None.  Requests authenticated with a token only have a
+    principal, so the user is loaded from the database the first time it is asked for."""
+    if g.get('user') is None and g.get('principal') is not None:
+        user = db.session.query(User).filter_by(id=g.principal.id).first()
+        if user is not None:
+            user.token_url = ''
+        g.user = user
+    return g.get('user')
+
+
+def _principals_changed(session):
+    """True if the flush deleted a user or participant, related a participant to a user, or changed a role."""
+    if any(isinstance(obj, (User, Participant)) for obj in session.deleted) or \
+            any(isinstance(obj, Participant) for obj in session.new):
+        return True
+    return any(isinstance(obj, User) and inspect(obj).attrs.role.history.has_changes() or
+               isinstance(obj, Participant) and (inspect(obj).attrs.user_id.history.has_changes() or
+                                                 inspect(obj).attrs.user.history.has_changes())
+               for obj in session.dirty)
+
+
+invalidate_on_commit(db.session, (User, Participant), lambda changed: principal_cache.invalidate(),
+                     changes=_principals_changed)
@@ -8,6 +8,7 @@ from sqlalchemy import func
 from app import app, RestException, db, auth, email_service, session
 from app.model.email_log import EmailLog
 from app.model.user import User
+from app.principal_cache import principal_cache
 from flask import g, request, Blueprint, jsonify
 
 from app.schema.schema import UserSchema
@@ -115,18 +116,17 @@ def reset_password():
 
 @auth.verify_token
 def verify_token(token):
+    # Only who the user is and what they may do is looked up here, g.user is loaded if it is used.
     try:
-        resp = User.decode_auth_token(token)
-        if resp:
-            g.user = session.query(User).filter_by(id=resp).first()
+        principal = principal_cache.get(token)
     except:
-        g.user = None
+        principal = None
 
-    if 'user' in g and g.user:
-        g.user.token_url = ''
-        return True
-    else:
+    if principal is None:
+        g.user = None
         return False
+    g.principal = principal
+    return True
 
 
 def login_optional(f):
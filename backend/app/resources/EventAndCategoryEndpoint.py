@@ -3,7 +3,7 @@ flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
 import flask_restful
 from flask import request
 
-from app import db, RestException, elastic_index
+from app import db, RestException, index_sync
 from app.model.category import Category
 from app.model.event import Event
 from app.model.resource_category import ResourceCategory
@@ -42,13 +42,14 @@ class CategoryByEventEndpoint(flask_restful.Resource):
             item['resource_id'] = event_id
 
         event_categories = self.schema.load(data=request_data, session=db.session, many=True)
+        event = db.session.query(Event).filter_by(id=event_id).first()
+        if event is None: raise RestException(RestException.NOT_FOUND)
+        index_sync.mark_changed(event)
         db.session.query(ResourceCategory).filter_by(resource_id=event_id).delete()
         for c in event_categories:
             db.session.add(ResourceCategory(resource_id=event_id,
                            category_id=c.category_id, type='event'))
         db.session.commit()
-        instance = db.session.query(Event).filter_by(id=event_id).first()
-        elastic_index.update_document(instance, 'Event', latitude=instance.latitude, longitude=instance.longitude)
         return self.get(event_id)
 
 
@@ -3,16 +3,17 @@ import datetime
 import flask.scaffold
 flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
 import flask_restful
-from flask import request, g
+from flask import request
 from marshmallow import ValidationError
 
-from app import RestException, db, elastic_index, auth
+from app import RestException, db, index_sync, auth
 from app.model.event import Event
 from app.model.event_user import EventUser
 from app.model.resource_change_log import ResourceChangeLog
 from app.model.geocode import Geocode
 from app.schema.schema import EventSchema
 from app.model.role import Permission
+from app.principal_cache import current_user
 from app.wrappers import requires_permission
 
 
@@ -34,7 +35,7 @@ class EventEndpoint(flask_restful.Resource):
         event_title = event.title
 
         if event is not None:
-            elastic_index.remove_document(event, 'Event')
+            index_sync.mark_changed(event)
 
         db.session.query(EventUser).filter_by(event_id=id).delete()
         db.session.query(Event).filter_by(id=id).delete()
@@ -62,14 +63,13 @@ class EventEndpoint(flask_restful.Resource):
         updated.last_updated = datetime.datetime.utcnow()
         db.session.add(updated)
         db.session.commit()
-        elastic_index.update_document(updated, 'Event', latitude=updated.latitude, longitude=updated.longitude)
         self.log_update(event_id=updated.id, event_title=updated.title, change_type='edit')
         return self.schema.dump(updated)
 
     @staticmethod
     def log_update(event_id, event_title, change_type):
-        log = ResourceChangeLog(resource_id=event_id, resource_title=event_title, user_id=g.user.id,
-                                user_email=g.user.email, type=change_type)
+        log = ResourceChangeLog(resource_id=event_id, resource_title=event_title, user_id=current_user().id,
+                                user_email=current_user().email, type=change_type)
         db.session.add(log)
         db.session.commit()
 
@@ -96,7 +96,6 @@ class EventListEndpoint(flask_restful.Resource):
             load_result.longitude = geocode['lng']
             db.session.add(load_result)
             db.session.commit()
-            elastic_index.add_document(load_result, 'Event', latitude=load_result.latitude, longitude=load_result.longitude)
             self.log_update(event_id=load_result.id, event_title=load_result.title, change_type='create')
             return self.eventSchema.dump(load_result)
         except ValidationError as err:
@@ -105,7 +104,7 @@ class EventListEndpoint(flask_restful.Resource):
 
     @staticmethod
     def log_update(event_id, event_title, change_type):
-        log = ResourceChangeLog(resource_id=event_id, resource_title=event_title, user_id=g.user.id,
-                                user_email=g.user.email, type=change_type)
+        log = ResourceChangeLog(resource_id=event_id, resource_title=event_title, user_id=current_user().id,
+                                user_email=current_user().email, type=change_type)
         db.session.add(log)
         db.session.commit()
@@ -1,12 +1,14 @@
 import datetime
+import gzip
 
 import flask.scaffold
 flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
 import flask_restful
-from flask import request
+from flask import request, url_for, json, make_response
 from sqlalchemy import desc
+from sqlalchemy.exc import IntegrityError
 
-from app import auth, db
+from app import app, auth, db, RestException
 from app.model.data_transfer_log import DataTransferLog, DataTransferLogDetail
 from app.model.export_info import ExportInfoSchema
 from app.model.user import User
@@ -33,9 +35,58 @@ class ExportEndpoint(flask_restful.Resource):
         if name == "admin":
             return self.get_admin()
 
-        name = ExportService.camel_case_it(name)
-        schema = ExportService.get_schema(name, many=True)
-        return schema.dump(ExportService().get_data(name, last_updated=get_date_arg()))
+        # A client that asks for the transfer format, or passes after_id or limit, gets the table a page at a
+        # time, ordered by id.  When there may be more records, the response has a Link header pointing to the
+        # next page.  Otherwise the whole table is returned, as it always has been.
+        transfer = request.accept_mimetypes.best == ExportService.TRANSFER_CONTENT_TYPE
+        after_id = request.args.get('after_id', type=int)
+        limit = request.args.get('limit', type=int)
+        page_size = None
+        if transfer or after_id is not None or limit is not None:
+            page_size = min(limit or app.config['EXPORT_PAGE_SIZE'], app.config['EXPORT_PAGE_SIZE'])
+        class_name = ExportService.camel_case_it(name)
+        schema = ExportService.get_dump_schema(class_name, many=True, exclude=('_links',) if transfer else ())
+        records = ExportService().get_data(class_name, last_updated=get_date_arg(), after_id=after_id,
+                                           limit=page_size)
+        headers = {}
+        if page_size is not None and len(records) == page_size:
+            next_url = url_for("api.exportendpoint", name=name, after=request.args.get('after'),
+                               after_id=records[-1].id, limit=limit)
+            headers['Link'] = '<%s>; rel="next"' % next_url
+        if transfer:
+            return self.transfer_response(schema.dump(records), headers)
+        return schema.dump(records), 200, headers
+
+    @staticmethod
+    def transfer_response(rows, headers):
+        body = "".join(json.dumps(row) + "\n" for row in rows).encode()
+        headers['Content-Type'] = ExportService.TRANSFER_CONTENT_TYPE
+        headers['Vary'] = 'Accept, Accept-Encoding'
+        if 'gzip' in request.accept_encodings:
+            body = gzip.compress(body, compresslevel=6)
+            headers['Content-Encoding'] = 'gzip'
+        return make_response(body, 200, headers)
+
+    @auth.login_required
+    @requires_roles(Role.admin)
+    def delete(self, name):
+        """Deletes the sensitive records with the given ids, once the mirror has a copy of them.
+        Expects a json body of the form {"ids": [1, 2, 3]}"""
+        model = ExportService.get_class(ExportService.camel_case_it(name))
+        if model is None:
+            raise RestException(RestException.NOT_FOUND)
+        if getattr(model, '__question_type__', None) != ExportService.TYPE_SENSITIVE:
+            raise RestException(RestException.PERMISSION_DENIED, 403)
+        ids = request.get_json().get('ids', [])
+        try:
+            # Deleted through the session, so that any related records are removed along with them.
+            for instance in db.session.query(model).filter(model.id.in_(ids)):
+                db.session.delete(instance)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            raise RestException(RestException.CAN_NOT_DELETE)
+        return None
 
     def get_admin(self):
         query = db.session.query(User).filter(User.role == Role.admin)
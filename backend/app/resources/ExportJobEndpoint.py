@@ -0,0 +1,44 @@
+import flask.scaffold
+flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
+import flask_restful
+from app import auth, RestException
+from app.export_job_service import export_jobs
+from app.export_xls_service import ExportXlsService
+from app.model.export_job import ExportJob, ExportJobSchema
+from app.model.role import Permission
+from app.principal_cache import current_principal
+
+
+def get_job(job_id):
+    # Exports for a single user need the same permission as the synchronous export of that user's data.
+    job = export_jobs.get(job_id)
+    if job is None:
+        raise RestException(RestException.NOT_FOUND)
+    permission = Permission.user_detail_admin if job.user_id else Permission.data_admin
+    if permission not in current_principal().permissions():
+        raise RestException(RestException.PERMISSION_DENIED, 403)
+    return job
+
+
+class ExportJobEndpoint(flask_restful.Resource):
+
+    schema = ExportJobSchema()
+
+    @auth.login_required
+    def get(self, job_id):
+        return self.schema.dump(get_job(job_id))
+
+
+class ExportJobDownloadEndpoint(flask_restful.Resource):
+
+    @auth.login_required
+    def get(self, job_id):
+        job = get_job(job_id)
+        if job.status != ExportJob.STATUS_COMPLETE:
+            raise RestException(RestException.EXPORT_NOT_READY, details=job.error)
+        try:
+            output = open(job.path, 'rb')
+        except OSError:
+            # The job was removed to make room for newer ones.
+            raise RestException(RestException.NOT_FOUND)
+        return ExportXlsService.xls_response(output, job.file_name)
@@ -3,7 +3,7 @@ import datetime
 import flask.scaffold
 flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
 import flask_restful
-from flask import request, g
+from flask import request
 from marshmallow import ValidationError
 
 from app import RestException, db, auth
@@ -12,6 +12,8 @@ from app.model.step_log import StepLog
 from app.schema.schema import FlowSchema
 from app.export_service import ExportService
 from app.model.flows import Flows
+from app.principal_cache import current_principal
+from app.resources.QuestionnaireEndpoint import meta_response
 
 
 class FlowEndpoint(flask_restful.Resource):
@@ -21,13 +23,11 @@ class FlowEndpoint(flask_restful.Resource):
     def get(self, name, participant_id):
         flow = Flows.get_flow_by_name(name)
         participant = db.session.query(Participant).filter_by(id=participant_id).first()
-        if participant is None: raise RestException(RestException.NOT_FOUND)
-        if g.user.related_to_participant(participant_id) and not g.user.role == 'Admin':
+        if participant is None or flow is None: raise RestException(RestException.NOT_FOUND)
+        if current_principal().related_to_participant(participant_id) and not current_principal().role == 'Admin':
             raise RestException(RestException.UNRELATED_PARTICIPANT)
         step_logs = db.session.query(StepLog).filter_by(participant_id=participant_id, flow=name)
-        for log in step_logs:
-            flow.update_step_progress(log)
-        return self.schema.dump(flow)
+        return self.schema.dump(flow.progress(step_logs))
 
 
 class FlowListEndpoint(flask_restful.Resource):
@@ -45,8 +45,9 @@ class FlowQuestionnaireMetaEndpoint(flask_restful.Resource):
         if flow is None:
             raise RestException(RestException.NOT_FOUND)
         class_ref = ExportService.get_class(questionnaire_name)
-        questionnaire = class_ref()
-        return ExportService.get_meta(questionnaire, flow.relationship)
+        if class_ref is None:
+            raise RestException(RestException.NOT_FOUND)
+        return meta_response(*ExportService.get_cached_meta(class_ref, flow.relationship))
     #        return schema.dump(questionnaire)
 
 
@@ -60,7 +61,7 @@ class FlowQuestionnaireEndpoint(flask_restful.Resource):
         if not flow.has_step(questionnaire_name):
             raise RestException(RestException.NOT_IN_THE_FLOW)
         request_data = request.get_json()
-        request_data["user_id"] = g.user.id
+        request_data["user_id"] = current_principal().id
         if "_links" in request_data:
             request_data.pop("_links")
         schema = ExportService.get_schema(ExportService.camel_case_it(questionnaire_name))
@@ -73,7 +74,7 @@ class FlowQuestionnaireEndpoint(flask_restful.Resource):
         if hasattr(new_quest, 'participant_id'):
             if new_quest.participant_id is None:
                 raise RestException(RestException.INVALID_OBJECT, details="You must supply a participant id.")
-            if not g.user.related_to_participant(new_quest.participant_id):
+            if not current_principal().related_to_participant(new_quest.participant_id):
                 raise RestException(RestException.UNRELATED_PARTICIPANT)
         else:
             raise RestException(RestException.INVALID_OBJECT, details="You must supply a participant id.")
@@ -88,7 +89,7 @@ class FlowQuestionnaireEndpoint(flask_restful.Resource):
                       questionnaire_id=questionnaire.id,
                       flow=flow.name,
                       participant_id=questionnaire.participant_id,
-                      user_id=g.user.id,
+                      user_id=current_principal().id,
                       date_completed=datetime.datetime.utcnow(),
                       time_on_task_ms=questionnaire.time_on_task_ms)
         db.session.add(log)
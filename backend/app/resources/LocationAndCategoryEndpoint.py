@@ -3,7 +3,7 @@ flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
 import flask_restful
 from flask import request
 
-from app import db, RestException, elastic_index
+from app import db, RestException, index_sync
 from app.model.category import Category
 from app.model.location import Location
 from app.model.resource_category import ResourceCategory
@@ -42,13 +42,14 @@ class CategoryByLocationEndpoint(flask_restful.Resource):
             item['resource_id'] = location_id
 
         location_categories = self.schema.load(request_data, many=True)
+        location = db.session.query(Location).filter_by(id=location_id).first()
+        if location is None: raise RestException(RestException.NOT_FOUND)
+        index_sync.mark_changed(location)
         db.session.query(ResourceCategory).filter_by(resource_id=location_id).delete()
         for c in location_categories:
             db.session.add(ResourceCategory(resource_id=location_id,
                            category_id=c.category_id, type='location'))
         db.session.commit()
-        instance = db.session.query(Location).filter_by(id=location_id).first()
-        elastic_index.update_document(instance, 'Location', latitude=instance.latitude, longitude=instance.longitude)
         return self.get(location_id)
 
 
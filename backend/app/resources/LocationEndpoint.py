@@ -3,16 +3,17 @@ import datetime
 import flask.scaffold
 flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
 import flask_restful
-from flask import request, g
+from flask import request
 from marshmallow import ValidationError
 
-from app import RestException, db, elastic_index, auth
+from app import RestException, db, index_sync, auth
 from app.model.event import Event
 from app.model.location import Location
 from app.model.resource_change_log import ResourceChangeLog
 from app.model.geocode import Geocode
 from app.schema.schema import LocationSchema
 from app.model.role import Permission
+from app.principal_cache import current_user
 from app.wrappers import requires_permission
 
 
@@ -33,7 +34,7 @@ class LocationEndpoint(flask_restful.Resource):
         location_title = location.title
 
         if location is not None:
-            elastic_index.remove_document(location, 'Location')
+            index_sync.mark_changed(location)
 
         db.session.query(Event).filter_by(id=id).delete()
         db.session.query(Location).filter_by(id=id).delete()
@@ -63,14 +64,13 @@ class LocationEndpoint(flask_restful.Resource):
         updated.last_updated = datetime.datetime.utcnow()
         db.session.add(updated)
         db.session.commit()
-        elastic_index.update_document(updated, 'Location', latitude=updated.latitude, longitude=updated.longitude)
         self.log_update(location_id=updated.id, location_title=updated.title, change_type='edit')
         return self.schema.dump(updated)
 
     @staticmethod
     def log_update(location_id, location_title, change_type):
-        log = ResourceChangeLog(resource_id=location_id, resource_title=location_title, user_id=g.user.id,
-                                user_email=g.user.email, type=change_type)
+        log = ResourceChangeLog(resource_id=location_id, resource_title=location_title, user_id=current_user().id,
+                                user_email=current_user().email, type=change_type)
         db.session.add(log)
         db.session.commit()
 
@@ -97,7 +97,6 @@ class LocationListEndpoint(flask_restful.Resource):
             load_result.longitude = geocode['lng']
             db.session.add(load_result)
             db.session.commit()
-            elastic_index.add_document(load_result, 'Location', latitude=load_result.latitude, longitude=load_result.longitude)
             self.log_update(location_id=load_result.id, location_title=load_result.title, change_type='create')
             return self.locationSchema.dump(load_result)
         except ValidationError as err:
@@ -106,7 +105,7 @@ class LocationListEndpoint(flask_restful.Resource):
 
     @staticmethod
     def log_update(location_id, location_title, change_type):
-        log = ResourceChangeLog(resource_id=location_id, resource_title=location_title, user_id=g.user.id,
-                                user_email=g.user.email, type=change_type)
+        log = ResourceChangeLog(resource_id=location_id, resource_title=location_title, user_id=current_user().id,
+                                user_email=current_user().email, type=change_type)
         db.session.add(log)
         db.session.commit()
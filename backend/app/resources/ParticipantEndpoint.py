@@ -3,7 +3,7 @@ import datetime
 import flask.scaffold
 flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
 import flask_restful
-from flask import request, g
+from flask import request
 from sqlalchemy import func
 
 from app import RestException, db, auth
@@ -11,6 +11,8 @@ from app.model.participant import Participant
 from app.model.role import Role, Permission
 from app.model.user import User
 from app.schema.schema import ParticipantSchema
+from app.participant_progress import participant_progress
+from app.principal_cache import current_principal
 from app.wrappers import requires_roles, requires_permission
 
 
@@ -22,7 +24,7 @@ class ParticipantEndpoint(flask_restful.Resource):
     def get(self, id):
         model = db.session.query(Participant).filter_by(id=id).first()
         if model is None: raise RestException(RestException.NOT_FOUND)
-        if not model and (g.user.related_to_participant(model.id) and not g.user.role == Role.admin):
+        if not model and (current_principal().related_to_participant(model.id) and not current_principal().role == Role.admin):
             raise RestException(RestException.UNRELATED_PARTICIPANT)
         if model is None: raise RestException(RestException.NOT_FOUND)
         return self.schema.dump(model)
@@ -37,7 +39,7 @@ class ParticipantEndpoint(flask_restful.Resource):
     def put(self, id):
         request_data = request.get_json()
         instance = db.session.query(Participant).filter_by(id=id).first()
-        if not g.user.related_to_participant(instance.id) and not g.user.role == Role.admin:
+        if not current_principal().related_to_participant(instance.id) and not current_principal().role == Role.admin:
             raise RestException(RestException.UNRELATED_PARTICIPANT)
 
         try:
@@ -59,6 +61,7 @@ class ParticipantListEndpoint(flask_restful.Resource):
     @requires_permission(Permission.participant_admin)
     def get(self):
         participants = db.session.query(Participant).all()
+        participant_progress.percent_complete_for(participants)
         return self.schema.dump(participants)
 
 class ParticipantAdminListEndpoint(flask_restful.Resource):
@@ -74,6 +77,8 @@ class ParticipantAdminListEndpoint(flask_restful.Resource):
     @auth.login_required
     @requires_permission(Permission.participant_admin)
     def get(self):
+        participants = db.session.query(Participant).order_by(Participant.relationship).all()
+        participant_progress.percent_complete_for(participants)
         participant_list = {
             'num_self_participants': self.count_participants('self_participant'),
             'num_self_guardians': self.count_participants('self_guardian'),
@@ -85,7 +90,6 @@ class ParticipantAdminListEndpoint(flask_restful.Resource):
             'filtered_dependents': self.count_participants('dependent', filter_out_test=True),
             'filtered_self_professionals': self.count_participants('self_professional', filter_out_test=True),
             'filtered_self_interested': self.count_participants('self_interested', filter_out_test=True),
-            'all_participants': ParticipantSchema(many=True).dump(db.session.query(Participant)
-                                                                  .order_by(Participant.relationship).all(), many=True)
+            'all_participants': ParticipantSchema(many=True).dump(participants, many=True)
         }
         return participant_list
@@ -2,7 +2,7 @@ import flask.scaffold
 flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
 import flask_restful
 
-from app import db, auth
+from app import auth, RestException
 from app.export_service import ExportService
 from app.model.role import Permission
 from app.wrappers import requires_permission
@@ -21,10 +21,8 @@ class QuestionnaireByParticipantEndpoint(flask_restful.Resource):
     @auth.login_required
     @requires_permission(Permission.user_detail_admin)
     def get(self, name, participant_id):
-        class_ref = ExportService.get_class(name)
-        schema = ExportService.get_schema(name, many=True)
-        questionnaires = db.session.query(class_ref)\
-            .filter(class_ref.participant_id == participant_id)\
-            .all()
-        return schema.dump(questionnaires)
+        if ExportService.get_class(name) is None:
+            raise RestException(RestException.NOT_FOUND)
+        schema = ExportService.get_dump_schema(name, many=True)
+        return schema.dump(ExportService.iter_data(name, participant_id=participant_id))
 
@@ -4,12 +4,14 @@ flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
 import flask_restful
 import os
 
-from flask import request
+from flask import request, jsonify, json, Response, stream_with_context
 from sqlalchemy.exc import IntegrityError
 from app import app, db, RestException, auth
+from app.export_job_service import export_jobs
 from app.export_service import ExportService
 from app.export_xls_service import ExportXlsService
 from app.model.export_info import ExportInfoSchema
+from app.model.export_job import ExportJobSchema
 from app.model.role import Permission
 from app.wrappers import requires_permission
 
@@ -44,7 +46,7 @@ class QuestionnaireEndpoint(flask_restful.Resource):
         instance = db.session.query(class_ref).filter(class_ref.id == id).first()
         if instance is None:
             raise RestException(RestException.NOT_FOUND)
-        schema = ExportService.get_schema(name)
+        schema = ExportService.get_dump_schema(name)
         return schema.dump(instance)
 
     @auth.login_required
@@ -112,7 +114,7 @@ class QuestionnaireListEndpoint(flask_restful.Resource):
     def get(self, name):
         name = ExportService.camel_case_it(name)
         class_ref = ExportService.get_class(name)
-        schema = ExportService.get_schema(name, many=True)
+        schema = ExportService.get_dump_schema(name, many=True)
         questionnaires = db.session.query(class_ref).all()
         return schema.dump(questionnaires)
 
@@ -142,31 +144,30 @@ class QuestionnaireListMetaEndpoint(flask_restful.Resource):
         """
         name = ExportService.camel_case_it(name)
         class_ref = ExportService.get_class(name)
-        questionnaire = class_ref()
-        meta = {"table": {}}
-        try:
-            meta["table"]['question_type'] = questionnaire.__question_type__
-            meta["table"]["label"] = questionnaire.__label__
-        except:
-            pass  # If these fields don't exist, just keep going.
-        meta["fields"] = []
-
-        # This will move fields referenced by the field groups into the group, but will otherwise add them
-        # the base meta object if they are not contained within a group.
-        for c in questionnaire.__table__.columns:
-            if c.info:
-                c.info['name'] = c.name
-                c.info['key'] = c.name
-                meta['fields'].append(c.info)
-            elif c.type.python_type == datetime.datetime:
-                meta['fields'].append({'name': c.name, 'key': c.name, 'display_order': 0, 'type': 'DATETIME'})
-            else:
-                meta['fields'].append({'name': c.name, 'key': c.name, 'display_order': 0})
-
-        # Sort the fields
-        meta['fields'] = sorted(meta['fields'], key=lambda field: field['display_order'])
-
-        return meta
+        if class_ref is None:
+            raise RestException(RestException.NOT_FOUND)
+        return meta_response(*ExportService.get_cached_meta(class_ref))
+
+
+def meta_response(meta, etag):
+    """The meta for a questionnaire only changes when the app does, so clients can keep it for a while, and
+    ask again with the ETag to get a 304 response once that time is up."""
+    response = jsonify(meta)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['QUESTIONNAIRE_META_MAX_AGE_SECONDS']
+    return response.make_conditional(request)
+
+
+def json_array_response(schema, records):
+    """Streams the records as a json array, dumping each one as it is read from the database rather than
+    building the whole list first."""
+    def generate():
+        yield '['
+        for i, record in enumerate(records):
+            yield (',' if i else '') + json.dumps(schema.dump(record))
+        yield ']'
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 
 class QuestionnaireInfoEndpoint(flask_restful.Resource):
@@ -206,8 +207,8 @@ class QuestionnaireDataExportEndpoint(flask_restful.Resource):
     def get(self, name):
         name = ExportService.camel_case_it(name)
         if self.request_wants_json():
-            schema = ExportService.get_schema(name, many=True)
-            return schema.dump(ExportService().get_data(name))
+            schema = ExportService.get_dump_schema(name)
+            return json_array_response(schema, ExportService.iter_data(name, fields=schema.fields))
         else:
             return ExportXlsService.export_xls(name=name, app=app)
 
@@ -227,7 +228,39 @@ class QuestionnaireUserDataExportEndpoint(flask_restful.Resource):
     def get(self, name, user_id):
         name = ExportService.camel_case_it(name)
         if self.request_wants_json():
-            schema = ExportService.get_schema(name, many=True)
-            return schema.dump(ExportService().get_data(name))
+            schema = ExportService.get_dump_schema(name)
+            return json_array_response(schema, ExportService.iter_data(name, user_id=user_id, fields=schema.fields))
         else:
             return ExportXlsService.export_xls(name=name, user_id=user_id, app=app)
+
+
+class QuestionnaireDataExportJobEndpoint(flask_restful.Resource):
+
+    schema = ExportJobSchema()
+
+    @auth.login_required
+    @requires_permission(Permission.data_admin)
+    def post(self, name):
+        """
+        Starts writing a spreadsheet of the given questionnaire (or 'all' of them) in the background.
+
+        Returns: The export job, with links to check on its progress and download the finished file.
+        """
+        return self.schema.dump(submit_export_job(name)), 202
+
+
+class QuestionnaireUserDataExportJobEndpoint(flask_restful.Resource):
+
+    schema = ExportJobSchema()
+
+    @auth.login_required
+    @requires_permission(Permission.user_detail_admin)
+    def post(self, name, user_id):
+        return self.schema.dump(submit_export_job(name, user_id=int(user_id))), 202
+
+
+def submit_export_job(name, user_id=None):
+    name = ExportService.camel_case_it(name)
+    if name.lower() != 'all' and ExportService.get_class(name) is None:
+        raise RestException(RestException.NOT_FOUND)
+    return export_jobs.submit(name, user_id=user_id, base_url=request.host_url)
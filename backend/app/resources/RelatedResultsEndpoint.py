@@ -3,6 +3,7 @@ import flask.scaffold
 flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
 import flask_restful
 from flask import request, json, jsonify
+from sqlalchemy.orm import selectinload
 
 from app import elastic_index, RestException, db
 from app.model.resource import Resource
@@ -22,11 +23,13 @@ class RelatedResultsEndpoint(flask_restful.Resource):
 
     def post(self):
         request_data = request.get_json()
+        is_resource = 'resource_id' in request_data.keys()
+        item_id = request_data['resource_id'] if is_resource else request_data['study_id']
+        model = Resource if is_resource else Study
+        item = db.session.query(model).filter_by(id=item_id).first()
+        if item is None:
+            raise RestException(RestException.NOT_FOUND)
         try:
-            is_resource = 'resource_id' in request_data.keys()
-            item_id = request_data['resource_id'] if is_resource else request_data['study_id']
-            model = Resource if is_resource else Study
-            item = db.session.query(model).filter_by(id=item_id).first()
             results = elastic_index.more_like_this(item, max_hits=30)
         except elasticsearch.ElasticsearchException as e:
             raise RestException(RestException.ELASTIC_ERROR, details=json.dumps(e))
@@ -44,10 +47,26 @@ class RelatedResultsEndpoint(flask_restful.Resource):
                 if not same_resource and len(resource_ids) < max_length:
                     resource_ids.append(hit.id)
 
-        related_resources = db.session.query(Resource).filter(Resource.id.in_(resource_ids))
-        related_studies = db.session.query(Study).filter(Study.id.in_(study_ids))
+        related_resources = self.in_order(resource_ids, db.session.query(Resource)
+                                          .options(selectinload(Resource.resource_categories)
+                                                   .joinedload(ResourceCategory.category))
+                                          .filter(Resource.id.in_(resource_ids)))
+        related_studies = self.in_order(study_ids, db.session.query(Study)
+                                        .options(selectinload(Study.study_categories)
+                                                 .joinedload(StudyCategory.category),
+                                                 selectinload(Study.study_investigators)
+                                                 .joinedload(StudyInvestigator.investigator))
+                                        .filter(Study.id.in_(study_ids)))
 
         return jsonify({
             'resources': self.resourcesSchema.dump(related_resources),
             'studies': self.studiesSchema.dump(related_studies),
         })
+
+    @staticmethod
+    def in_order(ids, query):
+        """Returns the results of the query in the same order as the given ids, most relevant first."""
+        if not ids:
+            return []
+        by_id = {record.id: record for record in query}
+        return [by_id[i] for i in ids if i in by_id]
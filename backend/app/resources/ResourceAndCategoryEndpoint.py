@@ -3,7 +3,7 @@ flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
 import flask_restful
 from flask import request
 
-from app import db, RestException, elastic_index
+from app import db, RestException, index_sync
 from app.model.category import Category
 from app.model.resource import Resource
 from app.model.resource_category import ResourceCategory
@@ -42,13 +42,14 @@ class CategoryByResourceEndpoint(flask_restful.Resource):
             item['resource_id'] = resource_id
 
         resource_categories = self.schema.load(request_data, many=True)
+        resource = db.session.query(Resource).filter_by(id=resource_id).first()
+        if resource is None: raise RestException(RestException.NOT_FOUND)
+        index_sync.mark_changed(resource)
         db.session.query(ResourceCategory).filter_by(resource_id=resource_id).delete()
         for c in resource_categories:
             db.session.add(ResourceCategory(resource_id=resource_id,
                            category_id=c.category_id, type='resource'))
         db.session.commit()
-        instance = db.session.query(Resource).filter_by(id=resource_id).first()
-        elastic_index.update_document(instance, 'Resource')
         return self.get(resource_id)
 
 
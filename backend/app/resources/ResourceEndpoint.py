@@ -3,11 +3,10 @@ import datetime
 import flask.scaffold
 flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
 import flask_restful
-from flask import request, g
+from flask import request
 from marshmallow import ValidationError
-from elasticsearch import NotFoundError
 
-from app import RestException, db, elastic_index, auth
+from app import RestException, db, index_sync, auth
 from app.model.resource import Resource
 from app.model.resource_category import ResourceCategory
 from app.model.admin_note import AdminNote
@@ -17,6 +16,7 @@ from app.model.event import Event
 from app.model.location import Location
 from app.model.role import Permission
 from app.model.user_favorite import UserFavorite
+from app.principal_cache import current_user
 from app.wrappers import requires_permission
 
 
@@ -36,11 +36,7 @@ class ResourceEndpoint(flask_restful.Resource):
         resource_id = resource.id
         resource_title = resource.title
 
-        try:
-            elastic_index.remove_document(resource, 'Resource')
-        except NotFoundError:
-            pass
-
+        index_sync.mark_changed(resource)
         db.session.query(AdminNote).filter_by(resource_id=id).delete()
         db.session.query(Event).filter_by(id=id).delete()
         db.session.query(Location).filter_by(id=id).delete()
@@ -63,13 +59,12 @@ class ResourceEndpoint(flask_restful.Resource):
         updated.last_updated = datetime.datetime.utcnow()
         db.session.add(updated)
         db.session.commit()
-        elastic_index.update_document(updated, 'Resource')
         self.log_update(resource_id=updated.id, resource_title=updated.title, change_type='edit')
         return self.schema.dump(updated)
 
     def log_update(self, resource_id, resource_title, change_type):
-        log = ResourceChangeLog(resource_id=resource_id, resource_title=resource_title, user_id=g.user.id,
-                                user_email=g.user.email, type=change_type)
+        log = ResourceChangeLog(resource_id=resource_id, resource_title=resource_title, user_id=current_user().id,
+                                user_email=current_user().email, type=change_type)
         db.session.add(log)
         db.session.commit()
 
@@ -91,7 +86,6 @@ class ResourceListEndpoint(flask_restful.Resource):
             load_result = self.resourceSchema.load(request_data)
             db.session.add(load_result)
             db.session.commit()
-            elastic_index.add_document(load_result, 'Resource')
             self.log_update(resource_id=load_result.id, resource_title=load_result.title, change_type='create')
             return self.resourceSchema.dump(load_result)
         except ValidationError as err:
@@ -99,8 +93,8 @@ class ResourceListEndpoint(flask_restful.Resource):
                                 details=load_result.errors)
 
     def log_update(self, resource_id, resource_title, change_type):
-        log = ResourceChangeLog(resource_id=resource_id, resource_title=resource_title, user_id=g.user.id,
-                                user_email=g.user.email, type=change_type)
+        log = ResourceChangeLog(resource_id=resource_id, resource_title=resource_title, user_id=current_user().id,
+                                user_email=current_user().email, type=change_type)
         db.session.add(log)
         db.session.commit()
 
@@ -7,9 +7,10 @@ import flask_restful
 from flask import request, json
 from marshmallow import ValidationError
 
-from app import elastic_index, RestException, db
+from app import elastic_index, RestException
+from app.category_tree import category_tree
 from app.model.category import Category
-from app.model.search import Hit, MapHit
+from app.model.search import Hit, MapHit, MapCluster
 from app.schema.schema import SearchSchema
 
 
@@ -30,12 +31,19 @@ class SearchEndpoint(flask_restful.Resource):
             # Overwrite the result types if requested.
             if not search.types and result_types:
                 search.types = result_types
-            results = elastic_index.search(search)
+            if search.map_data_only:
+                results = elastic_index.map_search(search)
+            else:
+                results = elastic_index.search(search)
         except elasticsearch.ElasticsearchException as e:
             raise RestException(RestException.ELASTIC_ERROR, details=json.dumps(e.info))
 
         search.reset()  # zero out any existing counts or data on the search prior to populating.
-        search.total = results.hits.total
+        if search.map_data_only:
+            # Map searches only return documents with a location, but report how many matched in all.
+            search.total = results.aggregations.matched.doc_count
+        else:
+            search.total = results.hits.total
 
         if search.map_data_only:
             return self.map_data_only_search_results(search, results)
@@ -65,6 +73,17 @@ class SearchEndpoint(flask_restful.Resource):
             if hit.longitude and hit.latitude:
                 search_hit = MapHit(hit.id,  hit.type, hit.latitude, hit.longitude, hit.no_address)
                 search.hits.append(search_hit)
+
+        search.clusters = []
+        if search.zoom is not None:
+            for bucket in results.aggregations.clusters.buckets:
+                hit = None
+                if bucket.doc_count == 1:
+                    source = bucket.first.hits.hits[0]['_source']
+                    hit = MapHit(source.id, source.type, source.latitude, source.longitude,
+                                 getattr(source, 'no_address', None))
+                location = bucket.centroid.location
+                search.clusters.append(MapCluster(bucket.key, location.lat, location.lon, bucket.doc_count, hit))
         return SearchSchema().jsonify(search)
 
     def update_aggregations(self, search, aggregations):
@@ -79,22 +98,20 @@ class SearchEndpoint(flask_restful.Resource):
     # Also assures that there is a category at the top called "TOP".
     def update_category_counts(self, category, results):
         if not category:
+            # Built fresh from the cached taxonomy each time, as hit counts are particular to this search.
             category = Category(name="Topics")
-            category.children = db.session.query(Category)\
-                .filter(Category.parent_id == None)\
-                .order_by(Category.display_order)\
-                .order_by(Category.name.desc())\
-                .all()
+            category.children = [Category(id=n.id, name=n.name, display_order=n.display_order, path=n.path)
+                                 for n in category_tree.roots()]
         else:
             c = category
             while c.parent:
                 c = c.parent
             c.parent = Category(name="Topics")
 
+        counts = {bucket.key: bucket.doc_count for bucket in results.aggregations.terms.buckets}
         for child in category.children:
-            for bucket in results.aggregations.terms.buckets:
-                if bucket.key == child.search_path():
-                    child.hit_count = bucket.doc_count
+            if child.search_path() in counts:
+                child.hit_count = counts[child.search_path()]
         return category
 
     def post(self):
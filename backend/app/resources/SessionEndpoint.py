@@ -1,9 +1,10 @@
 import flask.scaffold
 flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
 import flask_restful
-from flask import g, jsonify
+from flask import g, jsonify, request
 
 from app import auth
+from app.principal_cache import principal_cache, current_user
 from app.schema.schema import UserSchema
 
 
@@ -13,14 +14,18 @@ class SessionEndpoint(flask_restful.Resource):
 
     @auth.login_required
     def get(self):
-        if "user" in g:
-            return jsonify(self.schema.dump(g.user))
+        user = current_user()
+        if user is not None:
+            return jsonify(self.schema.dump(user))
         else:
             return None
 
     @staticmethod
     def delete():
-        if "user" in g:
+        if request.headers.get('Authorization'):
+            principal_cache.forget(request.headers['Authorization'].split(' ')[-1])
+        if "user" in g or "principal" in g:
             g.user = None
+            g.principal = None
         else:
             return None
@@ -2,9 +2,10 @@ import datetime
 import flask.scaffold
 flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
 import flask_restful
-from flask import g, jsonify, request
+from flask import jsonify, request
 import jwt
 from app import app, auth
+from app.principal_cache import current_principal
 
 
 class SessionStatusEndpoint(flask_restful.Resource):
@@ -18,7 +19,7 @@ class SessionStatusEndpoint(flask_restful.Resource):
         # We don't need to send in the auth token as an argument, it is in the
         # header.
         auth_token = request.headers['AUTHORIZATION'].split(' ')[1];
-        if "user" in g and auth_token:
+        if current_principal() is not None and auth_token:
             try:
                 payload = jwt.decode(
                     auth_token,
@@ -3,7 +3,7 @@ flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
 import flask_restful
 from flask import request
 
-from app import db, RestException
+from app import db, RestException, index_sync
 from app.model.category import Category
 from app.model.study import Study
 from app.model.study_category import StudyCategory
@@ -42,6 +42,9 @@ class CategoryByStudyEndpoint(flask_restful.Resource):
             item['study_id'] = study_id
 
         study_categories = self.schema.load(request_data, many=True)
+        study = db.session.query(Study).filter_by(id=study_id).first()
+        if study is None: raise RestException(RestException.NOT_FOUND)
+        index_sync.mark_changed(study)
         db.session.query(StudyCategory).filter_by(study_id=study_id).delete()
         for c in study_categories:
             db.session.add(StudyCategory(study_id=study_id,
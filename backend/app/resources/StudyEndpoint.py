@@ -10,7 +10,7 @@ import flask_restful
 from flask import request
 from marshmallow import ValidationError
 
-from app import RestException, db, elastic_index
+from app import RestException, db, index_sync
 from app.model.study import Study
 from app.model.study_category import StudyCategory
 from app.model.study_investigator import StudyInvestigator
@@ -31,7 +31,7 @@ class StudyEndpoint(flask_restful.Resource):
         study = db.session.query(Study).filter_by(id=id).first()
 
         if study is not None:
-            elastic_index.remove_document(study, 'Study')
+            index_sync.mark_changed(study)
 
         db.session.query(StudyUser).filter_by(study_id=id).delete()
         db.session.query(StudyInvestigator).filter_by(study_id=id).delete()
@@ -50,7 +50,6 @@ class StudyEndpoint(flask_restful.Resource):
         updated.last_updated = datetime.datetime.utcnow()
         db.session.add(updated)
         db.session.commit()
-        elastic_index.update_document(updated, 'Study')
         return self.schema.dump(updated)
 
 
@@ -69,7 +68,6 @@ class StudyListEndpoint(flask_restful.Resource):
             load_result = self.studySchema.load(request_data)
             db.session.add(load_result)
             db.session.commit()
-            elastic_index.add_document(load_result, 'Study')
             return self.studySchema.dump(load_result)
         except ValidationError as err:
             raise RestException(RestException.INVALID_OBJECT,
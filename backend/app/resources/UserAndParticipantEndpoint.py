@@ -1,7 +1,7 @@
 import flask.scaffold
 flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
 import flask_restful
-from flask import request, g
+from flask import request
 from marshmallow import ValidationError
 from sqlalchemy import exc
 import re
@@ -9,6 +9,7 @@ import re
 from app import db, RestException, auth
 from app.model.participant import Participant, Relationship
 from app.model.user import User
+from app.principal_cache import current_principal
 from app.schema.schema import ParticipantSchema
 
 
@@ -19,7 +20,7 @@ class ParticipantBySessionEndpoint(flask_restful.Resource):
     @auth.login_required
     def get(self):
         participants = db.session.query(Participant).\
-            filter(Participant.user_id == g.user.id).\
+            filter(Participant.user_id == current_principal().id).\
             order_by(Participant.id).\
             all()
         return self.schema.dump(participants, many=True)
@@ -39,7 +40,7 @@ class ParticipantBySessionEndpoint(flask_restful.Resource):
             relationship = None
 
         if 'user_id' not in request_data:
-            request_data['user_id'] = g.user.id
+            request_data['user_id'] = current_principal().id
 
         user = db.session.query(User).filter(User.id == request_data['user_id']).first()
         if user.self_participant() is not None:
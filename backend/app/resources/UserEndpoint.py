@@ -1,12 +1,14 @@
 import datetime
+import math
 
 import flask.scaffold
 flask.helpers._endpoint_from_view_func = flask.scaffold._endpoint_from_view_func
 import flask_restful
-from flask import request, g
+from flask import request
 from marshmallow import ValidationError
-from sqlalchemy import exists, desc, asc, text
+from sqlalchemy import exists, desc, asc, text, and_, or_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 
 from app import app, RestException, db, email_service, auth
@@ -20,6 +22,8 @@ from app.model.user_favorite import UserFavorite
 from app.model.event_user import EventUser
 from app.model.study_user import StudyUser
 from app.schema.schema import UserSchema, UserSearchSchema
+from app.participant_progress import participant_progress
+from app.principal_cache import current_principal
 from app.wrappers import requires_permission
 
 
@@ -29,7 +33,7 @@ class UserEndpoint(flask_restful.Resource):
 
     @auth.login_required
     def get(self, id):
-        if g.user.id != eval(id) and Permission.user_detail_admin not in g.user.role.permissions():
+        if current_principal().id != eval(id) and Permission.user_detail_admin not in current_principal().permissions():
             raise RestException(RestException.PERMISSION_DENIED)
         model = db.session.query(User).filter_by(id=id).first()
         if model is None: raise RestException(RestException.NOT_FOUND)
@@ -47,11 +51,11 @@ class UserEndpoint(flask_restful.Resource):
 
     @auth.login_required
     def put(self, id):
-        if g.user.id != eval(id) and Permission.user_detail_admin not in g.user.role.permissions():
+        if current_principal().id != eval(id) and Permission.user_detail_admin not in current_principal().permissions():
             raise RestException(RestException.PERMISSION_DENIED)
         request_data = request.get_json()
         if 'role' in request_data and request_data['role'] == 'admin':
-            if g.user.role == Role.admin:
+            if current_principal().role == Role.admin:
                 request_data['role'] = 'admin'
             else:
                 request_data['role'] = 'user'
@@ -75,9 +79,12 @@ class UserListEndpoint(flask_restful.Resource):
     @auth.login_required
     @requires_permission(Permission.user_admin)
     def get(self):
+        """Returns a page of users, sorted by one of their columns and filtered by id or by part of their email
+        address.  Pages are numbered from 0 with pageNumber.  Alternatively, "after" can be given the id of the
+        last user on the previous page, to carry on from that user without skipping over every user before it."""
         args = request.args
-        pageNumber = eval(args["pageNumber"]) if ("pageNumber" in args) else 0
-        per_page = eval(args["pageSize"]) if ("pageSize" in args) else 20
+        page_number = args.get("pageNumber", 0, type=int)
+        per_page = args.get("pageSize", 20, type=int)
         query = db.session.query(User)
         if "filter" in args:
             if args["filter"].isdigit():
@@ -85,19 +92,44 @@ class UserListEndpoint(flask_restful.Resource):
             else:
                 f = '%' + args["filter"] + '%'
                 query = query.filter(User.email.ilike(f))
+        total = query.count()
 
-        sort_column = args["sort"] if ("sort" in args) else "email"
-        col = getattr(User, sort_column)
-
+        sort_column = getattr(User, args.get("sort", "email"), None)
         # FIXME: Enable sorting by function properties.
-        if isinstance(col, InstrumentedAttribute):
-            if args["sortOrder"] == "desc":
-                query = query.order_by(desc(col))
-            else:
-                query = query.order_by(col)
+        if not isinstance(sort_column, InstrumentedAttribute):
+            sort_column = User.email
+        descending = args.get("sortOrder") == "desc"
+        # Users that share a value are ordered by id, so that each has its own place in the order.
+        if descending:
+            query = query.order_by(sort_column.desc().nullslast(), User.id.desc())
+        else:
+            query = query.order_by(sort_column.asc().nullslast(), User.id)
+
+        after = args.get("after", type=int)
+        if after is not None:
+            query = query.filter(self.users_after(sort_column, after, descending))
+        else:
+            query = query.offset(page_number * per_page)
+        users = query.options(selectinload(User.participants)).limit(per_page).all()
+
+        # Work out how far each user is through registering with one query, rather than one for each user.
+        participant_progress.percent_complete_for([u.self_participant() for u in users if u.self_participant()])
+        pages = math.ceil(total / per_page) if per_page else 0
+        return self.searchSchema.dump({'pages': pages, 'total': total, 'items': users})
 
-        page = query.paginate(page=pageNumber + 1, per_page=per_page, error_out=False)
-        return self.searchSchema.dump(page)
+    @staticmethod
+    def users_after(sort_column, user_id, descending):
+        """A filter for the users that follow the given user when sorted by sort_column and then by id."""
+        row = db.session.query(sort_column).filter(User.id == user_id).first()
+        if row is None:
+            raise RestException(RestException.NOT_FOUND)
+        value = row[0]
+        later_id = User.id < user_id if descending else User.id > user_id
+        # Users without a value come last, whichever way they are sorted.
+        if value is None:
+            return and_(sort_column.is_(None), later_id)
+        later_value = sort_column < value if descending else sort_column > value
+        return or_(later_value, and_(sort_column == value, later_id), sort_column.is_(None))
 
     def post(self):
         """
@@ -21,6 +21,7 @@ class RestException(Exception):
     UNKNOWN_RELATIONSHIP = {'code': 'unknown_relationship', 'message': 'please use a pre-defined relationship'}
     STUDY_INQUIRY_ERROR = {'code': 'study_inquiry_error', 'message': 'Error in finding correct user and study to complete study inquiry'}
     INVALID_INPUT = {'code': 'invalid_input', 'message': 'Invalid input'}
+    EXPORT_NOT_READY = {'code': 'export_not_ready', 'message': 'The export has not finished yet.', 'status_code': 409}
 
     def __init__(self, payload, status_code=None, details=None):
         Exception.__init__(self)
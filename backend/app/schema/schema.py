@@ -2,9 +2,9 @@ from flask_marshmallow.sqla import SQLAlchemyAutoSchema
 from marshmallow import fields, Schema, post_load, missing
 from marshmallow.utils import EXCLUDE
 from marshmallow_enum import EnumField
-from sqlalchemy import func
 
 from app import ma, db
+from app.category_counts import category_counts
 from app.model.admin_note import AdminNote
 from app.model.category import Category
 from app.model.participant import Participant, Relationship
@@ -87,6 +87,12 @@ class ParentCategorySchema(ModelSchema):
     })
 
 
+class ParentCategoryInSearchSchema(ParentCategorySchema):
+    """Parents of the selected category in a search, numbered by their level in search results."""
+    parent = ma.Nested(lambda: ParentCategoryInSearchSchema(), dump_only=True)
+    level = fields.Function(lambda obj: obj.search_level() if isinstance(obj, Category) else 0)
+
+
 class ChildCategoryInSearchSchema(ModelSchema):
     """Children within a category have hit counts when returned as a part of a search."""
     class Meta(ModelSchema.Meta):
@@ -104,9 +110,9 @@ class CategoryInSearchSchema(ModelSchema):
         model = Category
         fields = ('id', 'name', 'children', 'parent_id', 'parent', 'level', 'display_order')
     parent_id = fields.Number(required=False, allow_none=True)
-    parent = ma.Nested(ParentCategorySchema, dump_only=True, required=False, allow_none=True)
+    parent = ma.Nested(ParentCategoryInSearchSchema, dump_only=True, required=False, allow_none=True)
     children = ma.Nested(ChildCategoryInSearchSchema, many=True, dump_only=True)
-    level = fields.Function(lambda obj: obj.calculate_level() if isinstance(obj, Category) else 0, dump_only=True)
+    level = fields.Function(lambda obj: obj.search_level() if isinstance(obj, Category) else 0, dump_only=True)
 
 
 class CategorySchema(ModelSchema):
@@ -134,42 +140,27 @@ class CategorySchema(ModelSchema):
     def get_event_count(self, obj):
         if obj is None:
             return missing
-        query = db.session.query(ResourceCategory).filter(ResourceCategory.type == 'event')\
-            .filter(ResourceCategory.category_id == obj.id)
-        count_q = query.statement.with_only_columns([func.count()]).order_by(None)
-        return query.session.execute(count_q).scalar()
+        return category_counts.get(obj.id).event
 
     def get_location_count(self, obj):
         if obj is None:
             return missing
-        query = db.session.query(ResourceCategory).filter(ResourceCategory.type == 'location')\
-            .filter(ResourceCategory.category_id == obj.id)
-        count_q = query.statement.with_only_columns([func.count()]).order_by(None)
-        return query.session.execute(count_q).scalar()
+        return category_counts.get(obj.id).location
 
     def get_resource_count(self, obj):
         if obj is None:
             return missing
-        query = db.session.query(ResourceCategory).filter(ResourceCategory.type == 'resource')\
-            .filter(ResourceCategory.category_id == obj.id)
-        count_q = query.statement.with_only_columns([func.count()]).order_by(None)
-        return query.session.execute(count_q).scalar()
+        return category_counts.get(obj.id).resource
 
     def get_all_resource_count(self, obj):
         if obj is None:
             return missing
-        query = db.session.query(ResourceCategory).join(ResourceCategory.resource)\
-            .filter(ResourceCategory.category_id == obj.id)
-        count_q = query.statement.with_only_columns([func.count()]).order_by(None)
-        return query.session.execute(count_q).scalar()
+        return category_counts.get(obj.id).all_resource
 
     def get_study_count(self, obj):
         if obj is None:
             return missing
-        query = db.session.query(StudyCategory).join(StudyCategory.study)\
-            .filter(StudyCategory.category_id == obj.id)
-        count_q = query.statement.with_only_columns([func.count()]).order_by(None)
-        return query.session.execute(count_q).scalar()
+        return category_counts.get(obj.id).study
 
 
 class CategoriesOnEventSchema(ModelSchema):
@@ -639,6 +630,13 @@ class SearchSchema(ma.Schema):
         no_address = fields.Boolean(missing=None)
         is_draft = fields.Boolean(missing=None)
 
+    class ClusterSchema(ma.Schema):
+        geohash = fields.Str()
+        latitude = fields.Float()
+        longitude = fields.Float()
+        count = fields.Integer()
+        hit = ma.Nested(lambda: SearchSchema.HitSchema(), allow_none=True)
+
     class SortSchema(ma.Schema):
         field = fields.Str(allow_null=True)
         latitude = fields.Float(missing=None)
@@ -675,10 +673,12 @@ class SearchSchema(ma.Schema):
     type_counts = fields.List(ma.Nested(AggCountSchema), dump_only=True)
     total = fields.Integer(dump_only=True)
     hits = ma.Nested(HitSchema(), many=True, dump_only=True)
+    clusters = ma.Nested(ClusterSchema(), many=True, dump_only=True)
     category = ma.Nested(CategoryInSearchSchema)
     ordered = True
     date = fields.DateTime(allow_none=True)
     map_data_only = fields.Boolean()
+    zoom = fields.Integer(allow_none=True)
     geo_box = ma.Nested(GeoboxSchema, allow_none=True, default=None)
 
 
@@ -687,10 +687,24 @@ class SearchSchema(ma.Schema):
         return Search(**data)
 
 
+class UserListSchema(ModelSchema):
+    """The columns shown in the admin list of users, without the participants, favorites and meta that
+    come with each user in UserSchema."""
+    class Meta(ModelSchema.Meta):
+        model = User
+        fields = ('id', 'last_updated', 'registration_date', 'last_login', 'email', 'role', 'participant_count',
+                  'created_password', 'identity', 'percent_self_registration_complete', 'email_verified')
+    role = EnumField(Role)
+    created_password = fields.Function(lambda obj: obj.created_password(), dump_only=True)
+    identity = fields.Function(lambda obj: obj.identity(), dump_only=True)
+    percent_self_registration_complete = fields.Function(lambda obj: obj.percent_self_registration_complete(),
+                                                         dump_only=True)
+
+
 class UserSearchSchema(ma.Schema):
     pages = fields.Integer()
     total = fields.Integer()
-    items = ma.List(ma.Nested(UserSchema))
+    items = ma.List(ma.Nested(UserListSchema))
 
 
 class StepSchema(Schema):
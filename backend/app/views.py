@@ -60,6 +60,8 @@ from app.resources.QuestionnaireEndpoint import (
     QuestionnaireListMetaEndpoint,
     QuestionnaireDataExportEndpoint,
     QuestionnaireUserDataExportEndpoint,
+    QuestionnaireDataExportJobEndpoint,
+    QuestionnaireUserDataExportJobEndpoint,
     QuestionnaireInfoEndpoint)
 from app.resources.SessionStatusEndpoint import SessionStatusEndpoint
 from app.resources.StudyAndCategoryEndpoint import (
@@ -121,6 +123,7 @@ from app.resources.ExportEndpoint import (
     ExportEndpoint,
     ExportListEndpoint
 )
+from app.resources.ExportJobEndpoint import ExportJobEndpoint, ExportJobDownloadEndpoint
 from app.resources.DataTransferLogEndpoint import DataTransferLogEndpoint
 from app.resources.ZipCodeCoordsEndpoint import ZipCodeCoordsEndpoint
 from app.resources.PasswordRequirementsEndpoint import PasswordRequirementsEndpoint
@@ -255,6 +258,10 @@ endpoints = [
     (QuestionnaireEndpoint, "/q/<string:name>/<string:id>"),
     (QuestionnaireDataExportEndpoint, "/q/<string:name>/export"),
     (QuestionnaireUserDataExportEndpoint, "/q/<string:name>/export/user/<string:user_id>"),
+    (QuestionnaireDataExportJobEndpoint, "/q/<string:name>/export_job"),
+    (QuestionnaireUserDataExportJobEndpoint, "/q/<string:name>/export_job/user/<string:user_id>"),
+    (ExportJobEndpoint, "/export_job/<string:job_id>"),
+    (ExportJobDownloadEndpoint, "/export_job/<string:job_id>/download"),
 
     # Flows
     (FlowEndpoint, "/flow/<string:name>/<string:participant_id>"),
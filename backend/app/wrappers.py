@@ -1,6 +1,7 @@
 from functools import wraps
 from app import RestException
 from flask import g
+from app.principal_cache import current_principal
 
 
 def requires_roles(*roles):
@@ -9,7 +10,7 @@ def requires_roles(*roles):
         def wrapped(*args, **kwargs):
             if "user" not in g:
                 raise RestException(RestException.PERMISSION_DENIED, 401)
-            elif g.user.role not in roles:
+            elif current_principal().role not in roles:
                 raise RestException(RestException.PERMISSION_DENIED, 403)
             return f(*args, **kwargs)
         return wrapped
@@ -22,7 +23,7 @@ def requires_permission(*permission):
         def wrapped(*args, **kwargs):
             if "user" not in g:
                 raise RestException(RestException.PERMISSION_DENIED, 401)
-            elif permission[0] not in g.user.role.permissions():
+            elif permission[0] not in current_principal().permissions():
                 raise RestException(RestException.PERMISSION_DENIED, 403)
             return f(*args, **kwargs)
         return wrapped
@@ -14,6 +14,9 @@ MASTER_PASS = "dfunk7"
 MIRRORING = False
 DELETE_RECORDS = False
 
+# Index changes as soon as they are committed, so tests can search for them right away.
+INDEX_SYNC_IMMEDIATE = True
+
 ELASTIC_SEARCH = {
     "index_prefix": "stardrive_test",
     "hosts": ["localhost"],
@@ -0,0 +1,39 @@
+"""Materialized search path and level on category
+
+Revision ID: 9d3e5c1a7b42
+Revises: 5ce71490be7b
+Create Date: 2026-10-18 09:42:11.204519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3e5c1a7b42'
+down_revision = '5ce71490be7b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('category', sa.Column('path', sa.String(), nullable=True))
+    op.add_column('category', sa.Column('level', sa.Integer(), nullable=True))
+    op.create_index('ix_category_path', 'category', ['path'], unique=False,
+                    postgresql_ops={'path': 'varchar_pattern_ops'})
+    op.execute("""
+        WITH RECURSIVE tree(id, path, level) AS (
+            SELECT id, id::text, 0 FROM category WHERE parent_id IS NULL
+            UNION ALL
+            SELECT c.id, tree.path || ',' || c.id::text, tree.level + 1
+            FROM category c JOIN tree ON c.parent_id = tree.id
+        )
+        UPDATE category SET path = tree.path, level = tree.level
+        FROM tree WHERE category.id = tree.id
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_category_path', table_name='category')
+    op.drop_column('category', 'level')
+    op.drop_column('category', 'path')
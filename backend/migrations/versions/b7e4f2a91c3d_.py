@@ -0,0 +1,26 @@
+"""Trigram index on user email
+
+Revision ID: b7e4f2a91c3d
+Revises: 9d3e5c1a7b42
+Create Date: 2026-10-18 15:20:37.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4f2a91c3d'
+down_revision = '9d3e5c1a7b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_stardrive_user_email_trgm', 'stardrive_user', ['email'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_stardrive_user_email_trgm', table_name='stardrive_user')
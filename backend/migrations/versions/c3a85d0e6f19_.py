@@ -0,0 +1,36 @@
+"""Export jobs
+
+Revision ID: c3a85d0e6f19
+Revises: b7e4f2a91c3d
+Create Date: 2026-10-18 17:05:12.648310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a85d0e6f19'
+down_revision = 'b7e4f2a91c3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('export_job',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('data_version', sa.String(), nullable=True),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('error', sa.TEXT(), nullable=True),
+    sa.Column('path', sa.String(), nullable=True),
+    sa.Column('date_created', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('date_completed', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_updated', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('export_job')
@@ -0,0 +1,32 @@
+"""Search index outbox
+
+Revision ID: d4b96e1f7a20
+Revises: c3a85d0e6f19
+Create Date: 2026-10-18 17:48:51.302177
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4b96e1f7a20'
+down_revision = 'c3a85d0e6f19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('index_outbox',
+    sa.Column('table_name', sa.String(), nullable=False),
+    sa.Column('document_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('retry_after', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_updated', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('table_name', 'document_id')
+    )
+
+
+def downgrade():
+    op.drop_table('index_outbox')
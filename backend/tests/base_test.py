@@ -12,6 +12,10 @@ from flask import json
 from flask.json import JSONEncoder
 
 from app import app, db, elastic_index
+from app.category_counts import category_counts
+from app.category_tree import category_tree
+from app.participant_progress import participant_progress
+from app.principal_cache import principal_cache
 from app.model.questionnaires.challenging_behavior import ChallengingBehavior
 from app.model.admin_note import AdminNote
 from app.model.category import Category
@@ -67,6 +71,10 @@ class BaseTest:
         self.ctx.push()
         clean_db(db)
         elastic_index.clear()
+        category_tree.invalidate()
+        category_counts.invalidate()
+        principal_cache.invalidate()
+        participant_progress.invalidate()
         self.auths = {}
 
     def tearDown(self):
@@ -2,7 +2,10 @@ import unittest
 from flask import json
 from tests.base_test import BaseTest
 from app import db
+from app.category_tree import category_tree
 from app.model.category import Category
+from app.model.resource_category import ResourceCategory
+from app.schema.schema import CategoryInSearchSchema
 
 
 class TestCategory(BaseTest, unittest.TestCase):
@@ -129,6 +132,35 @@ class TestCategory(BaseTest, unittest.TestCase):
         self.assertEqual(response["children"][0]['id'], c2.id)
         self.assertEqual(response["children"][0]['name'], "I'm the kid")
 
+    def test_category_counts_for_parent_and_children(self):
+        parent = self.construct_category(name="Makers")
+        child = self.construct_category(name="Woodworkers", parent=parent)
+        self.construct_resource(categories=[parent])
+        event = self.construct_event()
+        db.session.add(ResourceCategory(resource=event, category=parent, type='event'))
+        db.session.add(ResourceCategory(resource=event, category=child, type='event'))
+        self.construct_study(categories=[child])
+        db.session.commit()
+
+        rv = self.app.get('/api/category/%i' % parent.id, content_type="application/json")
+        self.assert_success(rv)
+        response = json.loads(rv.get_data(as_text=True))
+        self.assertEqual(1, response["resource_count"])
+        self.assertEqual(1, response["event_count"])
+        self.assertEqual(0, response["location_count"])
+        self.assertEqual(2, response["all_resource_count"])
+        self.assertEqual(0, response["study_count"])
+        self.assertEqual(1, response["children"][0]["event_count"])
+        self.assertEqual(1, response["children"][0]["study_count"])
+
+        location = self.construct_location()
+        db.session.add(ResourceCategory(resource=location, category=child, type='location'))
+        db.session.commit()
+        rv = self.app.get('/api/category/%i' % child.id, content_type="application/json")
+        response = json.loads(rv.get_data(as_text=True))
+        self.assertEqual(1, response["location_count"])
+        self.assertEqual(2, response["all_resource_count"])
+
     def test_category_has_parents_and_that_parent_has_no_children(self):
         c1 = self.construct_category()
         c2 = self.construct_category(name="I'm the kid", parent=c1)
@@ -162,6 +194,99 @@ class TestCategory(BaseTest, unittest.TestCase):
         self.assertIn(c1_path, c2.all_search_paths())
         self.assertIn(c1_path, c1.all_search_paths())
 
+    def test_category_search_paths_by_id_match_search_paths(self):
+        c1 = self.construct_category()
+        c2 = self.construct_category(name="I'm the kid", parent=c1)
+        c3 = self.construct_category(name="I'm the grand kid", parent=c2)
+        c4 = self.construct_category(name="I'm unrelated")
+
+        paths = Category.all_search_paths_by_id(db.session.query(Category).all())
+
+        self.assertEqual(4, len(paths))
+        for c in [c1, c2, c3, c4]:
+            self.assertEqual(c.all_search_paths(), paths[c.id])
+
+    def test_moving_a_category_updates_paths_beneath_it(self):
+        c1 = self.construct_category()
+        c2 = self.construct_category(name="I'm the kid", parent=c1)
+        c3 = self.construct_category(name="I'm the grand kid", parent=c2)
+        c4 = self.construct_category(name="I'm the new parent")
+        db.session.commit()
+        self.assertEqual("%i,%i,%i" % (c1.id, c2.id, c3.id), c3.search_path())
+        self.assertEqual(2, c3.calculate_level())
+
+        c2.parent = c4
+        db.session.commit()
+
+        c3 = db.session.query(Category).filter_by(id=c3.id).first()
+        self.assertEqual("%i,%i,%i" % (c4.id, c2.id, c3.id), c3.search_path())
+        self.assertEqual(2, c3.calculate_level())
+        c2.parent = None
+        db.session.commit()
+        c3 = db.session.query(Category).filter_by(id=c3.id).first()
+        self.assertEqual("%i,%i" % (c2.id, c3.id), c3.search_path())
+        self.assertEqual(1, c3.calculate_level())
+
+    def test_loaded_categories_beneath_a_moved_category_are_kept_up_to_date(self):
+        c1 = self.construct_category()
+        c2 = self.construct_category(name="I'm the kid", parent=c1)
+        c3 = self.construct_category(name="I'm the grand kid", parent=c2)
+        c4 = self.construct_category(name="I'm the new parent")
+        db.session.commit()
+        self.assertEqual("%i,%i,%i" % (c1.id, c2.id, c3.id), c3.path)
+
+        c2.parent = c4
+        db.session.flush()
+        self.assertEqual("%i,%i,%i" % (c4.id, c2.id, c3.id), c3.path)
+        self.assertEqual(2, c3.level)
+
+        db.session.delete(c4)
+        db.session.flush()
+        self.assertEqual("%i,%i" % (c2.id, c3.id), c3.path)
+        self.assertEqual(1, c3.level)
+        db.session.commit()
+
+    def test_deleting_a_category_moves_the_categories_beneath_it_up(self):
+        c1 = self.construct_category()
+        c2 = self.construct_category(name="I'm the kid", parent=c1)
+        c3 = self.construct_category(name="I'm the grand kid", parent=c2)
+        db.session.commit()
+        c2_id, c3_id = c2.id, c3.id
+
+        db.session.delete(db.session.query(Category).filter_by(id=c1.id).first())
+        db.session.commit()
+        c2 = db.session.query(Category).filter_by(id=c2_id).first()
+        c3 = db.session.query(Category).filter_by(id=c3_id).first()
+        self.assertIsNone(c2.parent_id)
+        self.assertEqual(str(c2.id), c2.search_path())
+        self.assertEqual(0, c2.calculate_level())
+        self.assertEqual("%i,%i" % (c2.id, c3.id), c3.search_path())
+        self.assertEqual(1, c3.calculate_level())
+
+    def test_search_levels_count_from_the_topics_root(self):
+        c1 = self.construct_category()
+        c2 = self.construct_category(name="I'm the kid", parent=c1)
+        db.session.commit()
+        self.assertEqual(1, c2.calculate_level())
+        # As a search does, put an unsaved "Topics" category above the top of the taxonomy.
+        with db.session.no_autoflush:
+            c1.parent = Category(name="Topics")
+            response = CategoryInSearchSchema().dump(c2)
+        db.session.rollback()
+        self.assertEqual(2, response['level'])
+        self.assertEqual(1, response['parent']['level'])
+        self.assertEqual(0, response['parent']['parent']['level'])
+
+    def test_category_subtree_filter(self):
+        c1 = self.construct_category()
+        c2 = self.construct_category(name="I'm the kid", parent=c1)
+        self.construct_category(name="I'm the grand kid", parent=c2)
+        self.construct_category(name="I'm unrelated")
+        db.session.commit()
+
+        self.assertEqual(3, db.session.query(Category).filter(c1.subtree_filter()).count())
+        self.assertEqual(2, db.session.query(Category).filter(c2.subtree_filter()).count())
+
     # def test_category_depth_is_limited(self):
     #     c1 = self.construct_category()
     #     c2 = self.construct_category(
@@ -185,3 +310,17 @@ class TestCategory(BaseTest, unittest.TestCase):
     #     self.assertEqual(1, len(response[0]["children"]))
 
 
+
+    def test_category_tree_changes_once_committed(self):
+        version = category_tree.version
+        db.session.add(Category(name="Unicorns"))
+        db.session.flush()
+        self.assertEqual(version, category_tree.version)
+        db.session.rollback()
+        self.assertEqual(version, category_tree.version)
+
+        category = self.construct_category(name="Unicorns")
+        self.assertEqual(version, category_tree.version)
+        db.session.commit()
+        self.assertEqual(version + 1, category_tree.version)
+        self.assertEqual("Unicorns", category_tree.get(category.id).name)
@@ -124,3 +124,47 @@ class TestDataLoader(BaseTest, unittest.TestCase):
         # Assure there are not age related categories.
         self.assertEqual(0, db.session.query(Category).filter(Category.name == 'Age Range').count())
         self.assertEqual(0, db.session.query(Category).filter(Category.name == 'Pre-K (0 - 5 years)').count())
+
+    def test_build_index_in_small_chunks(self):
+        self._load_and_assert_success(Category, 'load_categories')
+        self._load_and_assert_success(Resource, 'load_resources', ResourceCategory, 'resource')
+        self._load_and_assert_success(Study, 'load_studies', StudyCategory)
+
+        resources = db.session.query(Resource).filter(Resource.type == 'resource').all()
+        studies = db.session.query(Study).all()
+        indexed, errors = elastic_index.load_documents(resources=resources, events=[], locations=[], studies=studies,
+                                                       chunk_size=3, thread_count=2)
+
+        self.assertEqual(len(resources) + len(studies), indexed)
+        self.assertEqual([], errors)
+        es_resources = elastic_index.search(Search(types=[Resource.__tablename__]))
+        self.assertEqual(len(resources), es_resources.hits.total)
+
+    def test_rebuild_index_swaps_alias(self):
+        self._load_and_assert_success(Category, 'load_categories')
+        self._load_and_assert_success(Resource, 'load_resources', ResourceCategory, 'resource')
+        old_indices = set(elastic_index.connection.indices.get_alias(name=elastic_index.index_name).keys())
+
+        self.assertTrue(data_loader.DataLoader().rebuild_index())
+
+        new_indices = set(elastic_index.connection.indices.get_alias(name=elastic_index.index_name).keys())
+        self.assertEqual(1, len(new_indices))
+        self.assertTrue(new_indices.isdisjoint(old_indices))
+        for name in old_indices:
+            self.assertFalse(elastic_index.connection.indices.exists(index=name))
+
+        num_db_resources = db.session.query(Resource).filter(Resource.type == 'resource').count()
+        es_resources = elastic_index.search(Search(types=[Resource.__tablename__]))
+        self.assertEqual(num_db_resources, es_resources.hits.total)
+
+    def test_rebuild_index_keeps_current_index_when_incomplete(self):
+        self._load_and_assert_success(Category, 'load_categories')
+        self._load_and_assert_success(Resource, 'load_resources', ResourceCategory, 'resource')
+        old_indices = set(elastic_index.connection.indices.get_alias(name=elastic_index.index_name).keys())
+
+        resources = db.session.query(Resource).filter(Resource.type == 'resource').all()
+        self.assertFalse(elastic_index.reindex(resources=resources, events=[], locations=[], studies=[],
+                                               expected_count=len(resources) + 1))
+
+        new_indices = set(elastic_index.connection.indices.get_alias(name=elastic_index.index_name).keys())
+        self.assertEqual(old_indices, new_indices)
@@ -1,4 +1,5 @@
 import datetime
+import gzip
 import unittest
 import os
 
@@ -176,6 +177,54 @@ class TestExportCase(BaseTestQuestionnaire, unittest.TestCase):
         db_user = db.session.query(User).filter_by(id=id).first()
         self.assertTrue(db_user.email_verified, msg="Email should now be verified.")
 
+    def test_tables_can_be_transferred_as_compressed_ndjson(self):
+        self.construct_user(email="one@sartography.com")
+        self.construct_user(email="two@sartography.com")
+        headers = self.logged_in_headers()
+        rv = self.app.get('/api/export/user', headers=headers)
+        expected = json.loads(rv.get_data(as_text=True))
+
+        headers.update({'Accept': 'application/x-ndjson', 'Accept-Encoding': 'gzip'})
+        rv = self.app.get('/api/export/user', headers=headers)
+        self.assert_success(rv)
+        self.assertEqual('application/x-ndjson', rv.headers['Content-Type'])
+        self.assertEqual('gzip', rv.headers['Content-Encoding'])
+        lines = gzip.decompress(rv.get_data()).decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual(len(expected), len(records))
+        for record, expected_record in zip(records, expected):
+            self.assertNotIn('_links', record)
+            expected_record.pop('_links', None)
+            self.assertEqual(expected_record, record)
+
+    def test_import_saves_good_records_in_chunks_and_logs_bad_ones(self):
+        for i in range(5):
+            self.construct_user(email="user%i@sartography.com" % i)
+        db.session.commit()
+        data = self.get_export()
+        bad_id = data['User'][2]['id']
+        data['User'][2]['last_updated'] = "not a date"
+        clean_db(db)
+        db.session.commit()
+
+        importer = ImportService(app, db)
+        importer.import_chunk_size = 2
+        rv = self.app.get('/api/export', headers=self.logged_in_headers())
+        exports = ExportInfoSchema(many=True).load(json.loads(rv.get_data(as_text=True)))
+        export = next(e for e in exports if e.class_name == 'User')
+        export.json_data = data['User']
+        log = importer.log_for_export(exports, datetime.datetime.utcnow())
+        with self.assertRaises(Exception):
+            importer.load_data(export, log)
+
+        detail = log.details[0]
+        self.assertEqual(len(data['User']) - 1, detail.success_count)
+        self.assertEqual(1, detail.failure_count)
+        self.assertFalse(detail.successful)
+        self.assertIsNone(db.session.query(User).filter_by(id=bad_id).first())
+        self.assertEqual(len(data['User']) - 1, db.session.query(User).filter(User.id != bad_id)
+                         .filter(User.id.in_([u['id'] for u in data['User']])).count())
+
     def test_identifying_questionnaire_does_not_export(self):
 
         # Construct the base user.
@@ -224,6 +273,24 @@ class TestExportCase(BaseTestQuestionnaire, unittest.TestCase):
                     del_rv = self.app.delete(d['_links']['self'], headers=self.logged_in_headers())
                     self.assert_success(del_rv)
 
+    def test_sensitive_records_can_be_deleted_in_bulk(self):
+        self.construct_all_questionnaires()
+        exports = ExportService.get_table_info()
+        for export in exports:
+            rv = self.app.get(export.url, headers=self.logged_in_headers())
+            data = json.loads(rv.get_data(as_text=True))
+            if not data:
+                continue
+            ids = [d['id'] for d in data]
+            del_rv = self.app.delete(export.url, data=self.jsonify({'ids': ids}), content_type="application/json",
+                                     headers=self.logged_in_headers())
+            if export.question_type == ExportService.TYPE_SENSITIVE:
+                self.assert_success(del_rv)
+                model = ExportService.get_class(export.class_name)
+                self.assertEqual(0, db.session.query(model).filter(model.id.in_(ids)).count())
+            else:
+                self.assertEqual(403, del_rv.status_code)
+
     def test_retrieve_records_later_than(self):
         self.construct_everything()
         date = datetime.datetime.utcnow() + datetime.timedelta(seconds=1)  # One second in the future
@@ -235,6 +302,36 @@ class TestExportCase(BaseTestQuestionnaire, unittest.TestCase):
             data = json.loads(rv.get_data(as_text=True))
             self.assertEqual(0, len(data), msg=export.url + " does not respect 'after' param in get request.")
 
+    def test_large_tables_are_exported_in_pages(self):
+        self.construct_user(email="one@sartography.com")
+        self.construct_user(email="two@sartography.com")
+        self.construct_user(email="three@sartography.com")
+        headers = self.logged_in_headers()
+        all_ids = sorted(u.id for u in db.session.query(User).all())
+
+        ids = []
+        url = '/api/export/user?limit=2'
+        while url:
+            rv = self.app.get(url, headers=headers)
+            self.assert_success(rv)
+            page = json.loads(rv.get_data(as_text=True))
+            self.assertLessEqual(len(page), 2)
+            ids.extend(u['id'] for u in page)
+            link = rv.headers.get('Link')
+            url = link[1:link.index('>')] if link else None
+        self.assertEqual(all_ids, ids)
+
+        # Clients that don't ask for pages get the whole table.
+        page_size = app.config['EXPORT_PAGE_SIZE']
+        app.config['EXPORT_PAGE_SIZE'] = 2
+        try:
+            rv = self.app.get('/api/export/user', headers=headers)
+        finally:
+            app.config['EXPORT_PAGE_SIZE'] = page_size
+        self.assert_success(rv)
+        self.assertIsNone(rv.headers.get('Link'))
+        self.assertEqual(all_ids, [u['id'] for u in json.loads(rv.get_data(as_text=True))])
+
     def test_export_list_count_is_date_based(self):
         self.construct_everything()
         date = datetime.datetime.utcnow() + datetime.timedelta(seconds=1)
@@ -250,6 +347,39 @@ class TestExportCase(BaseTestQuestionnaire, unittest.TestCase):
         for export in response:
             self.assertEqual(export['size'], 0, msg=export['class_name'] + " should have a count of 0")
 
+    def test_table_sizes_match_a_count_of_each_table(self):
+        self.construct_everything()
+        for export in ExportService.get_table_info():
+            model = ExportService.get_class(export.class_name)
+            query = db.session.query(model)
+            if 'polymorphic_identity' in getattr(model, '__mapper_args__', {}):
+                query = query.filter(model.type == model.__mapper_args__['polymorphic_identity'])
+            self.assertEqual(query.count(), export.size, msg=export.class_name + " has the wrong size")
+            for sub_table in export.sub_tables:
+                sub_model = ExportService.get_class(sub_table.class_name)
+                self.assertEqual(db.session.query(sub_model).count(), sub_table.size)
+
+    def test_classes_and_schemas_are_found_by_class_or_table_name(self):
+        cls = ExportService.get_class('IdentificationQuestionnaire')
+        self.assertEqual(IdentificationQuestionnaire, cls)
+        self.assertEqual(cls, ExportService.get_class('identification_questionnaire'))
+        self.assertEqual(cls, ExportService.get_class_for_table(cls.__table__))
+        self.assertIsNone(ExportService.get_class('NoSuchQuestionnaire'))
+        self.assertIsNone(ExportService.get_schema('NoSuchQuestionnaire'))
+
+        # Schemas for loading data are new each time, schemas for dumping it can be shared.
+        self.assertIsNot(ExportService.get_schema('User'), ExportService.get_schema('User'))
+        self.assertIs(ExportService.get_dump_schema('User', many=True), ExportService.get_dump_schema('User', many=True))
+        self.assertIsNot(ExportService.get_dump_schema('User'), ExportService.get_dump_schema('User', many=True))
+
+    def test_only_columns_are_limited_when_reading_exports(self):
+        columns = ExportService.get_columns(User, ['email', '_links'])
+        self.assertIn('email', columns)
+        self.assertIn('id', columns)
+        self.assertNotIn('last_login', columns)
+        # Reading a relationship as well would load it for each record in turn, so every column is read.
+        self.assertIsNone(ExportService.get_columns(User, ['email', 'participants']))
+
     def test_it_all_crazy_madness_wohoo(self):
         # Sanity check, can we load everything, export it, delete, and reload it all without error.
         self.construct_everything()
@@ -2,6 +2,7 @@ import datetime
 import unittest
 
 import httpretty
+import jwt
 import requests
 from flask import json
 
@@ -27,6 +28,14 @@ class TestImportCase(BaseTestQuestionnaire, unittest.TestCase):
         app.config["MASTER_EMAIL"] = "dan@test.com"
         app.config["MASTER_PASS"] = "12345"
 
+    @staticmethod
+    def load_pages(data_importer, export_list, log):
+        # Loads each page of each export as it arrives, as run_backup does.
+        for export in export_list:
+            for page in data_importer.request_pages(export):
+                export.json_data = page
+                data_importer.load_data(export, log)
+
     @httpretty.activate
     def test_httppretty(self):
         # Just wanted a simple exmple to show how to use HTTP Pretty
@@ -81,6 +90,26 @@ class TestImportCase(BaseTestQuestionnaire, unittest.TestCase):
         self.assertEqual("Bearer my_token", headers['Authorization'])
         self.assertEqual(3, len(httpretty.httpretty.latest_requests))
 
+    @httpretty.activate
+    def test_headers_reuse_token_until_it_is_about_to_expire(self):
+        httpretty.register_uri(
+            httpretty.POST,
+            "http://na.edu/api/login_password",
+            body='{"token": "my_token"}',
+        )
+        data_importer = ImportService(app, db)
+        expires = datetime.datetime.utcnow() + datetime.timedelta(hours=2)
+        data_importer.token = jwt.encode({'exp': expires}, 'not our secret', algorithm='HS256')
+        headers = data_importer.get_headers()
+        self.assertEqual(0, len(httpretty.httpretty.latest_requests))
+        self.assertEqual("Bearer " + data_importer.token, headers['Authorization'])
+
+        expires = datetime.datetime.utcnow() + datetime.timedelta(seconds=30)
+        data_importer.token = jwt.encode({'exp': expires}, 'not our secret', algorithm='HS256')
+        headers = data_importer.get_headers()
+        self.assertEqual("/api/login_password", httpretty.last_request().path)
+        self.assertEqual("Bearer my_token", headers['Authorization'])
+
     def get_data_importer_setup_auth(self):
         httpretty.register_uri(
             httpretty.GET,
@@ -118,7 +147,7 @@ class TestImportCase(BaseTestQuestionnaire, unittest.TestCase):
             status=200
         )
         export_list = data_importer.get_export_list()
-        data_importer.request_data(export_list)
+        self.assertEqual([], list(data_importer.request_pages(export_list[0])))
         self.assertEqual(2, len(httpretty.httpretty.latest_requests))  # Assumes one request for auth check.
         self.assertEqual("/api/export", httpretty.last_request().path)
 
@@ -155,9 +184,30 @@ class TestImportCase(BaseTestQuestionnaire, unittest.TestCase):
         data_importer = self.get_data_importer_setup_auth()
         self.request_user_setup()
         export_list = data_importer.get_export_list()
-        data_importer.request_data(export_list)
+        pages = list(data_importer.request_pages(export_list[0]))
+        self.assertEqual([[4]], [[u['id'] for u in page] for page in pages])
         self.assertEqual("/api/export/user", httpretty.last_request().path)
 
+    @httpretty.activate
+    def test_request_follows_links_to_each_page(self):
+        data_importer = self.get_data_importer_setup_auth()
+        self.request_user_setup()
+        second_user = User(id=5, last_updated=datetime.datetime.now(), email="dan2@test.com",
+                           role=Role.user, email_verified=True)
+        httpretty.register_uri(
+            httpretty.GET,
+            "http://na.edu/api/export/user",
+            responses=[
+                httpretty.Response(body=self.jsonify(UserExportSchema(many=True).dump([User(id=4)])),
+                                   adding_headers={'Link': '</api/export/user?after_id=4>; rel="next"'}),
+                httpretty.Response(body=self.jsonify(UserExportSchema(many=True).dump([second_user]))),
+            ]
+        )
+        export_list = data_importer.get_export_list()
+        pages = list(data_importer.request_pages(export_list[0]))
+        self.assertEqual([[4], [5]], [[u['id'] for u in page] for page in pages])
+        self.assertEqual(['4'], httpretty.last_request().querystring['after_id'])
+
     @httpretty.activate
     def test_import_logs_success(self):
         data_importer = self.get_data_importer_setup_auth()
@@ -199,9 +249,8 @@ class TestImportCase(BaseTestQuestionnaire, unittest.TestCase):
         date = datetime.datetime.now()
         export_list = data_importer.get_export_list()
         log = data_importer.log_for_export(export_list, date)
-        data = data_importer.request_data(export_list)
         try:
-            data_importer.load_all_data(data, log)
+            self.load_pages(data_importer, export_list, log)
         except:
             pass  # Totally should happen.
         self.assertEqual("/api/export/user", httpretty.last_request().path)
@@ -270,21 +319,20 @@ class TestImportCase(BaseTestQuestionnaire, unittest.TestCase):
             body=json_q,
             status=200
         )
-        expected_delete_url = "http://na.edu/api/q/clinical_diagnoses_questionnaire/" + str(id)
+        expected_delete_url = "http://na.edu/api/export/clinical_diagnoses_questionnaire"
         httpretty.register_uri(
             httpretty.DELETE,
             expected_delete_url,
-            body=json_q,
             status=200
         )
         app.config['DELETE_RECORDS'] = True
         data_importer = self.get_data_importer_setup_auth()
         date = datetime.datetime.now()
-        data = data_importer.request_data(export_list)
-        log = data_importer.log_for_export(data, date)
-        data_importer.load_all_data(data, log)
-        self.assertEqual("/api/q/clinical_diagnoses_questionnaire/" + str(id), httpretty.last_request().path)
+        log = data_importer.log_for_export(export_list, date)
+        self.load_pages(data_importer, export_list, log)
+        self.assertEqual("/api/export/clinical_diagnoses_questionnaire", httpretty.last_request().path)
         self.assertEqual("DELETE", httpretty.last_request().method)
+        self.assertEqual({'ids': [id]}, json.loads(httpretty.last_request().body))
 
     @httpretty.activate
     def test_import_does_not_call_delete_on_non_sensitive_data(self):
@@ -304,7 +352,6 @@ class TestImportCase(BaseTestQuestionnaire, unittest.TestCase):
         )
         data_importer = self.get_data_importer_setup_auth()
         date = datetime.datetime.now()
-        data = data_importer.request_data(export_list)
-        log = data_importer.log_for_export(data, date)
-        data_importer.load_all_data(data, log)
+        log = data_importer.log_for_export(export_list, date)
+        self.load_pages(data_importer, export_list, log)
         self.assertEqual("GET", httpretty.last_request().method)  # Last call should not be a delete call.
@@ -8,6 +8,8 @@ from tests.base_test_questionnaire import BaseTestQuestionnaire
 from app.model.participant import Relationship, Participant
 from app.model.user_meta import UserMeta
 from app import db
+from app.model.step_log import StepLog
+from app.participant_progress import participant_progress
 
 
 class TestParticipant(BaseTestQuestionnaire, unittest.TestCase):
@@ -231,6 +233,29 @@ class TestParticipant(BaseTestQuestionnaire, unittest.TestCase):
         response = json.loads(rv.get_data(as_text=True))
         self.assertGreater(response[0]['percent_complete'], 0)
 
+    def test_percent_complete_for_many_participants(self):
+        u = self.construct_user()
+        guardian = self.construct_participant(user=u, relationship=Relationship.self_guardian)
+        dependent = self.construct_participant(user=u, relationship=Relationship.dependent)
+        db.session.add_all([
+            StepLog(participant_id=guardian.id, flow='guardian_intake', questionnaire_name='identification_questionnaire'),
+            StepLog(participant_id=guardian.id, flow='guardian_intake', questionnaire_name='identification_questionnaire'),
+            StepLog(participant_id=guardian.id, flow='guardian_intake', questionnaire_name='contact_questionnaire'),
+            # Steps logged against another flow don't count.
+            StepLog(participant_id=dependent.id, flow='guardian_intake', questionnaire_name='identification_questionnaire'),
+        ])
+        db.session.commit()
+
+        progress = participant_progress.percent_complete_for([guardian, dependent])
+        self.assertEqual(2 / 3, progress[guardian.id])
+        self.assertEqual(0, progress[dependent.id])
+
+        db.session.add(StepLog(participant_id=guardian.id, flow='guardian_intake',
+                               questionnaire_name='demographics_questionnaire'))
+        db.session.commit()
+        self.assertEqual(1, guardian.get_percent_complete())
+        self.assertEqual(0, dependent.get_percent_complete())
+
     def test_participant_name(self):
         p = self.construct_participant(user=self.construct_user(), relationship=Relationship.self_participant)
         rv = self.app.get(
@@ -3,14 +3,18 @@ import unittest
 import openpyxl
 import io
 import datetime
+import os
 
 from dateutil import parser
 
 from tests.base_test_questionnaire import BaseTestQuestionnaire
-from app import db, elastic_index
+from app import app, db, elastic_index
+from app.export_job_service import export_jobs
 from app.export_service import ExportService
 from app.model.chain_step import ChainStep
+from app.model.export_job import ExportJob
 from app.model.flow import Step
+from app.model.flows import Flows
 from app.model.participant import Relationship
 from app.model.questionnaires.chain_questionnaire import ChainQuestionnaire
 from app.model.questionnaires.challenging_behavior import ChallengingBehavior
@@ -1486,6 +1490,44 @@ class TestQuestionnaire(BaseTestQuestionnaire, unittest.TestCase):
         self.assertEqual(Step.STATUS_COMPLETE, response['steps'][0]['status'])
         self.assertIsNotNone(response['steps'][0]['date_completed'])
 
+    def test_flow_progress_is_kept_apart_for_each_participant(self):
+        u = self.construct_user()
+        p1 = self.construct_participant(user=u, relationship=Relationship.self_participant)
+        p2 = self.construct_participant(user=u, relationship=Relationship.self_participant)
+        headers = self.logged_in_headers(u)
+        self.app.post('api/flow/self_intake/identification_questionnaire',
+                      data=self.jsonify(self.get_identification_questionnaire(p1.id)),
+                      content_type="application/json", follow_redirects=True, headers=headers)
+
+        rv = self.app.get('api/flow/self_intake/%i' % p1.id, content_type="application/json", headers=headers)
+        self.assertEqual(Step.STATUS_COMPLETE, json.loads(rv.get_data(as_text=True))['steps'][0]['status'])
+        rv = self.app.get('api/flow/self_intake/%i' % p2.id, content_type="application/json", headers=headers)
+        self.assertEqual(Step.STATUS_INCOMPLETE, json.loads(rv.get_data(as_text=True))['steps'][0]['status'])
+        self.assertEqual(Step.STATUS_INCOMPLETE, Flows.get_self_intake_flow().steps[0].status)
+        self.assertIs(Flows.get_self_intake_flow(), Flows.get_flow_by_relationship(Relationship.self_participant))
+
+    def test_questionnaire_meta_can_be_revalidated_with_an_etag(self):
+        for url in ['/api/flow/self_intake/identification_questionnaire/meta',
+                    '/api/q/identification_questionnaire/meta']:
+            rv = self.app.get(url, content_type="application/json")
+            self.assert_success(rv)
+            etag = rv.headers['ETag']
+            self.assertIn('max-age', rv.headers['Cache-Control'])
+            rv = self.app.get(url, content_type="application/json", headers={'If-None-Match': etag})
+            self.assertEqual(304, rv.status_code)
+
+        # Each relationship has its own meta.
+        rv = self.app.get('/api/flow/dependent_intake/identification_questionnaire/meta',
+                          content_type="application/json", headers={'If-None-Match': etag})
+        self.assertEqual(200, rv.status_code)
+
+    def test_cached_questionnaire_meta_is_a_copy(self):
+        meta, etag = ExportService.get_cached_meta(EmploymentQuestionnaire)
+        column_info = [id(c.info) for c in EmploymentQuestionnaire.__table__.columns]
+        for field in meta['fields']:
+            self.assertNotIn(id(field), column_info)
+        self.assertEqual((meta, etag), ExportService.get_cached_meta(EmploymentQuestionnaire))
+
     def test_questionnaire_meta_is_relation_specific(self):
         rv = self.app.get('/api/flow/self_intake/identification_questionnaire/meta',
                           follow_redirects=True,
@@ -1677,6 +1719,61 @@ class TestQuestionnaire(BaseTestQuestionnaire, unittest.TestCase):
         self.assertEqual(11, ws.max_column)
         self.assertEqual(2, ws.max_row)
 
+    def test_export_questionnaire_larger_than_a_batch(self):
+        for i in range(3):
+            user = self.construct_user(email='%i@sartography.com' % i)
+            self.construct_contact_questionnaire(phone='555-555-000%i' % i, user=user)
+        batch_size = app.config['EXPORT_BATCH_SIZE']
+        app.config['EXPORT_BATCH_SIZE'] = 2
+        try:
+            rv = self.app.get('/api/q/contact_questionnaire/export', follow_redirects=True,
+                              content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                              headers=self.logged_in_headers())
+        finally:
+            app.config['EXPORT_BATCH_SIZE'] = batch_size
+        self.assert_success(rv)
+        self.assertEqual(int(rv.headers['Content-Length']), len(rv.data))
+        ws = openpyxl.load_workbook(io.BytesIO(rv.data)).active
+        self.assertEqual(4, ws.max_row)
+        phones = [ws.cell(row=r, column=c).value for r in range(2, 5) for c in range(1, ws.max_column + 1)]
+        for i in range(3):
+            self.assertIn('555-555-000%i' % i, phones)
+
+    def test_export_questionnaire_in_the_background(self):
+        self.construct_contact_questionnaire()
+        headers = self.logged_in_headers()
+        rv = self.app.post('/api/q/contact_questionnaire/export_job', headers=headers)
+        self.assertEqual(202, rv.status_code)
+        job = json.loads(rv.get_data(as_text=True))
+        export_jobs.wait(job['id'], timeout=60)
+
+        rv = self.app.get(job['_links']['self'], headers=headers)
+        self.assert_success(rv)
+        self.assertEqual('complete', json.loads(rv.get_data(as_text=True))['status'])
+        rv = self.app.get(job['_links']['download'], headers=headers)
+        self.assert_success(rv)
+        ws = openpyxl.load_workbook(io.BytesIO(rv.data)).active
+        self.assertEqual('id', ws['A1'].value)
+        self.assertEqual(2, ws.max_row)
+
+        # The finished spreadsheet is reused until the questionnaires change, and can be found by id from
+        # any process.
+        rv = self.app.post('/api/q/contact_questionnaire/export_job', headers=headers)
+        self.assertEqual(job['id'], json.loads(rv.get_data(as_text=True))['id'])
+        self.assertTrue(os.path.exists(db.session.query(ExportJob).get(job['id']).path))
+        self.construct_contact_questionnaire(user=self.construct_user(email='another@sartography.com'))
+        rv = self.app.post('/api/q/contact_questionnaire/export_job', headers=headers)
+        self.assertNotEqual(job['id'], json.loads(rv.get_data(as_text=True))['id'])
+
+    def test_export_job_requires_permission(self):
+        user = self.construct_user(email='regularUser@user.com')
+        rv = self.app.post('/api/q/contact_questionnaire/export_job', headers=self.logged_in_headers(user=user))
+        self.assertEqual(403, rv.status_code)
+        rv = self.app.post('/api/q/no_such_questionnaire/export_job', headers=self.logged_in_headers())
+        self.assertEqual(404, rv.status_code)
+        rv = self.app.get('/api/export_job/not_a_job', headers=self.logged_in_headers())
+        self.assertEqual(404, rv.status_code)
+
     def test_export_all_questionnaires(self):
         self.construct_all_questionnaires()
         rv = self.app.get('/api/q/all/export', follow_redirects=True,
@@ -1742,5 +1839,23 @@ class TestQuestionnaire(BaseTestQuestionnaire, unittest.TestCase):
         self.assertEqual('user_id', wb['Contact']['E1'].value)
         self.assertEqual(u2.id, wb['Contact']['E2'].value)
 
+    def test_export_questionnaires_by_user_as_json(self):
+        u1 = self.construct_user(email='1@sartography.com')
+        u2 = self.construct_user(email='2@sartography.com')
+        self.construct_contact_questionnaire(user=u1)
+        self.construct_contact_questionnaire(user=u2)
+        headers = dict(self.logged_in_headers(), Accept='application/json')
+        rv = self.app.get('/api/q/contact_questionnaire/export/user/%i' % u1.id, headers=headers)
+        self.assert_success(rv)
+        response = json.loads(rv.get_data(as_text=True))
+        self.assertEqual(1, len(response))
+        self.assertEqual(u1.id, response[0]['user_id'])
+        self.assertIn('phone', response[0])
+
+        u3 = self.construct_user(email='3@sartography.com')
+        rv = self.app.get('/api/q/contact_questionnaire/export/user/%i' % u3.id, headers=headers)
+        self.assert_success(rv)
+        self.assertEqual([], json.loads(rv.get_data(as_text=True)))
+
     def _parse_date(self, date_str):
         return parser.parse(date_str).replace(tzinfo=None)
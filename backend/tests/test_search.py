@@ -4,8 +4,12 @@ import dateutil.parser
 from datetime import datetime, timedelta
 
 from tests.base_test import BaseTest
-from app import elastic_index, db
+from app import elastic_index, index_sync, db
 from app.model.category import Category
+from app.model.index_outbox import IndexOutbox
+from app.model.location import Location
+from app.model.resource import Resource
+from app.model.resource_category import ResourceCategory
 from app.model.role import Role
 
 
@@ -267,6 +271,93 @@ class TestSearch(BaseTest, unittest.TestCase):
         search_results = self.search(rainbow_query)
         self.assertEqual(0, len(search_results['hits']))
 
+    def test_synchronize_removes_deleted_items(self):
+        rainbow_query = {'words': 'rainbows'}
+        resource = self.construct_resource(title='space unicorn', description="delivering rainbows")
+        study = self.construct_study(title='space unicorn study', description="counting rainbows")
+        search_results = self.search(rainbow_query)
+        self.assertEqual(2, len(search_results['hits']))
+
+        # Bulk deletes aren't seen by the session, so nothing is synchronized until asked.
+        db.session.query(Resource).filter_by(id=resource.id).delete()
+        db.session.commit()
+        search_results = self.search(rainbow_query)
+        self.assertEqual(2, len(search_results['hits']))
+
+        errors = index_sync.synchronize({('resource', resource.id), ('study', study.id)}, refresh=True)
+        self.assertEqual([], errors)
+        search_results = self.search(rainbow_query)
+        self.assertEqual(1, len(search_results['hits']))
+        self.assertEqual('study', search_results['hits'][0]['type'])
+
+    def test_outbox_keeps_changes_until_they_are_synchronized(self):
+        rainbow_query = {'words': 'rainbows'}
+        resource = self.construct_resource(title='space unicorn', description="delivering rainbows")
+        # Synchronized as soon as it was committed, so it has already left the outbox.
+        self.assertEqual(0, db.session.query(IndexOutbox).count())
+        self.assertEqual(1, len(self.search(rainbow_query)['hits']))
+
+        # A document waiting to be retried stays in the outbox until it is due.
+        db.session.query(Resource).filter_by(id=resource.id).delete()
+        db.session.add(IndexOutbox(table_name='resource', document_id=resource.id,
+                                   retry_after=datetime.utcnow() + timedelta(days=1)))
+        db.session.commit()
+        index_sync.process_outbox(refresh=True)
+        self.assertEqual(1, db.session.query(IndexOutbox).count())
+        self.assertEqual(1, len(self.search(rainbow_query)['hits']))
+
+        db.session.query(IndexOutbox).update({'retry_after': None})
+        db.session.commit()
+        self.assertEqual([], index_sync.process_outbox(refresh=True))
+        self.assertEqual(0, db.session.query(IndexOutbox).count())
+        self.assertEqual(0, len(self.search(rainbow_query)['hits']))
+
+    def test_category_change_updates_search_index(self):
+        resource = self.construct_resource(title='space unicorn', description="delivering rainbows")
+        category = self.construct_category(name="Unicorns")
+        db.session.commit()
+        category_query = {'words': '', 'category': {'id': category.id}}
+        self.assertEqual(0, len(self.search(category_query)['hits']))
+
+        rv = self.app.post('/api/resource/%i/category' % resource.id, data=self.jsonify([{'category_id': category.id}]),
+                           content_type="application/json", follow_redirects=True, headers=self.logged_in_headers())
+        self.assert_success(rv)
+        self.assertEqual(1, len(self.search(category_query)['hits']))
+
+        rv = self.app.post('/api/resource/%i/category' % resource.id, data=self.jsonify([]),
+                           content_type="application/json", follow_redirects=True, headers=self.logged_in_headers())
+        self.assert_success(rv)
+        self.assertEqual(0, len(self.search(category_query)['hits']))
+
+    def test_category_without_a_type_is_indexed_with_its_event(self):
+        event = self.construct_event(title='space unicorn meetup')
+        category = self.construct_category(name="Unicorns")
+        db.session.add(ResourceCategory(resource_id=event.id, category_id=category.id))
+        db.session.commit()
+        search_results = self.search({'words': '', 'category': {'id': category.id}})
+        self.assertEqual(1, len(search_results['hits']))
+        self.assertEqual('event', search_results['hits'][0]['type'])
+
+        rv = self.app.post('/api/resource/%i/category' % 9999, data=self.jsonify([{'category_id': category.id}]),
+                           content_type="application/json", follow_redirects=True, headers=self.logged_in_headers())
+        self.assertEqual(404, rv.status_code)
+
+    def test_equivalent_searches_share_cached_results(self):
+        self.construct_resource(title='space unicorn', description="delivering rainbows",
+                                ages=['young folks', 'old folks'])
+        self.assertEqual(0, len(elastic_index.search_cache))
+
+        self.search({'words': 'rainbows', 'ages': ['young folks', 'old folks']})
+        self.assertEqual(1, len(elastic_index.search_cache))
+        self.search({'words': 'rainbows', 'ages': ['old folks', 'young folks']})
+        self.assertEqual(1, len(elastic_index.search_cache))
+        self.search_anonymous({'words': 'rainbows', 'ages': ['old folks', 'young folks']})
+        self.assertEqual(2, len(elastic_index.search_cache), "Anonymous users can't see drafts, so are cached apart")
+
+        self.construct_resource(title='space unicorn 2', description="more rainbows")
+        self.assertEqual(0, len(elastic_index.search_cache), "Changing the index clears the cache")
+        self.assertEqual(2, len(self.search({'words': 'rainbows'})['hits']))
+
     def test_filter_resources_returns_resources_and_past_events(self):
         rainbow_query = {'types': ['resource']}
 
@@ -417,6 +508,18 @@ class TestSearch(BaseTest, unittest.TestCase):
         cabinet_maker = search_results['category']['children'][0]
         self.assertEqual(1, cabinet_maker['hit_count'], "There is one cabinet maker.")
 
+    def test_top_level_categories_reflect_taxonomy_changes(self):
+        self.setup_category_aggregations()
+        search_results = self.search({'words': ''})
+        self.assertEqual(2, len(search_results['category']['children']))
+
+        self.construct_category(name="Dreamers")
+        db.session.commit()
+        search_results = self.search({'words': ''})
+        self.assertEqual(3, len(search_results['category']['children']))
+        dreamers = next(x for x in search_results['category']['children'] if x['name'] == "Dreamers")
+        self.assertEqual(0, dreamers['hit_count'])
+
     def test_that_top_level_category_is_always_present(self):
         self.setup_category_aggregations()
         maker_wood_cat = db.session.query(Category).filter(Category.name == 'Woodworkers').first()
@@ -538,6 +641,15 @@ class TestSearch(BaseTest, unittest.TestCase):
         ])
         self.assertIn(study.title, list(map(lambda s: s['title'], response['studies'])))
 
+    def test_related_results_are_cached_until_the_item_changes(self):
+        resource = self.construct_resource(title="The Breakfast Club")
+        uid = elastic_index._get_id(resource)
+        elastic_index.more_like_this(resource)
+        self.assertIsNotNone(elastic_index.related_cache.get(uid))
+
+        elastic_index.update_document(resource)
+        self.assertIsNone(elastic_index.related_cache.get(uid))
+
     def test_search_paginates(self):
         self.construct_location(title="one")
         self.construct_location(title="two")
@@ -654,12 +766,35 @@ class TestSearch(BaseTest, unittest.TestCase):
         query = {'words': 'rainbows', 'map_data_only': True}
         search_results = self.search(query)
         self.assertEqual(3, len(search_results['hits']))
+        # The total still counts every match, as it does for a full search.
+        self.assertEqual(6, search_results['total'])
         self.assertTrue('latitude' in search_results['hits'][0])
         self.assertTrue('longitude' in search_results['hits'][0])
         self.assertFalse('content' in search_results['hits'][0])
         self.assertFalse('description' in search_results['hits'][0])
         self.assertFalse('highlights' in search_results['hits'][0])
 
+    def test_search_for_map_clusters(self):
+        self.construct_location(title='local unicorn', description="delivering rainbows near Staunton",
+                                latitude=38.149595, longitude=-79.072557)
+        self.construct_location(title='neighboring unicorn', description="delivering rainbows next door",
+                                latitude=38.149600, longitude=-79.072560)
+        self.construct_location(title='distant unicorn', description="delivering rainbows to the far side",
+                                latitude=-38.149595, longitude=100.927443)
+        self.construct_resource(title="A rainbow with no place to be.")
+
+        query = {'words': 'rainbows', 'map_data_only': True, 'zoom': 4}
+        search_results = self.search(query)
+        self.assertEqual(4, search_results['total'])
+        self.assertEqual(0, len(search_results['hits']))
+        self.assertEqual(2, len(search_results['clusters']))
+        clusters = sorted(search_results['clusters'], key=lambda c: c['count'])
+        self.assertEqual(1, clusters[0]['count'])
+        self.assertEqual('distant unicorn', db.session.query(Location).get(clusters[0]['hit']['id']).title)
+        self.assertEqual(2, clusters[1]['count'])
+        self.assertIsNone(clusters[1]['hit'])
+        self.assertAlmostEqual(38.1496, clusters[1]['latitude'], places=3)
+
     def test_study_search_record_updates(self):
         umbrella_query = {'words': 'umbrellas'}
 
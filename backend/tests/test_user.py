@@ -88,6 +88,46 @@ class TestUser(BaseTest, unittest.TestCase):
         self.assertEqual(response['email'], 'tara@spiders.org')
         self.assertIsNotNone(response['id'])
 
+    def test_permissions_follow_role_changes_for_the_same_token(self):
+        user = self.construct_user(email='changing@sartography.com', role=Role.user)
+        headers = self.logged_in_headers(user=user)
+        rv = self.app.get('/api/q/contact_questionnaire', headers=headers)
+        self.assertEqual(403, rv.status_code)
+
+        user = db.session.query(User).filter_by(id=user.id).first()
+        user.role = Role.admin
+        db.session.add(user)
+        db.session.commit()
+        rv = self.app.get('/api/q/contact_questionnaire', headers=headers)
+        self.assert_success(rv)
+        rv = self.app.get('/api/session', headers=headers)
+        self.assertEqual(user.id, json.loads(rv.get_data(as_text=True))['id'])
+
+    def test_search_users_by_page_or_after_a_user(self):
+        for i in range(5):
+            user = self.construct_user(email="searched%i@test.com" % i)
+            self.construct_participant(user, Relationship.self_participant)
+        self.construct_user(email="someone_else@test.com")
+        db.session.commit()
+
+        search = {'filter': 'searched', 'sort': 'email', 'sortOrder': 'asc', 'pageNumber': 1, 'pageSize': 2}
+        rv = self.app.get('/api/user', query_string=search, headers=self.logged_in_headers())
+        self.assert_success(rv)
+        response = json.loads(rv.get_data(as_text=True))
+        self.assertEqual(5, response['total'])
+        self.assertEqual(3, response['pages'])
+        self.assertEqual(['searched2@test.com', 'searched3@test.com'], [u['email'] for u in response['items']])
+        self.assertEqual('self_participant', response['items'][0]['identity'])
+        self.assertEqual(0, response['items'][0]['percent_self_registration_complete'])
+        self.assertEqual(1, response['items'][0]['participant_count'])
+        self.assertNotIn('participants', response['items'][0])
+
+        search['after'] = response['items'][-1]['id']
+        rv = self.app.get('/api/user', query_string=search, headers=self.logged_in_headers())
+        self.assert_success(rv)
+        response = json.loads(rv.get_data(as_text=True))
+        self.assertEqual(['searched4@test.com'], [u['email'] for u in response['items']])
+
     def test_create_user_with_bad_role(self):
         user = {'email': "tara@spiders.org", 'role': 'web_weaver'}
 
@@ -42,9 +42,8 @@ if [ "$ENV" == "staging" ]; then
 eval 'cd ${HOME_DIR}/backend && flask resourcereset'
 fi
 
-# clear and rebuild the index
-eval 'cd ${HOME_DIR}/backend && flask clearindex'
-eval 'cd ${HOME_DIR}/backend && flask initindex'
+# rebuild the index, and swap it in once complete, so search stays available
+eval 'cd ${HOME_DIR}/backend && flask reindex'
 
 # Copy the frontend config file into the proper place.
 declare -a arr=("" ".staging" ".prod")